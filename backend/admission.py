@@ -0,0 +1,179 @@
+"""
+Admission control for scan-heavy endpoints
+
+- SingleFlight: concurrent identical requests (same normalized parameters)
+  share one in-flight computation and all receive its response
+- AdmissionLimiter: at most MAX_CONCURRENT_SCANS computations run per worker
+  process (so N workers admit up to N times as many) and MAX_QUEUED_SCANS wait; beyond that, or after QUEUE_TIMEOUT_SECONDS in the queue,
+  the request is shed with 503 + Retry-After instead of slowing everyone down
+- admission_controlled(): decorator applying both to a sync endpoint
+
+Queued requests hold a threadpool thread while they wait, so running + queued
+should stay below the server's threadpool size (40 by default).
+"""
+
+import functools
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from starlette.requests import Request
+
+from metrics import Counter, Gauge
+
+MAX_CONCURRENT_SCANS = int(os.getenv("RETROFY_MAX_CONCURRENT_SCANS", str(os.cpu_count() or 4)))
+MAX_QUEUED_SCANS = int(os.getenv("RETROFY_MAX_QUEUED_SCANS", "24"))
+QUEUE_TIMEOUT_SECONDS = float(os.getenv("RETROFY_SCAN_QUEUE_TIMEOUT", "10"))
+RETRY_AFTER_SECONDS = 2
+
+# Search matching is case-insensitive for these, so their case doesn't split coalescing keys
+CASE_INSENSITIVE_PARAMS = {"q", "brand", "category", "color", "platform_name"}
+
+SCANS_RUNNING = Gauge("retrofy_admission_running", "Scan-heavy requests currently computing")
+SCAN_QUEUE_DEPTH = Gauge("retrofy_admission_queue_depth", "Scan-heavy requests waiting for a slot")
+SCANS_SHED = Counter("retrofy_admission_shed", "Requests rejected with 503 by admission control", ("route", "reason"))
+REQUESTS_COALESCED = Counter(
+    "retrofy_requests_coalesced", "Requests answered by an identical in-flight computation", ("route",)
+)
+
+
+class Overloaded(Exception):
+    """No computation slot became available; the client should retry later"""
+
+
+class AdmissionLimiter:
+    """Bounded concurrency with a bounded wait queue"""
+
+    def __init__(self, max_concurrent: int = MAX_CONCURRENT_SCANS, max_queued: int = MAX_QUEUED_SCANS,
+                 queue_timeout: float = QUEUE_TIMEOUT_SECONDS):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.running = 0
+        self.waiting = 0
+        self._condition = threading.Condition()
+
+    @contextmanager
+    def slot(self, route: str):
+        with self._condition:
+            if self.running >= self.max_concurrent:
+                if self.waiting >= self.max_queued:
+                    SCANS_SHED.inc(route=route, reason="queue_full")
+                    raise Overloaded()
+                self.waiting += 1
+                SCAN_QUEUE_DEPTH.set(self.waiting)
+                try:
+                    admitted = self._condition.wait_for(
+                        lambda: self.running < self.max_concurrent, timeout=self.queue_timeout
+                    )
+                finally:
+                    self.waiting -= 1
+                    SCAN_QUEUE_DEPTH.set(self.waiting)
+                if not admitted:
+                    SCANS_SHED.inc(route=route, reason="queue_timeout")
+                    raise Overloaded()
+            self.running += 1
+            SCANS_RUNNING.set(self.running)
+        try:
+            yield
+        finally:
+            with self._condition:
+                self.running -= 1
+                SCANS_RUNNING.set(self.running)
+                self._condition.notify()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Run fn once per key among concurrent callers; followers get the leader's result or error"""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """(result, shared): shared is True when another caller's computation was reused"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+            return call.result, False
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+scan_limiter = AdmissionLimiter()
+single_flight = SingleFlight()
+
+
+def _key_value(name: str, value):
+    if isinstance(value, BaseModel):
+        return json.dumps(value.dict(), sort_keys=True)
+    if isinstance(value, str) and name in CASE_INSENSITIVE_PARAMS:
+        return value.lower()
+    return value
+
+
+def overloaded_response() -> JSONResponse:
+    return JSONResponse(
+        status_code=503,
+        content={"error": "Server is busy, retry later"},
+        headers={"Retry-After": str(RETRY_AFTER_SECONDS)}
+    )
+
+
+def admission_controlled(route: str):
+    """
+    Coalesce identical concurrent calls of a sync endpoint and run the leader under
+    scan_limiter. The key is the endpoint's parameters (Request objects excluded);
+    ?profile=true calls are never coalesced.
+    """
+
+    def decorator(endpoint):
+        @functools.wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            def admitted():
+                with scan_limiter.slot(route):
+                    return endpoint(*args, **kwargs)
+
+            try:
+                if kwargs.get("profile"):
+                    return admitted()
+                key = (route,) + tuple(
+                    (name, _key_value(name, value)) for name, value in sorted(kwargs.items())
+                    if not isinstance(value, Request)
+                )
+                response, shared = single_flight.do(key, admitted)
+                if shared:
+                    REQUESTS_COALESCED.inc(route=route)
+                return response
+            except Overloaded:
+                return overloaded_response()
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,338 @@
+"""
+Repeatable API benchmark for the Retrofy backend
+
+Generates a synthetic luxury catalog (brands from LUXURY_BRANDS, items from the
+smart category taxonomy), loads it through POST /seed_products into a scratch
+database, then drives the read endpoints at a fixed concurrency and reports
+throughput, latency percentiles and worker memory (read from /metrics).
+
+Usage:
+    python benchmark.py                                  # 10k products, local server
+    python benchmark.py --sizes 10000 100000 1000000 --concurrency 16
+    python benchmark.py --output after.json --baseline before.json
+    python benchmark.py --base-url http://localhost:8000 --skip-load
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import requests
+
+from fix_brands import LUXURY_BRANDS
+from search_logic import BAG_TERMS, CLOTHING_TERMS, SHOE_TERMS, ACCESSORY_TERMS, SMART_CATEGORY_TERMS
+
+DEFAULT_SIZES = [10000]
+SEED_BATCH_SIZE = 5000
+SERVER_START_TIMEOUT = 60
+MEMORY_METRIC = "retrofy_process_resident_memory_bytes"
+# The sample line, with or without labels (every sample carries worker="<pid>")
+MEMORY_SAMPLE = re.compile(rf"^{MEMORY_METRIC}(?:\{{[^}}]*\}})?\s+(\S+)$")
+
+# Top-level smart category -> (share of catalog, backend category, price range)
+CATEGORY_MIX = {
+    "bags": (0.35, "handbags", (400, 9000)),
+    "clothing": (0.30, "clothing", (80, 3500)),
+    "shoes": (0.20, "shoes", (150, 1800)),
+    "accessories": (0.15, "accessories", (60, 2500)),
+}
+CATEGORY_TERMS = {"bags": BAG_TERMS, "clothing": CLOTHING_TERMS, "shoes": SHOE_TERMS, "accessories": ACCESSORY_TERMS}
+
+COLORS = ["Black", "White", "Beige", "Brown", "Red", "Pink", "Blue", "Green", "Gold", "Silver", "Multicolor"]
+MATERIALS = ["Leather", "Suede", "Canvas", "Silk", "Wool", "Cashmere", "Patent Leather", "Denim", "Tweed", "Satin"]
+DETAILS = ["Gold-Tone Hardware", "Silver-Tone Hardware", "Logo Print", "Quilted", "Zip Closure",
+           "Chain Strap", "Embroidered", "Monogram", "Studded Accents", "Contrast Stitching"]
+CONDITIONS = ["Pristine", "Excellent", "Very Good", "Good"]
+# Smart-category platform shoe phrases searched as q ("platform boot", "platform loafer", ...)
+PLATFORM_COMBOS = sorted(term for term in SMART_CATEGORY_TERMS if term.startswith("platform "))
+PLATFORMS = {"TheRealReal": 0.6, "Vestiaire": 0.25, "Fashionphile": 0.15}
+
+
+def _weighted_brands():
+    """Zipf-like popularity so a handful of houses dominate, like the real catalog"""
+    brands = list(dict.fromkeys(LUXURY_BRANDS))
+    return brands, [1.0 / (rank + 1) for rank in range(len(brands))]
+
+
+def generate_catalog(size: int, seed: int = 42):
+    """Yield `size` ProductCreate-shaped dicts; the same seed always yields the same catalog"""
+    rng = random.Random(seed)
+    brands, brand_weights = _weighted_brands()
+    groups = list(CATEGORY_MIX)
+    group_weights = [CATEGORY_MIX[group][0] for group in groups]
+    item_terms = {
+        # Multi-word synonyms too ("platform boot"), so phrase searches have matches
+        group: sorted({term for synonyms in terms.values() for term in synonyms})
+        for group, terms in CATEGORY_TERMS.items()
+    }
+    platforms, platform_weights = list(PLATFORMS), list(PLATFORMS.values())
+
+    for index in range(size):
+        brand = rng.choices(brands, brand_weights)[0]
+        group = rng.choices(groups, group_weights)[0]
+        _, category, (low, high) = CATEGORY_MIX[group]
+        item = rng.choice(item_terms[group]).title()
+        color = rng.choice(COLORS)
+        material = rng.choice(MATERIALS)
+        title = f"{brand} {material} {item}"
+        description = (
+            f"{brand} {item} {color} {material} {rng.choice(DETAILS)} {rng.choice(DETAILS)} "
+            f"Condition: {rng.choice(CONDITIONS)}. Authenticated pre-owned {group} item."
+        )
+        yield {
+            "title": title,
+            "brand": brand,
+            "category": category,
+            "color": color,
+            "description": description,
+            "price": round(rng.uniform(low, high), 2),
+            "image_url": f"https://images.example.com/bench/{index}.jpg",
+            "platform_name": rng.choices(platforms, platform_weights)[0],
+            "product_url": f"https://shop.example.com/products/bench-{seed}-{index}",
+        }
+
+
+def scenarios(size: int, rng: random.Random):
+    """(name, path, params) request generators; params are re-drawn for every request"""
+    brands, brand_weights = _weighted_brands()
+    return [
+        ("products_default", lambda: ("/products", {})),
+        ("products_brand_category", lambda: ("/products", {
+            "brand": rng.choices(brands, brand_weights)[0], "category": rng.choice(["bag", "shoes", "dress"])})),
+        ("search_single_word", lambda: ("/products/search", {
+            "q": rng.choice(["bag", "leather", "black", "silk", "tote", "boots"])})),
+        ("search_brand_category", lambda: ("/products/search", {
+            "brand": rng.choices(brands, brand_weights)[0], "category": rng.choice(["handbags", "shoes", "clothing"])})),
+        ("search_platform_combo", lambda: ("/products/search", {"q": rng.choice(PLATFORM_COMBOS)})),
+        ("products_platform_color_price", lambda: ("/products", {
+            "platform_name": rng.choice(list(PLATFORMS)), "color": rng.choice(COLORS),
+            "max_price": rng.choice([500, 1000, 2500])})),
+        ("search_price_sorted", lambda: ("/products/search", {
+            "category": rng.choice(["bags", "shoes"]), "sort_by": rng.choice(["price_asc", "price_desc"]),
+            "limit": 50})),
+        ("filters", lambda: ("/products/filters", {})),
+        ("product_by_id", lambda: (f"/products/{rng.randint(1, size)}", {})),
+    ]
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def resident_memory(base_url: str):
+    """
+    RSS in bytes of the worker that answered /metrics, or None if unavailable.
+    A scrape reaches one worker; any samples it carries are summed.
+    """
+    try:
+        text = requests.get(f"{base_url}/metrics", timeout=10).text
+    except requests.RequestException:
+        return None
+    samples = [float(match.group(1)) for match in map(MEMORY_SAMPLE.match, text.splitlines()) if match]
+    return int(sum(samples)) if samples else None
+
+
+def run_scenario(base_url: str, make_request, requests_count: int, concurrency: int) -> dict:
+    """Fire requests_count requests from `concurrency` threads and summarize latencies"""
+    local = threading.local()
+    lock = threading.Lock()  # the shared rng in make_request is not thread-safe
+
+    def one_request(_):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        with lock:
+            path, params = make_request()
+        start = time.perf_counter()
+        try:
+            response = session.get(base_url + path, params=params, timeout=120)
+            body = response.json()
+            ok = response.status_code == 200 and not (isinstance(body, dict) and "error" in body)
+        except (requests.RequestException, ValueError):
+            ok = False
+        return time.perf_counter() - start, ok
+
+    # Warm-up request: reported separately so cold index builds don't skew percentiles
+    first_latency, _ = one_request(None)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one_request, range(requests_count)))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for latency, _ in results)
+    return {
+        "requests": requests_count,
+        "errors": sum(1 for _, ok in results if not ok),
+        "throughput_rps": round(requests_count / elapsed, 2) if elapsed else 0.0,
+        "first_request_ms": round(first_latency * 1000, 3),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+    }
+
+
+def load_catalog(base_url: str, size: int, seed: int) -> float:
+    """Seed the catalog in batches through the API; returns elapsed seconds"""
+    start = time.perf_counter()
+    batch = []
+    for product in generate_catalog(size, seed):
+        batch.append(product)
+        if len(batch) == SEED_BATCH_SIZE:
+            _seed_batch(base_url, batch)
+            batch = []
+    if batch:
+        _seed_batch(base_url, batch)
+    return time.perf_counter() - start
+
+
+def _seed_batch(base_url: str, batch: list):
+    response = requests.post(f"{base_url}/seed_products", json=batch, timeout=600)
+    body = response.json()
+    if response.status_code != 200 or "error" in body:
+        raise RuntimeError(f"Seeding failed: {body}")
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(database_path: str, workers: int = 1):
+    """Start uvicorn against a scratch database; returns (process, base_url)"""
+    port = _free_port()
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{database_path}")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+        stdout=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("Benchmark server exited during startup")
+        try:
+            requests.get(base_url + "/", timeout=1)
+            return process, base_url
+        except requests.RequestException:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("Benchmark server did not start in time")
+
+
+def benchmark_size(base_url: str, size: int, args) -> dict:
+    rng = random.Random(args.seed)
+    result = {"size": size, "memory_bytes": {"idle": resident_memory(base_url)}}
+    if not args.skip_load:
+        print(f"Loading {size} products...")
+        result["load_seconds"] = round(load_catalog(base_url, size, args.seed), 3)
+        result["memory_bytes"]["loaded"] = resident_memory(base_url)
+
+    result["scenarios"] = {}
+    peak = 0
+    for name, make_request in scenarios(size, rng):
+        stats = run_scenario(base_url, make_request, args.requests, args.concurrency)
+        result["scenarios"][name] = stats
+        peak = max(peak, resident_memory(base_url) or 0)
+        print(f"  {name:<26} {stats['throughput_rps']:>9} req/s  "
+              f"p50 {stats['p50_ms']:>9}ms  p95 {stats['p95_ms']:>9}ms  p99 {stats['p99_ms']:>9}ms  "
+              f"errors {stats['errors']}")
+    result["memory_bytes"]["peak"] = peak or None
+    return result
+
+
+def compare(results: dict, baseline: dict):
+    """Print per-scenario change against a previous results file"""
+    previous = {run["size"]: run for run in baseline.get("runs", [])}
+    print("\nChange vs baseline (negative latency / positive throughput is better):")
+    for run in results["runs"]:
+        old = previous.get(run["size"])
+        if not old:
+            print(f"  size {run['size']}: not in baseline")
+            continue
+        for name, stats in run["scenarios"].items():
+            old_stats = old["scenarios"].get(name)
+            if not old_stats:
+                continue
+            deltas = []
+            for key in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms"):
+                if old_stats[key]:
+                    deltas.append(f"{key} {100 * (stats[key] - old_stats[key]) / old_stats[key]:+.1f}%")
+            print(f"  {run['size']:>8} {name:<26} " + "  ".join(deltas))
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL, text=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Retrofy API against a synthetic catalog")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Catalog sizes to run")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent client threads")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per scenario")
+    parser.add_argument("--seed", type=int, default=42, help="Catalog and request-mix seed")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for the local server")
+    parser.add_argument("--base-url", help="Benchmark an already running server instead of starting one")
+    parser.add_argument("--skip-load", action="store_true", help="Use the catalog already in the server")
+    parser.add_argument("--output", default="benchmark_results.json", help="Where to write the JSON results")
+    parser.add_argument("--baseline", help="Previous results file to compare against")
+    args = parser.parse_args()
+
+    results = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "concurrency": args.concurrency,
+        "requests_per_scenario": args.requests,
+        "seed": args.seed,
+        "runs": [],
+    }
+
+    for size in args.sizes:
+        print(f"\n=== {size} products ===")
+        if args.base_url:
+            results["runs"].append(benchmark_size(args.base_url.rstrip("/"), size, args))
+            continue
+        with tempfile.TemporaryDirectory() as scratch:
+            process, base_url = start_server(os.path.join(scratch, "bench.db"), args.workers)
+            try:
+                results["runs"].append(benchmark_size(base_url, size, args))
+            finally:
+                process.terminate()
+                process.wait()
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults saved to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+Stratified, coverage-aware catalog sampling
+
+Random page sampling spends most of its API calls on whatever dominates the
+catalog (usually handbags). Each call keeps buying more of that, while scarce
+categories stay empty. StratifiedSampler tracks coverage as pages arrive:
+- every category stratum has a quota, and no brand may exceed max_per_brand
+- an item is accepted only while its category is under quota and its brand
+  under cap; anything else is "not useful"
+- the page range is split into segments (catalogs are rarely shuffled: nearby
+  pages hold similar items), and the next page comes from the segment with the
+  highest upper confidence bound on useful items per page, given current deficits
+- sampling stops as soon as every stratum meets its quota, or when no segment is
+  expected to yield anything useful (a category the catalog doesn't carry)
+
+report() compares the calls used with an estimate of what uniform random pages
+would need for the same quotas. The estimate replays random draws against the
+per-segment item mix observed during sampling.
+"""
+
+import math
+import random
+from collections import Counter
+from typing import Callable, Dict, List
+
+DEFAULT_SEGMENTS = 20
+# Pages fetched from each segment before its yield estimate is trusted
+MIN_SEGMENT_PROBES = 1
+EXPLORATION_WEIGHT = 1.0
+BASELINE_SIMULATIONS = 20
+
+
+class StratifiedSampler:
+    """Chooses pages and accepts items until every (category) stratum meets its quota"""
+
+    def __init__(self, total_pages: int, quotas: Dict[str, int], max_per_brand: int = None,
+                 segments: int = DEFAULT_SEGMENTS, rng: random.Random = None):
+        self.total_pages = max(total_pages, 1)
+        self.quotas = dict(quotas)
+        self.max_per_brand = max_per_brand
+        self.rng = rng or random.Random()
+        segment_count = max(1, min(segments, self.total_pages))
+        bounds = [1 + self.total_pages * index // segment_count for index in range(segment_count + 1)]
+        self.segments = [list(range(bounds[index], bounds[index + 1])) for index in range(segment_count)]
+        for pages in self.segments:
+            self.rng.shuffle(pages)
+        # Per segment: pages fetched and the (category, brand) mix seen on them
+        self.segment_pages = [0] * segment_count
+        self.segment_items = [Counter() for _ in range(segment_count)]
+        self.category_counts = Counter()
+        self.brand_counts = Counter()
+        self.calls = 0
+        self.items_seen = 0
+        self._page_segment = {}
+
+    # --- coverage --------------------------------------------------------------
+
+    def _useful(self, category: str, brand: str, category_counts=None, brand_counts=None) -> bool:
+        category_counts = self.category_counts if category_counts is None else category_counts
+        brand_counts = self.brand_counts if brand_counts is None else brand_counts
+        if category_counts[category] >= self.quotas.get(category, 0):
+            return False
+        return self.max_per_brand is None or brand_counts[brand] < self.max_per_brand
+
+    @property
+    def done(self) -> bool:
+        return all(self.category_counts[category] >= quota for category, quota in self.quotas.items())
+
+    def deficits(self) -> Dict[str, int]:
+        return {
+            category: quota - self.category_counts[category]
+            for category, quota in self.quotas.items() if self.category_counts[category] < quota
+        }
+
+    # --- page selection --------------------------------------------------------
+
+    def _expected_useful(self, segment: int) -> float:
+        """Useful items per page in this segment, judged against the current deficits"""
+        pages = self.segment_pages[segment]
+        if not pages:
+            return 0.0
+        useful = sum(
+            count for (category, brand), count in self.segment_items[segment].items()
+            if self._useful(category, brand)
+        )
+        return useful / pages
+
+    def next_page(self):
+        """Page to fetch next, or None when sampling should stop"""
+        if self.done:
+            return None
+        open_segments = [index for index, pages in enumerate(self.segments) if pages]
+        if not open_segments:
+            return None
+
+        unprobed = [index for index in open_segments if self.segment_pages[index] < MIN_SEGMENT_PROBES]
+        if unprobed:
+            segment = self.rng.choice(unprobed)
+        else:
+            scale = max(1.0, max(self._expected_useful(index) for index in range(len(self.segments))))
+            scores = {
+                index: self._expected_useful(index)
+                + EXPLORATION_WEIGHT * scale * math.sqrt(math.log(self.calls + 1) / self.segment_pages[index])
+                for index in open_segments
+            }
+            # Nothing useful seen anywhere: the remaining deficits can't be filled from this catalog
+            if all(self._expected_useful(index) == 0 for index in range(len(self.segments))):
+                return None
+            segment = max(scores, key=scores.get)
+
+        page = self.segments[segment].pop()
+        self._page_segment[page] = segment
+        return page
+
+    def offer(self, page: int, items: List, classify: Callable) -> List:
+        """Record a fetched page; returns the items accepted into under-quota strata"""
+        segment = self._page_segment.pop(page, None)
+        self.calls += 1
+        accepted = []
+        for item in items:
+            category, brand = classify(item)
+            self.items_seen += 1
+            if segment is not None:
+                self.segment_items[segment][category, brand] += 1
+            if self._useful(category, brand):
+                self.category_counts[category] += 1
+                self.brand_counts[brand] += 1
+                accepted.append(item)
+        if segment is not None:
+            self.segment_pages[segment] += 1
+        return accepted
+
+    # --- reporting -------------------------------------------------------------
+
+    def _simulate_random(self, page_size: int, rng: random.Random) -> int:
+        """Calls uniform random pages would take to reach the same coverage (capped at the catalog)"""
+        pools = [list(items.elements()) for items in self.segment_items]
+        weights = [len(pages) + fetched for pages, fetched in zip(self.segments, self.segment_pages)]
+        category_counts, brand_counts = Counter(), Counter()
+        target = {category: min(quota, self.category_counts[category]) for category, quota in self.quotas.items()}
+        for calls in range(1, self.total_pages + 1):
+            segment = rng.choices(range(len(pools)), weights)[0]
+            if pools[segment]:
+                for category, brand in rng.choices(pools[segment], k=page_size):
+                    if category_counts[category] < target.get(category, 0) and (
+                        self.max_per_brand is None or brand_counts[brand] < self.max_per_brand
+                    ):
+                        category_counts[category] += 1
+                        brand_counts[brand] += 1
+            if all(category_counts[category] >= count for category, count in target.items()):
+                return calls
+        return self.total_pages
+
+    def report(self, page_size: int) -> Dict:
+        unfilled = self.deficits()
+        rng = random.Random(0)
+        simulated = [self._simulate_random(page_size, rng) for _ in range(BASELINE_SIMULATIONS)]
+        random_calls = round(sum(simulated) / len(simulated))
+        return {
+            "api_calls": self.calls,
+            "items_seen": self.items_seen,
+            "accepted": sum(self.category_counts.values()),
+            "categories": dict(self.category_counts),
+            "brands": len(self.brand_counts),
+            "unfilled": unfilled,
+            "random_strategy_calls_estimate": random_calls,
+            "api_calls_saved": random_calls - self.calls,
+        }
+
+
+def stratified_sample(fetch_page: Callable, total_pages: int, quotas: Dict[str, int], classify: Callable,
+                      page_size: int, max_per_brand: int = None, max_calls: int = None, rng=None):
+    """
+    Drive a StratifiedSampler: fetch_page(page) -> raw items, classify(item) -> (category, brand).
+    Returns (accepted items, report). Pages that fail to fetch count as calls and yield nothing.
+    """
+    sampler = StratifiedSampler(total_pages, quotas, max_per_brand=max_per_brand, rng=rng)
+    accepted = []
+    while max_calls is None or sampler.calls < max_calls:
+        page = sampler.next_page()
+        if page is None:
+            break
+        try:
+            items = fetch_page(page)
+        except Exception:
+            items = []
+        accepted.extend(sampler.offer(page, items, classify))
+    return accepted, sampler.report(page_size)
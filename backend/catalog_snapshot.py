@@ -0,0 +1,336 @@
+"""
+Memory-mapped catalog snapshots shared between worker processes
+
+One process builds the replica for a catalog version and writes it to
+catalog-<instance>-v<version>.snap: raw columns, dictionary-encoded facets with postings
+(whose sizes are the facet counts), normalized text buffers, token postings,
+price arrays and sort orders, each section page-aligned. Every worker
+maps that file read-only, so the OS page cache holds one copy no matter how many
+workers run, and no worker re-reads or re-normalizes the products table.
+
+Snapshots are written to a temp file and renamed into place, so a reader either
+sees a complete snapshot or none. A new catalog version gets a new file; workers
+swap to it on their next request, and old files are pruned (open maps stay valid).
+
+Version numbers restart when a database is recreated, so files are also keyed by
+the database's random instance id (catalog_instance table). A snapshot written
+for another database, even one sharing the directory, is never mapped.
+
+Layout (FORMAT_VERSION 2):
+    "RTFYSNAP" + uint32 format version
+    page-aligned sections (typed arrays / UTF-8 buffers)
+    JSON header: catalog instance and version, section table, facet values, derived stats
+    trailer: uint64 header offset, uint64 header length, "RTFYSNAP"
+Readers refuse other format versions and other instances; the snapshot is rebuilt from SQL.
+
+Enable with RETROFY_SNAPSHOT_DIR=/path/to/dir (and uvicorn --workers N).
+"""
+
+import contextlib
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+from array import array
+
+from sqlalchemy.orm import Session
+
+from catalog_store import CatalogReplica, EncodedColumn, PackedText, PriceIndex, TokenIndex
+from catalog_version import get_catalog_instance
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process development, no cross-process build lock
+    fcntl = None
+
+SNAPSHOT_DIR = os.getenv("RETROFY_SNAPSHOT_DIR")
+KEEP_SNAPSHOTS = 2
+
+MAGIC = b"RTFYSNAP"
+FORMAT_VERSION = 2
+# magic, format version
+_PREAMBLE = struct.Struct("<8sI")
+# header offset, header length, magic
+_TRAILER = struct.Struct("<QQ8s")
+ALIGNMENT = mmap.ALLOCATIONGRANULARITY
+
+STRING_COLUMNS = ["titles", "descriptions", "image_urls", "product_urls"]
+TEXT_COLUMNS = ["title_text", "description_text", "smart_text"]
+ENCODED_COLUMNS = ["brand", "category", "color", "platform"]
+ORDER_COLUMNS = ["price_desc_order", "brand_order", "brand_rank"]
+TOKEN_INDEXES = ["title_tokens", "description_tokens"]
+
+SNAPSHOT_NAME = re.compile(r"^catalog-([0-9a-f]+)-v(\d+)\.snap$")
+
+
+class SnapshotError(Exception):
+    """The file is not a readable snapshot for this build"""
+
+
+class PackedStrings:
+    """Read-only string column: concatenated UTF-8, row offsets and a null flag per row"""
+
+    def __init__(self, data, offsets, nulls):
+        self.data = data
+        self.offsets = offsets
+        self.nulls = nulls
+
+    def __len__(self):
+        return len(self.nulls)
+
+    def __getitem__(self, row: int):
+        if self.nulls[row]:
+            return None
+        return str(self.data[self.offsets[row]:self.offsets[row + 1]], "utf-8")
+
+
+def _pack_strings(values) -> tuple:
+    data = bytearray()
+    offsets = array("q", [0])
+    nulls = bytearray(len(values))
+    for row, value in enumerate(values):
+        if value is None:
+            nulls[row] = 1
+        else:
+            data += value.encode("utf-8")
+        offsets.append(len(data))
+    return data, offsets, nulls
+
+
+class _SectionWriter:
+    def __init__(self, f):
+        self.f = f
+        self.sections = {}
+
+    def add(self, name: str, data):
+        """Write a bytes-like section (bytes, array, memoryview) at the next aligned offset"""
+        view = memoryview(data)
+        padding = -self.f.tell() % ALIGNMENT
+        self.f.write(bytes(padding))
+        self.sections[name] = {"offset": self.f.tell(), "length": view.nbytes, "typecode": view.format}
+        self.f.write(view.cast("B") if view.nbytes else b"")
+
+
+def write_snapshot(replica: CatalogReplica, path: str, instance_id: str):
+    """Serialize a replica and atomically move it to path"""
+    temp_path = f"{path}.tmp-{os.getpid()}"
+    size = replica.size
+    replica.build_token_indexes()
+    with open(temp_path, "wb") as f:
+        f.write(_PREAMBLE.pack(MAGIC, FORMAT_VERSION))
+        writer = _SectionWriter(f)
+
+        writer.add("ids", replica.ids)
+        writer.add("prices", replica.prices)
+        for name in STRING_COLUMNS:
+            data, offsets, nulls = _pack_strings(getattr(replica, name))
+            writer.add(f"{name}.data", data)
+            writer.add(f"{name}.offsets", offsets)
+            writer.add(f"{name}.nulls", nulls)
+
+        for name in TEXT_COLUMNS:
+            packed = getattr(replica, name)
+            writer.add(f"{name}.buffer", packed.buffer)
+            writer.add(f"{name}.starts", packed.starts)
+
+        values = {}
+        for name in ENCODED_COLUMNS:
+            column = getattr(replica, name)
+            postings, posting_offsets = array("i"), array("q", [0])
+            for rows in column.postings:
+                postings.extend(rows)
+                posting_offsets.append(len(postings))
+            writer.add(f"{name}.codes", column.codes)
+            writer.add(f"{name}.postings", postings)
+            writer.add(f"{name}.posting_offsets", posting_offsets)
+            values[name] = column.values
+
+        price_index = replica.price_index
+        width = (size + 7) // 8
+        writer.add("price.order", price_index.order)
+        writer.add("price.sorted_prices", price_index.sorted_prices)
+        writer.add("price.checkpoints", b"".join(
+            checkpoint.to_bytes(width, "little") for checkpoint in price_index.checkpoints
+        ))
+        for name in ORDER_COLUMNS:
+            writer.add(name, getattr(replica, name))
+
+        for name in TOKEN_INDEXES:
+            tokens = getattr(replica, name)
+            writer.add(f"{name}.vocabulary", tokens.vocabulary.buffer)
+            writer.add(f"{name}.vocabulary_starts", tokens.vocabulary.starts)
+            writer.add(f"{name}.postings", tokens.postings)
+            writer.add(f"{name}.offsets", tokens.offsets)
+
+        header = json.dumps({
+            "format_version": FORMAT_VERSION,
+            "catalog_instance": instance_id,
+            "catalog_version": replica.version,
+            "size": size,
+            "byteorder": sys.byteorder,
+            "sections": writer.sections,
+            "values": values,
+            "price_checkpoint_step": price_index.step,
+            "price_checkpoint_count": len(price_index.checkpoints),
+            "avg_field_lengths": replica.avg_field_lengths(),
+        }).encode("utf-8")
+        header_offset = f.tell()
+        f.write(header)
+        f.write(_TRAILER.pack(header_offset, len(header), MAGIC))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+def read_header(mapped) -> dict:
+    if len(mapped) < _PREAMBLE.size + _TRAILER.size:
+        raise SnapshotError("File too small")
+    magic, format_version = _PREAMBLE.unpack_from(mapped, 0)
+    header_offset, header_length, trailer_magic = _TRAILER.unpack_from(mapped, len(mapped) - _TRAILER.size)
+    if magic != MAGIC or trailer_magic != MAGIC:
+        raise SnapshotError("Not a catalog snapshot")
+    if format_version != FORMAT_VERSION:
+        raise SnapshotError(f"Unsupported snapshot format {format_version}")
+    header = json.loads(bytes(mapped[header_offset:header_offset + header_length]))
+    if header["byteorder"] != sys.byteorder:
+        raise SnapshotError("Snapshot was written on a host with different byte order")
+    return header
+
+
+def load_snapshot(path: str, instance_id: str) -> CatalogReplica:
+    """Map a snapshot read-only; columns are zero-copy views over the shared pages"""
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header = read_header(mapped)
+        if header.get("catalog_instance") != instance_id:
+            raise SnapshotError("Snapshot belongs to another database")
+        sections = header["sections"]
+        view = memoryview(mapped)
+
+        def section(name: str):
+            entry = sections[name]
+            return view[entry["offset"]:entry["offset"] + entry["length"]].cast(entry["typecode"])
+
+        def text_buffer(name: str):
+            # Text needs .find, so it gets its own map starting at the (aligned) section offset
+            entry = sections[name]
+            if not entry["length"]:
+                return b""
+            return mmap.mmap(f.fileno(), entry["length"], access=mmap.ACCESS_READ, offset=entry["offset"])
+
+        strings = {
+            name: PackedStrings(section(f"{name}.data"), section(f"{name}.offsets"), section(f"{name}.nulls"))
+            for name in STRING_COLUMNS
+        }
+        texts = {
+            name: PackedText(text_buffer(f"{name}.buffer"), section(f"{name}.starts"))
+            for name in TEXT_COLUMNS
+        }
+        token_indexes = {
+            name: TokenIndex(
+                PackedText(text_buffer(f"{name}.vocabulary"), section(f"{name}.vocabulary_starts")),
+                section(f"{name}.postings"), section(f"{name}.offsets"),
+            )
+            for name in TOKEN_INDEXES
+        }
+
+    columns = {}
+    for name in ENCODED_COLUMNS:
+        postings, offsets = section(f"{name}.postings"), section(f"{name}.posting_offsets")
+        values = header["values"][name]
+        columns[name] = EncodedColumn(
+            values, section(f"{name}.codes"),
+            [postings[offsets[code]:offsets[code + 1]] for code in range(len(values))],
+        )
+
+    size = header["size"]
+    width = (size + 7) // 8
+    checkpoint_bytes = section("price.checkpoints")
+    checkpoints = [
+        int.from_bytes(checkpoint_bytes[index * width:(index + 1) * width], "little")
+        for index in range(header["price_checkpoint_count"])
+    ]
+    price_index = PriceIndex(
+        section("price.order"), section("price.sorted_prices"), header["price_checkpoint_step"], checkpoints
+    )
+
+    replica = CatalogReplica(
+        header["catalog_version"], section("ids"), section("prices"),
+        strings["titles"], strings["descriptions"], strings["image_urls"], strings["product_urls"],
+        columns["brand"], columns["category"], columns["color"], columns["platform"],
+        texts["title_text"], texts["description_text"], texts["smart_text"],
+        price_index, *(section(name) for name in ORDER_COLUMNS),
+        avg_field_lengths=header["avg_field_lengths"],
+    )
+    replica.title_tokens = token_indexes["title_tokens"]
+    replica.description_tokens = token_indexes["description_tokens"]
+    return replica
+
+
+class SharedSnapshotLoader:
+    """
+    CatalogStore loader for multi-worker serving: the first worker to need a
+    version builds its snapshot under a file lock; everyone else maps the file.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path_for(self, instance_id: str, version: int) -> str:
+        return os.path.join(self.directory, f"catalog-{instance_id}-v{version}.snap")
+
+    @contextlib.contextmanager
+    def _build_lock(self):
+        with open(os.path.join(self.directory, ".build.lock"), "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def versions(self, instance_id: str) -> list:
+        """Catalog versions of one database with a snapshot on disk, newest first"""
+        found = []
+        for name in os.listdir(self.directory):
+            match = SNAPSHOT_NAME.match(name)
+            if match and match.group(1) == instance_id:
+                found.append(int(match.group(2)))
+        return sorted(found, reverse=True)
+
+    def prune(self, instance_id: str):
+        """Delete all but the newest KEEP_SNAPSHOTS snapshots of this database; mapped files stay readable"""
+        for version in self.versions(instance_id)[KEEP_SNAPSHOTS:]:
+            with contextlib.suppress(OSError):
+                os.remove(self.path_for(instance_id, version))
+
+    def publish(self, replica: CatalogReplica, instance_id: str):
+        """Write a snapshot for an already built replica"""
+        write_snapshot(replica, self.path_for(instance_id, replica.version), instance_id)
+        self.prune(instance_id)
+
+    def _is_current(self, path: str) -> bool:
+        """Snapshot exists and was written in this build's format"""
+        try:
+            with open(path, "rb") as f:
+                magic, format_version = _PREAMBLE.unpack(f.read(_PREAMBLE.size))
+        except (OSError, struct.error):
+            return False
+        return magic == MAGIC and format_version == FORMAT_VERSION
+
+    def __call__(self, db: Session, version: int) -> CatalogReplica:
+        instance_id = get_catalog_instance(db)
+        path = self.path_for(instance_id, version)
+        if not self._is_current(path):
+            with self._build_lock():
+                if not self._is_current(path):
+                    self.publish(CatalogReplica.load(db, version), instance_id)
+        try:
+            return load_snapshot(path, instance_id)
+        except (OSError, SnapshotError, ValueError):
+            # Pruned or unreadable: serve from a private replica rather than fail
+            return CatalogReplica.load(db, version)
@@ -0,0 +1,627 @@
+"""
+In-memory columnar catalog store
+
+A read-optimized replica of the products table:
+- prices live in flat arrays with a sorted price index
+- brand, category, color and platform are dictionary-encoded with per-value postings
+- searchable text is packed into one buffer per field so substring checks run as C-level scans
+- optional token postings answer single-word needles without scanning the text at all
+- query_planner compiles request filters into predicates over these structures
+
+Every filter evaluates to a row bitmap (a Python int, bit i = row i) and filters are
+combined with &, | and ~. Sorted results walk precomputed orders instead of sorting matches.
+The replica is rebuilt from SQL whenever the catalog version changes.
+"""
+
+import heapq
+import os
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import islice
+
+from sqlalchemy.orm import Session
+
+from catalog_version import get_catalog_version
+from models.product import Product
+from search_logic import remove_accents, ALL_CATEGORY_TERMS
+from search_ranking import RelevanceScorer, token_count
+from fuzzy_index import build_index, spelling_corrections
+
+# Set RETROFY_CATALOG_STORE=0 to serve list endpoints straight from SQL
+CATALOG_STORE_ENABLED = os.getenv("RETROFY_CATALOG_STORE", "1") != "0"
+
+# Output fields, in the same order the ORM serializes them
+PRODUCT_FIELDS = ["id", "title", "brand", "category", "color", "description",
+                  "price", "image_url", "platform_name", "product_url"]
+
+LOAD_BATCH_SIZE = 10000
+PREDICATE_CACHE_SIZE = 1024
+PRICE_CHECKPOINTS = 64
+MIN_PRICE_CHECKPOINT_STEP = 4096
+
+# Separates rows inside a packed text buffer
+ROW_SEPARATOR = b"\x00"
+
+# bytes.translate table turning 0/1 flag bytes into '0'/'1' digits
+_BIT_DIGITS = b"01" + bytes(254)
+
+
+def bitmap_from_flags(flags: bytearray) -> int:
+    """Pack one 0/1 flag byte per row into a row bitmap"""
+    if not flags:
+        return 0
+    return int(flags.translate(_BIT_DIGITS)[::-1], 2)
+
+
+def bitmap_from_rows(rows, size: int) -> int:
+    """Build a row bitmap from an iterable of row positions"""
+    flags = bytearray(size)
+    for row in rows:
+        flags[row] = 1
+    return bitmap_from_flags(flags)
+
+
+def bitmap_digits(bitmap: int) -> str:
+    """Bitmap as a '0'/'1' string indexed by row, for fast membership checks"""
+    return format(bitmap, "b")[::-1] if bitmap else ""
+
+
+def iter_rows(bitmap: int):
+    """Yield the rows set in a bitmap in ascending order"""
+    digits = bitmap_digits(bitmap)
+    row = digits.find("1")
+    while row != -1:
+        yield row
+        row = digits.find("1", row + 1)
+
+
+class PackedText:
+    """Per-row strings packed into one separator-delimited UTF-8 buffer"""
+
+    def __init__(self, buffer, starts: array):
+        # buffer is anything exposing bytes-style .find (bytes, mmap)
+        self.buffer = buffer
+        # Byte offset where each row starts, plus an end sentinel
+        self.starts = starts
+
+    @classmethod
+    def from_strings(cls, strings) -> "PackedText":
+        starts = array("q")
+        parts = []
+        offset = 0
+        for text in strings:
+            encoded = text.replace("\x00", " ").encode("utf-8")
+            starts.append(offset)
+            parts.append(encoded)
+            offset += len(encoded) + 1
+        starts.append(offset)
+        return cls(ROW_SEPARATOR.join(parts) + ROW_SEPARATOR if parts else b"", starts)
+
+    def __len__(self):
+        return len(self.starts) - 1
+
+    def row_text(self, row: int) -> str:
+        return self.buffer[self.starts[row]:self.starts[row + 1] - 1].decode("utf-8")
+
+    def average_tokens(self) -> float:
+        """Mean whitespace token count per row"""
+        size = len(self)
+        if not size:
+            return 0.0
+        starts = self.starts
+        empty_rows = sum(1 for row in range(size) if starts[row + 1] - starts[row] == 1)
+        return (self.buffer.count(b" ") + size - empty_rows) / size
+
+    def rows_containing(self, needle: str) -> int:
+        """Bitmap of rows whose text contains needle"""
+        size = len(self)
+        if not needle:
+            return (1 << size) - 1
+        if "\x00" in needle:
+            return 0
+
+        pattern = needle.encode("utf-8")
+        starts = self.starts
+        find = self.buffer.find
+        flags = bytearray(size)
+
+        # Jump from hit to hit; after a hit, resume at the next row's start
+        pos = find(pattern)
+        while pos != -1:
+            row = bisect_right(starts, pos) - 1
+            flags[row] = 1
+            pos = find(pattern, starts[row + 1])
+        return bitmap_from_flags(flags)
+
+    def sample_rows_containing(self, needle: str, chunk_rows: int, chunks: int) -> tuple:
+        """(matching rows, sampled rows) over evenly spaced chunks of rows, for selectivity estimates"""
+        size = len(self)
+        if not size or "\x00" in needle:
+            return 0, size
+        if chunk_rows * chunks >= size:
+            ranges = [(0, size)]
+        else:
+            stride = size // chunks
+            ranges = [(chunk * stride, chunk * stride + chunk_rows) for chunk in range(chunks)]
+
+        pattern = needle.encode("utf-8")
+        starts = self.starts
+        find = self.buffer.find
+        hits = sampled = 0
+        for first, last in ranges:
+            end = starts[last]
+            pos = find(pattern, starts[first], end)
+            while pos != -1:
+                hits += 1
+                pos = find(pattern, starts[bisect_right(starts, pos)], end)
+            sampled += last - first
+        return hits, sampled
+
+
+def is_token_needle(needle: str) -> bool:
+    """A non-empty needle without whitespace occurs in a text iff it occurs inside one of its tokens"""
+    return bool(needle) and needle.split() == [needle]
+
+
+class TokenIndex:
+    """Whitespace tokens of one or more text columns, each with the rows it occurs in"""
+
+    def __init__(self, vocabulary: PackedText, postings, offsets):
+        self.vocabulary = vocabulary  # token id -> token, sorted
+        self.postings = postings      # row ids of all tokens, concatenated
+        self.offsets = offsets        # token id -> start in postings, plus an end sentinel
+        self._matches = {}
+
+    @classmethod
+    def build(cls, size: int, row_tokens) -> "TokenIndex":
+        """row_tokens(row) -> the row's tokens"""
+        rows_by_token = {}
+        for row in range(size):
+            for token in set(row_tokens(row)):
+                rows = rows_by_token.get(token)
+                if rows is None:
+                    rows = rows_by_token[token] = array("i")
+                rows.append(row)
+
+        tokens = sorted(rows_by_token)
+        postings, offsets = array("i"), array("q", [0])
+        for token in tokens:
+            postings.extend(rows_by_token[token])
+            offsets.append(len(postings))
+        return cls(PackedText.from_strings(tokens), postings, offsets)
+
+    def matching_tokens(self, needle: str) -> list:
+        """Ids of the tokens containing needle"""
+        tokens = self._matches.get(needle)
+        if tokens is None:
+            tokens = list(iter_rows(self.vocabulary.rows_containing(needle)))
+            if len(self._matches) >= PREDICATE_CACHE_SIZE:
+                self._matches.clear()
+            self._matches[needle] = tokens
+        return tokens
+
+    def posting_count(self, needle: str) -> int:
+        """Upper bound on matching rows: a row is counted once per matching token"""
+        offsets = self.offsets
+        return sum(offsets[token + 1] - offsets[token] for token in self.matching_tokens(needle))
+
+    def rows_containing(self, needle: str, size: int) -> int:
+        """Bitmap of rows with a token containing needle (see is_token_needle)"""
+        postings, offsets = self.postings, self.offsets
+        flags = bytearray(size)
+        for token in self.matching_tokens(needle):
+            for row in postings[offsets[token]:offsets[token + 1]]:
+                flags[row] = 1
+        return bitmap_from_flags(flags)
+
+
+class EncodedColumn:
+    """Dictionary-encoded column with per-value row postings"""
+
+    def __init__(self, values: list, codes: array, postings: list):
+        self.values = values          # code -> raw value
+        self.codes = codes            # row -> code
+        self.postings = postings      # code -> array of rows
+        self.lowered = [(value or "").lower() for value in values]
+        self.folded = [remove_accents(value) for value in self.lowered]
+
+    @classmethod
+    def from_values(cls, raw_values) -> "EncodedColumn":
+        index = {}
+        values = []
+        codes = array("i")
+        postings = []
+        for row, value in enumerate(raw_values):
+            code = index.get(value)
+            if code is None:
+                code = index[value] = len(values)
+                values.append(value)
+                postings.append(array("i"))
+            codes.append(code)
+            postings[code].append(row)
+        return cls(values, codes, postings)
+
+    def value(self, row: int):
+        return self.values[self.codes[row]]
+
+    def rows_containing(self, needle: str, size: int, folded: bool = False) -> int:
+        """Bitmap of rows whose (lowercased, optionally accent-folded) value contains needle"""
+        keys = self.folded if folded else self.lowered
+        flags = bytearray(size)
+        for key, rows in zip(keys, self.postings):
+            if needle in key:
+                for row in rows:
+                    flags[row] = 1
+        return bitmap_from_flags(flags)
+
+    def count_containing(self, needle: str, folded: bool = False) -> int:
+        """Exact number of rows rows_containing would return, from the postings sizes"""
+        keys = self.folded if folded else self.lowered
+        return sum(len(rows) for key, rows in zip(keys, self.postings) if needle in key)
+
+
+class PriceIndex:
+    """Rows sorted by (price, id) with prefix bitmaps for fast range filters"""
+
+    def __init__(self, order, sorted_prices, step: int, checkpoints: list):
+        self.size = len(order)
+        self.order = order
+        self.sorted_prices = sorted_prices
+        # checkpoints[j] = bitmap of the rows ranked below j * step
+        self.step = step
+        self.checkpoints = checkpoints
+
+    @classmethod
+    def build(cls, prices) -> "PriceIndex":
+        size = len(prices)
+        order = array("i", sorted(range(size), key=prices.__getitem__))
+        sorted_prices = array("d", (prices[row] for row in order))
+
+        step = max(MIN_PRICE_CHECKPOINT_STEP, size // PRICE_CHECKPOINTS)
+        checkpoints = [0]
+        flags = bytearray(size)
+        for start in range(0, size, step):
+            for row in order[start:start + step]:
+                flags[row] = 1
+            checkpoints.append(bitmap_from_flags(flags))
+        return cls(order, sorted_prices, step, checkpoints)
+
+    def _ranked_below(self, rank: int) -> int:
+        block = rank // self.step
+        bitmap = self.checkpoints[block]
+        edge = self.order[block * self.step:rank]
+        if edge:
+            bitmap |= bitmap_from_rows(edge, self.size)
+        return bitmap
+
+    def _rank_range(self, min_price, max_price) -> tuple:
+        low = 0 if min_price is None else bisect_left(self.sorted_prices, min_price)
+        high = self.size if max_price is None else bisect_right(self.sorted_prices, max_price)
+        return low, high
+
+    def count_between(self, min_price=None, max_price=None) -> int:
+        low, high = self._rank_range(min_price, max_price)
+        return max(high - low, 0)
+
+    def rows_between(self, min_price=None, max_price=None) -> int:
+        """Bitmap of rows with min_price <= price <= max_price"""
+        low, high = self._rank_range(min_price, max_price)
+        if low >= high:
+            return 0
+        return self._ranked_below(high) & ~self._ranked_below(low)
+
+
+class CatalogReplica:
+    """Immutable columnar copy of the catalog at one catalog version"""
+
+    def __init__(self, version: int, ids, prices, titles, descriptions, image_urls, product_urls,
+                 brand: EncodedColumn, category: EncodedColumn, color: EncodedColumn, platform: EncodedColumn,
+                 title_text: PackedText, description_text: PackedText, smart_text: PackedText,
+                 price_index: PriceIndex, price_desc_order, brand_order, brand_rank,
+                 avg_field_lengths: dict = None):
+        self.version = version
+        self.size = len(ids)
+        self.all_rows = (1 << self.size) - 1
+
+        # Raw columns for serializing results
+        self.ids = ids
+        self.prices = prices
+        self.titles = titles
+        self.descriptions = descriptions
+        self.image_urls = image_urls
+        self.product_urls = product_urls
+
+        # Dictionary-encoded facet columns
+        self.brand = brand
+        self.category = category
+        self.color = color
+        self.platform = platform
+
+        # Normalized text, prepared exactly like updated_search_logic / smart_category_match do per row
+        self.title_text = title_text
+        self.description_text = description_text
+        self.smart_text = smart_text
+
+        # Sort orders
+        self.price_index = price_index
+        self.price_desc_order = price_desc_order
+        self.brand_order = brand_order
+        self.brand_rank = brand_rank
+
+        self._cache = {}
+        self._cache_lock = threading.Lock()
+        self._avg_field_lengths = avg_field_lengths
+        self._fuzzy_index = None
+        # Optional token postings, built for snapshots (see build_token_indexes)
+        self.title_tokens = None
+        self.description_tokens = None
+
+    @classmethod
+    def build(cls, version: int, ids: array, prices: array, titles: list, descriptions: list,
+              image_urls: list, product_urls: list, brands: list, categories: list,
+              colors: list, platforms: list) -> "CatalogReplica":
+        """Derive the encoded columns, normalized text and sort orders from raw columns"""
+        size = len(ids)
+        brand = EncodedColumn.from_values(brands)
+        category = EncodedColumn.from_values(categories)
+
+        title_text = PackedText.from_strings(remove_accents((t or "").lower()) for t in titles)
+        description_text = PackedText.from_strings(remove_accents((d or "").lower()) for d in descriptions)
+        smart_text = PackedText.from_strings(
+            f"{titles[row] or ''} {descriptions[row] or ''} {category.value(row) or ''}".lower()
+            for row in range(size)
+        )
+
+        # Python's stable sort keeps id order between ties
+        price_desc_order = array("i", sorted(range(size), key=lambda row: -prices[row]))
+        brand_order = array("i", sorted(range(size), key=lambda row: brand.value(row) or ""))
+        ranked_codes = sorted(range(len(brand.values)), key=lambda code: brand.values[code] or "")
+        brand_rank = array("i", bytes(4 * len(ranked_codes)))
+        for rank, code in enumerate(ranked_codes):
+            brand_rank[code] = rank
+
+        return cls(
+            version, ids, prices, titles, descriptions, image_urls, product_urls,
+            brand, category, EncodedColumn.from_values(colors), EncodedColumn.from_values(platforms),
+            title_text, description_text, smart_text,
+            PriceIndex.build(prices), price_desc_order, brand_order, brand_rank,
+        )
+
+    def build_token_indexes(self):
+        """Token postings for brand+title and description; predicates then skip text scans"""
+        if self.title_tokens is None:
+            brand_folded, brand_codes = self.brand.folded, self.brand.codes
+            self.title_tokens = TokenIndex.build(
+                self.size, lambda row: brand_folded[brand_codes[row]].split() + self.title_text.row_text(row).split()
+            )
+        if self.description_tokens is None:
+            self.description_tokens = TokenIndex.build(
+                self.size, lambda row: self.description_text.row_text(row).split()
+            )
+
+    def avg_field_lengths(self) -> dict:
+        """Mean token counts per searchable field, for BM25 length normalization"""
+        if self._avg_field_lengths is None:
+            brand_tokens = sum(
+                token_count(folded) * len(rows) for folded, rows in zip(self.brand.folded, self.brand.postings)
+            )
+            self._avg_field_lengths = {
+                "brand": brand_tokens / self.size if self.size else 0.0,
+                "title": self.title_text.average_tokens(),
+                "description": self.description_text.average_tokens(),
+            }
+        return self._avg_field_lengths
+
+    @classmethod
+    def load(cls, db: Session, version: int) -> "CatalogReplica":
+        """Read the products table column by column (no ORM objects) in id order"""
+        ids, prices = array("q"), array("d")
+        columns = {field: [] for field in PRODUCT_FIELDS if field not in ("id", "price")}
+
+        query = db.query(*(getattr(Product, field) for field in PRODUCT_FIELDS))
+        for row in query.order_by(Product.id).yield_per(LOAD_BATCH_SIZE):
+            values = dict(zip(PRODUCT_FIELDS, row))
+            ids.append(values["id"])
+            prices.append(values["price"] or 0.0)
+            for field, column in columns.items():
+                column.append(values[field])
+
+        return cls.build(
+            version, ids, prices,
+            titles=columns["title"], descriptions=columns["description"],
+            image_urls=columns["image_url"], product_urls=columns["product_url"],
+            brands=columns["brand"], categories=columns["category"],
+            colors=columns["color"], platforms=columns["platform_name"],
+        )
+
+    # --- predicate bitmaps -------------------------------------------------
+
+    def _cached(self, key, compute) -> int:
+        bitmap = self._cache.get(key)
+        if bitmap is None:
+            bitmap = compute()
+            with self._cache_lock:
+                if len(self._cache) >= PREDICATE_CACHE_SIZE:
+                    self._cache.pop(next(iter(self._cache)))
+                self._cache[key] = bitmap
+        return bitmap
+
+    def cached_bitmap(self, key):
+        """Previously computed predicate bitmap, or None"""
+        return self._cache.get(key)
+
+    def brand_or_title_rows(self, needle: str) -> int:
+        """Accent-folded needle found in the brand or the title"""
+        def compute():
+            if self.title_tokens is not None and is_token_needle(needle):
+                return self.title_tokens.rows_containing(needle, self.size)
+            return self.brand.rows_containing(needle, self.size, folded=True) | self.title_text.rows_containing(needle)
+
+        return self._cached(("brand_or_title", needle), compute)
+
+    def any_field_rows(self, needle: str) -> int:
+        """Accent-folded needle found in the title, brand or description"""
+        def compute():
+            if self.description_tokens is not None and is_token_needle(needle):
+                return self.brand_or_title_rows(needle) | self.description_tokens.rows_containing(needle, self.size)
+            return self.brand_or_title_rows(needle) | self.description_text.rows_containing(needle)
+
+        return self._cached(("any_field", needle), compute)
+
+    def smart_category_rows(self, search_term: str) -> int:
+        """Bitmap equivalent of smart_category_match"""
+        if not search_term:
+            return self.all_rows
+        search_lower = search_term.lower().strip()
+
+        def compute():
+            terms_to_find = ALL_CATEGORY_TERMS.get(search_lower, [search_lower])
+            bitmap = 0
+            for term in terms_to_find:
+                bitmap |= self._cached(("smart_text", term), lambda: self.smart_text.rows_containing(term))
+            return bitmap
+
+        return self._cached(("smart_category", search_lower), compute)
+
+    def facet_rows(self, name: str, needle: str) -> int:
+        """Lowercased needle found in the color or platform column"""
+        column = self.color if name == "color" else self.platform
+        return self._cached((name, needle), lambda: column.rows_containing(needle, self.size))
+
+    def spelling_corrections(self, q=None, brand=None) -> dict:
+        """Rewrite q/brand words that match nothing to the nearest known brand or category term"""
+        if not (q or brand):
+            return {}
+        if self._fuzzy_index is None:
+            self._fuzzy_index = build_index({
+                value: len(rows) for value, rows in zip(self.brand.values, self.brand.postings) if value
+            })
+        return spelling_corrections(
+            q, brand, self._fuzzy_index,
+            any_field_hits=lambda word: bool(self.any_field_rows(word)),
+            brand_hits=lambda word: bool(self.brand_or_title_rows(word)),
+        )
+
+    # --- ordering and output -----------------------------------------------
+
+    def top_rows(self, bitmap: int, sort_by: str = "id", limit=None, q=None) -> list:
+        """First `limit` matching rows in sort_by order"""
+        if limit is None:
+            limit = self.size
+        if limit <= 0 or not bitmap:
+            return []
+
+        if sort_by == "relevance" and q and q.strip():
+            return self.ranked_rows(bitmap, q, limit)
+
+        prices, codes, brand_rank = self.prices, self.brand.codes, self.brand_rank
+        if sort_by == "price_asc":
+            order, key = self.price_index.order, lambda row: (prices[row], row)
+        elif sort_by == "price_desc":
+            order, key = self.price_desc_order, lambda row: (-prices[row], row)
+        elif sort_by == "brand":
+            order, key = self.brand_order, lambda row: (brand_rank[codes[row]], row)
+        else:
+            # default is id order, which is row order
+            return list(islice(iter_rows(bitmap), limit))
+
+        # Sparse matches: heap-select from the candidates in O(m log k).
+        # Dense matches: walking the presorted order stops after about k * n / m rows.
+        matched = bitmap.bit_count()
+        if matched * max(limit.bit_length(), 1) < limit * self.size // matched:
+            return heapq.nsmallest(limit, iter_rows(bitmap), key=key)
+
+        # Walk the precomputed order and keep matching rows until the page is full
+        digits = bitmap_digits(bitmap)
+        width = len(digits)
+        rows = []
+        for row in order:
+            if row < width and digits[row] == "1":
+                rows.append(row)
+                if len(rows) >= limit:
+                    break
+        return rows
+
+    def relevance_scorer(self, q: str) -> RelevanceScorer:
+        """Scorer whose document frequencies come from the cached term bitmaps"""
+        return RelevanceScorer(
+            q, self.size, self.avg_field_lengths(),
+            document_frequency=lambda term: self.any_field_rows(term).bit_count()
+        )
+
+    def ranked_rows(self, bitmap: int, q: str, limit: int) -> list:
+        """Top `limit` rows by relevance, keeping only a k-sized heap of candidates"""
+        scorer = self.relevance_scorer(q)
+        brand_folded, brand_codes = self.brand.folded, self.brand.codes
+
+        def score(row):
+            fields = {
+                "brand": brand_folded[brand_codes[row]],
+                "title": self.title_text.row_text(row),
+                "description": self.description_text.row_text(row),
+            }
+            return scorer.score(fields, self.smart_text.row_text(row))
+
+        # nlargest is stable, so equal scores stay in id order
+        return heapq.nlargest(limit, iter_rows(bitmap), key=score)
+
+    def to_dicts(self, rows, fields=None) -> list:
+        """Output dicts for rows; fields (a PRODUCT_FIELDS subset, in order) limits the keys"""
+        if fields is None or len(fields) == len(PRODUCT_FIELDS):
+            return [
+                {
+                    "id": self.ids[row],
+                    "title": self.titles[row],
+                    "brand": self.brand.value(row),
+                    "category": self.category.value(row),
+                    "color": self.color.value(row),
+                    "description": self.descriptions[row],
+                    "price": self.prices[row],
+                    "image_url": self.image_urls[row],
+                    "platform_name": self.platform.value(row),
+                    "product_url": self.product_urls[row],
+                }
+                for row in rows
+            ]
+        getters = {
+            "id": self.ids.__getitem__,
+            "title": self.titles.__getitem__,
+            "brand": self.brand.value,
+            "category": self.category.value,
+            "color": self.color.value,
+            "description": self.descriptions.__getitem__,
+            "price": self.prices.__getitem__,
+            "image_url": self.image_urls.__getitem__,
+            "platform_name": self.platform.value,
+            "product_url": self.product_urls.__getitem__,
+        }
+        selected = [(name, getters[name]) for name in fields]
+        return [{name: get(row) for name, get in selected} for row in rows]
+
+
+class CatalogStore:
+    """Holds the current replica and swaps in a fresh one when the catalog version moves"""
+
+    def __init__(self, enabled: bool = CATALOG_STORE_ENABLED, loader=None):
+        self.enabled = enabled
+        # loader(db, version) -> CatalogReplica; catalog_snapshot swaps in a shared mmap loader
+        self.loader = loader or CatalogReplica.load
+        self._replica = None
+        self._lock = threading.Lock()
+
+    def get_replica(self, db: Session) -> CatalogReplica:
+        version = get_catalog_version(db)
+        replica = self._replica
+        if replica is not None and replica.version == version:
+            return replica
+
+        with self._lock:
+            replica = self._replica
+            if replica is None or replica.version != version:
+                replica = self.loader(db, version)
+                self._replica = replica
+        return replica
+
+
+catalog_store = CatalogStore()
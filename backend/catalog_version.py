@@ -0,0 +1,102 @@
+"""
+Catalog version counter
+
+Every write to the products table bumps a single counter row so that
+read-side caches (the in-memory catalog store, HTTP ETags) know when to refresh.
+"""
+
+import os
+import threading
+import time
+import uuid
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from database import SessionLocal
+from models.catalog_instance import CatalogInstance
+from models.catalog_state import CatalogState
+
+CATALOG_STATE_ID = 1
+# How long a worker trusts its last read of the counter (writes in other workers show up within this)
+VERSION_CACHE_TTL = float(os.getenv("RETROFY_VERSION_CACHE_TTL", "1.0"))
+
+
+def get_catalog_version(db: Session) -> int:
+    """Current catalog version (0 if the catalog has never been written)"""
+    version = db.query(CatalogState.version).filter(CatalogState.id == CATALOG_STATE_ID).scalar()
+    return version or 0
+
+
+def get_catalog_instance(db: Session) -> str:
+    """
+    Random id of this database, created on first use. Versions only order writes
+    within one database; shared files keyed by version also carry this id.
+    """
+    instance_id = db.query(CatalogInstance.instance_id).filter(CatalogInstance.id == CATALOG_STATE_ID).scalar()
+    if instance_id is not None:
+        return instance_id
+    # Own session: never commits the caller's transaction
+    creator = SessionLocal()
+    try:
+        creator.add(CatalogInstance(id=CATALOG_STATE_ID, instance_id=uuid.uuid4().hex[:16]))
+        creator.commit()
+    except IntegrityError:
+        # Another worker created it first
+        creator.rollback()
+    finally:
+        creator.close()
+    return db.query(CatalogInstance.instance_id).filter(CatalogInstance.id == CATALOG_STATE_ID).scalar()
+
+
+def bump_catalog_version(db: Session) -> int:
+    """
+    Increment the catalog version inside the caller's transaction and return
+    the new version. The caller is responsible for committing.
+    """
+    updated = db.query(CatalogState).filter(CatalogState.id == CATALOG_STATE_ID).update(
+        {CatalogState.version: CatalogState.version + 1},
+        synchronize_session=False
+    )
+    if not updated:
+        db.add(CatalogState(id=CATALOG_STATE_ID, version=1))
+        db.flush()
+    catalog_version_cache.invalidate()
+    return get_catalog_version(db)
+
+
+class CatalogVersionCache:
+    """Process-local copy of the catalog version, re-read from the database at most once per ttl"""
+
+    def __init__(self, ttl: float = VERSION_CACHE_TTL):
+        self.ttl = ttl
+        self._version = None
+        self._read_at = 0.0
+        self._lock = threading.Lock()
+
+    def peek(self):
+        """The cached version if still fresh, else None (never touches the database)"""
+        if self._version is not None and time.monotonic() - self._read_at < self.ttl:
+            return self._version
+        return None
+
+    def get(self) -> int:
+        version = self.peek()
+        if version is not None:
+            return version
+        with self._lock:
+            version = self.peek()
+            if version is None:
+                db = SessionLocal()
+                try:
+                    version = get_catalog_version(db)
+                finally:
+                    db.close()
+                self._version, self._read_at = version, time.monotonic()
+        return version
+
+    def invalidate(self):
+        """Called on writes in this process so the next read goes to the database"""
+        self._version = None
+
+
+catalog_version_cache = CatalogVersionCache()
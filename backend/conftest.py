@@ -0,0 +1,5 @@
+import os
+import tempfile
+
+# Tests run against a scratch database, set before any module creates the engine
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "test.db")
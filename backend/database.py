@@ -1,7 +1,10 @@
+import os
+
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 
-DATABASE_URL = "sqlite:///./retrofy.db"
+# Overridable so benchmarks and tests can point the API at a scratch database
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./retrofy.db")
 
 # Create SQLAlchemy engine
 engine = create_engine(DATABASE_URL)
@@ -5,6 +5,7 @@ Updates all products where brand="0" with the correct brand extracted from title
 
 from models.product import Product
 from database import SessionLocal
+from catalog_version import bump_catalog_version
 import re
 
 # Your luxury brands list (from the scraper)
@@ -86,6 +87,7 @@ def fix_brands():
             fixed_count += 1
         
         # Commit all changes
+        bump_catalog_version(db)
         db.commit()
         print(f"\n🎉 Successfully fixed {fixed_count} products!")
         print("✅ All brands updated in database")
@@ -0,0 +1,187 @@
+"""
+Typo-tolerant term lookup (SymSpell-style deletion index)
+
+Every vocabulary word is indexed under all of its deletions up to the max edit
+distance. A lookup generates the deletions of the misspelled term, so finding
+candidates is a handful of dict probes instead of a scan over the vocabulary.
+"""
+
+import re
+
+from fix_brands import LUXURY_BRANDS
+from search_logic import remove_accents, ALL_CATEGORY_TERMS, SMART_CATEGORY_TERMS
+
+MAX_EDIT_DISTANCE = 2
+# Terms shorter than this are too ambiguous to correct
+MIN_CORRECTION_LENGTH = 4
+LOOKUP_CACHE_SIZE = 10000
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def vocabulary_words(text: str) -> list:
+    """Lowercased, accent-folded words of a vocabulary entry"""
+    return WORD_PATTERN.findall(remove_accents((text or "").lower()))
+
+
+def max_distance_for(term: str) -> int:
+    return 1 if len(term) <= 5 else MAX_EDIT_DISTANCE
+
+
+def _deletes(word: str, max_distance: int) -> set:
+    results = {word}
+    frontier = {word}
+    for _ in range(max_distance):
+        frontier = {
+            candidate[:i] + candidate[i + 1:]
+            for candidate in frontier if len(candidate) > 1
+            for i in range(len(candidate))
+        }
+        results |= frontier
+    return results
+
+
+def edit_distance(a: str, b: str, max_distance: int) -> int:
+    """Optimal string alignment distance; returns max_distance + 1 once it is exceeded"""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous_previous = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous_previous[j - 2] + 1)
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous_previous, previous = previous, current
+    return previous[-1]
+
+
+class FuzzyIndex:
+    """Deletion index over a weighted vocabulary"""
+
+    def __init__(self, max_distance: int = MAX_EDIT_DISTANCE):
+        self.max_distance = max_distance
+        self.counts = {}
+        self.deletes = {}
+        self._lookups = {}
+
+    def add(self, word: str, count: int = 1):
+        if word in self.counts:
+            self.counts[word] += count
+            return
+        self.counts[word] = count
+        self._lookups.clear()
+        for deletion in _deletes(word, self.max_distance):
+            self.deletes.setdefault(deletion, []).append(word)
+
+    def copy(self) -> "FuzzyIndex":
+        clone = FuzzyIndex(self.max_distance)
+        clone.counts = dict(self.counts)
+        clone.deletes = {key: list(words) for key, words in self.deletes.items()}
+        return clone
+
+    def lookup(self, term: str):
+        """Closest known word (smallest distance, then most frequent), or None"""
+        if term in self.counts:
+            return term
+        if term in self._lookups:
+            return self._lookups[term]
+        max_distance = min(self.max_distance, max_distance_for(term))
+        best, best_key = None, None
+        for deletion in _deletes(term, max_distance):
+            for word in self.deletes.get(deletion, ()):
+                distance = edit_distance(term, word, max_distance)
+                if distance > max_distance:
+                    continue
+                key = (distance, -self.counts[word], word)
+                if best_key is None or key < best_key:
+                    best, best_key = word, key
+        if len(self._lookups) >= LOOKUP_CACHE_SIZE:
+            self._lookups.clear()
+        self._lookups[term] = best
+        return best
+
+
+def build_static_index() -> FuzzyIndex:
+    """Index over the known luxury brands and the smart category vocabulary"""
+    index = FuzzyIndex()
+    entries = list(LUXURY_BRANDS) + list(SMART_CATEGORY_TERMS)
+    for key, synonyms in ALL_CATEGORY_TERMS.items():
+        entries.append(key)
+        entries.extend(synonyms)
+    for entry in entries:
+        for word in vocabulary_words(entry):
+            if len(word) >= MIN_CORRECTION_LENGTH:
+                index.add(word)
+    return index
+
+
+STATIC_INDEX = build_static_index()
+
+
+def build_index(brand_counts: dict) -> FuzzyIndex:
+    """Static vocabulary plus the catalog's brands weighted by product count"""
+    index = STATIC_INDEX.copy()
+    for brand, count in brand_counts.items():
+        for word in vocabulary_words(brand):
+            if len(word) >= MIN_CORRECTION_LENGTH:
+                index.add(word, count)
+    return index
+
+
+def correct_query(q: str, index: FuzzyIndex, has_hits):
+    """
+    Rewrite the words of q that match nothing in the catalog to their nearest
+    known term. has_hits(folded_word) tells whether a word matches anything.
+    Returns the corrected query, or None when nothing was changed.
+    """
+    if not q:
+        return None
+    changed = False
+    words = []
+    for word in q.strip().lower().split():
+        folded = remove_accents(word)
+        if len(folded) >= MIN_CORRECTION_LENGTH and not has_hits(folded):
+            suggestion = index.lookup(folded)
+            if suggestion and suggestion != folded:
+                word = suggestion
+                changed = True
+        words.append(word)
+    return " ".join(words) if changed else None
+
+
+def spelling_corrections(q, brand, index: FuzzyIndex, any_field_hits, brand_hits) -> dict:
+    """Corrected values for the q and brand parameters, keyed by parameter name"""
+    corrections = {}
+    corrected_q = correct_query(q, index, any_field_hits)
+    if corrected_q:
+        corrections["q"] = corrected_q
+    corrected_brand = correct_query(brand, index, brand_hits)
+    if corrected_brand:
+        corrections["brand"] = corrected_brand
+    return corrections
+
+
+def product_spelling_corrections(q, brand, products) -> dict:
+    """SQL-backed variant: vocabulary and hit checks come from already loaded products"""
+    if not (q or brand):
+        return {}
+    brand_counts = {}
+    brand_texts, any_texts = [], []
+    for product in products:
+        if product.brand:
+            brand_counts[product.brand] = brand_counts.get(product.brand, 0) + 1
+        brand_title = remove_accents(f"{product.brand or ''}\n{product.title or ''}".lower())
+        brand_texts.append(brand_title)
+        if q:
+            # Only q needs descriptions (a deferred column on the SQL path)
+            any_texts.append(brand_title + "\n" + remove_accents((product.description or "").lower()))
+    return spelling_corrections(
+        q, brand, build_index(brand_counts),
+        any_field_hits=lambda word: any(word in text for text in any_texts),
+        brand_hits=lambda word: any(word in text for text in brand_texts),
+    )
@@ -0,0 +1,124 @@
+"""
+Conditional GET for catalog reads
+
+Catalog responses only change when the catalog version moves, so their ETag is
+the version plus a digest of the request URL. ConditionalGetMiddleware compares
+If-None-Match against it before the endpoint runs and answers 304 from the
+process-local version cache, without a database query or any serialization.
+Misses run the endpoint and get ETag and Cache-Control headers on the 200.
+
+/products/{product_id} is keyed on the catalog version as well (products have
+no updated_at): any write revalidates it, and revalidation stays free.
+
+Cache-Control per route template is CACHE_CONTROL, overridable with
+RETROFY_CACHE_CONTROL='{"/products": "no-cache", "/products/suggest": "public, max-age=60"}'.
+Routes without a policy are passed through untouched. That includes routes whose
+result depends on the wall clock (/products/price-drops: "the last N hours"),
+since the catalog version would keep validating a window that has moved on.
+
+Endpoints report failures and missing products as a 200 {"error": ...} body:
+those responses get Cache-Control: no-store and no ETag, so shared caches never
+hold on to them.
+"""
+
+import hashlib
+import json
+import os
+
+from starlette.concurrency import run_in_threadpool
+from starlette.routing import Match
+
+from catalog_version import catalog_version_cache
+
+CACHE_CONTROL = {
+    "/products": "public, max-age=30, stale-while-revalidate=60",
+    "/products/search": "public, max-age=30, stale-while-revalidate=60",
+    "/products/filters": "public, max-age=300, stale-while-revalidate=600",
+    "/products/{product_id}": "public, max-age=300",
+    "/products/{product_id}/similar": "public, max-age=300",
+    "/products/{product_id}/price-history": "public, max-age=300",
+}
+CACHE_CONTROL.update(json.loads(os.getenv("RETROFY_CACHE_CONTROL", "{}")))
+
+
+def catalog_etag(version: int, path: str, query_string: bytes) -> str:
+    digest = hashlib.blake2b(path.encode() + b"?" + query_string, digest_size=8).hexdigest()
+    return f'"v{version}-{digest}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match uses weak comparison: W/ prefixes are ignored"""
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (tag.strip() for tag in if_none_match.split(","))
+    return any((tag[2:] if tag.startswith("W/") else tag) == etag for tag in candidates)
+
+
+def is_error_body(body: bytes) -> bool:
+    """Endpoints report failures and missing products as 200 {"error": ...}; those must not be cached"""
+    return body.lstrip()[:9] == b'{"error":'
+
+
+class ConditionalGetMiddleware:
+    """ASGI middleware adding catalog-version ETags and answering If-None-Match with 304"""
+
+    def __init__(self, app, routes, policies: dict = None):
+        self.app = app
+        self.routes = routes
+        self.policies = CACHE_CONTROL if policies is None else policies
+
+    def _match(self, scope):
+        """(Cache-Control policy, endpoint) for the route serving this request"""
+        for route in self.routes:
+            match, child_scope = route.matches(scope)
+            if match == Match.FULL:
+                return self.policies.get(getattr(route, "path", None)), child_scope.get("endpoint")
+        return None, None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        cache_control, endpoint = self._match(scope)
+        # Admin requests (profiling) are per-caller and must not land in shared caches
+        if cache_control is None or b"x-admin-token" in headers:
+            await self.app(scope, receive, send)
+            return
+
+        version = catalog_version_cache.peek()
+        if version is None:
+            version = await run_in_threadpool(catalog_version_cache.get)
+        etag = catalog_etag(version, scope["path"], scope.get("query_string", b""))
+        validator_headers = [(b"etag", etag.encode()), (b"cache-control", cache_control.encode())]
+
+        if_none_match = headers.get(b"if-none-match")
+        if if_none_match and etag_matches(if_none_match.decode("latin-1"), etag):
+            # The router never runs; record the endpoint for MetricsMiddleware's route label
+            scope["endpoint"] = endpoint
+            await send({"type": "http.response.start", "status": 304, "headers": validator_headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        # A 200 may still carry {"error": ...}: hold the start message until the body shows which it is
+        held_start = []
+
+        async def send_with_validators(message):
+            if message["type"] == "http.response.start" and message["status"] == 200:
+                held_start.append(message)
+                return
+            if message["type"] == "http.response.body" and held_start:
+                start = held_start.pop()
+                headers = list(start.get("headers", []))
+                existing = {name.lower() for name, _ in headers}
+                if is_error_body(message.get("body", b"")):
+                    start["headers"] = [header for header in headers if header[0].lower() != b"cache-control"] + [
+                        (b"cache-control", b"no-store")
+                    ]
+                else:
+                    start["headers"] = headers + [header for header in validator_headers if header[0] not in existing]
+                await send(start)
+            await send(message)
+
+        await self.app(scope, receive, send_with_validators)
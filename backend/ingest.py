@@ -0,0 +1,306 @@
+"""
+Catalog ingestion
+
+insert_products() / publish_catalog_change() are the write path for new products:
+seed_products calls them inline, and IngestionQueue calls them from a background
+thread so large imports return a job id immediately instead of holding the request.
+
+The queue has one writer thread, so jobs are applied in submission order and never
+compete with each other for the database write lock. The queue is per process:
+with several uvicorn workers, jobs submitted to different workers run concurrently
+and only SQLite's write lock orders them. At most MAX_QUEUED_JOBS
+batches wait in memory; beyond that submit() raises QueueFull and the API answers
+503 with Retry-After. Job progress lives in the ingest_jobs table, so any worker
+process can report on it.
+
+Streaming uploads (ingest_chunk) take the other route: the client sends
+gzip-compressed NDJSON chunks of a fixed size, each with an Idempotency-Key.
+NdjsonDecoder inflates and parses the body as it arrives, and each chunk is
+inserted in one transaction together with its key, so a retried chunk is
+acknowledged without being inserted twice. Keys are only remembered for
+IDEMPOTENCY_WINDOW_HOURS (clients salt them with a per-run id as well), so a
+later re-sync that happens to send identical chunks is inserted again.
+"""
+
+import json
+import logging
+import os
+import queue
+import threading
+import uuid
+import zlib
+from datetime import datetime, timedelta
+
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from catalog_version import bump_catalog_version
+from database import SessionLocal
+from models.ingest_chunk import IngestChunk
+from models.ingest_job import IngestJob
+from models.product import Product
+from near_duplicates import assign_clusters
+from percolator import record_matches
+from price_tracking import record_price_changes
+from similar_index import similar_index
+from schemas.product import ProductCreate
+from suggest_index import suggest_index
+
+logger = logging.getLogger(__name__)
+
+# Rows inserted (and committed, with a progress update) per step of a job
+INGEST_CHUNK_SIZE = 1000
+MAX_QUEUED_JOBS = int(os.getenv("RETROFY_INGEST_QUEUE_SIZE", "8"))
+RETRY_AFTER_SECONDS = 5
+# Decompressed size limit for one streamed chunk (also caps gzip bombs)
+MAX_CHUNK_BYTES = 32 * 1024 * 1024
+# How long an Idempotency-Key is remembered: the retry window, not forever
+IDEMPOTENCY_WINDOW_HOURS = float(os.getenv("RETROFY_IDEMPOTENCY_WINDOW_HOURS", "24"))
+
+
+class QueueFull(Exception):
+    """Too many ingestion jobs are waiting; the client should retry later"""
+
+
+class ChunkRejected(ValueError):
+    """A streamed chunk is malformed or too large; retrying it will not help"""
+
+
+def insert_products(db: Session, products: list) -> list:
+    """
+    Bulk insert product dicts (ProductCreate fields) without building ORM objects.
+    Returns the new ids; saved-search matches, near-duplicate clusters and price changes
+    are recorded in the same transaction.
+    """
+    if not products:
+        return []
+    ids = db.scalars(insert(Product).returning(Product.id, sort_by_parameter_order=True), products).all()
+    record_matches(db, ids, products)
+    assign_clusters(db, ids, products)
+    record_price_changes(db, ids, products)
+    return ids
+
+
+def apply_added_products(new_version: int, ids: list, products: list):
+    """Apply committed inserts to the in-memory indexes kept current by deltas"""
+    suggest_index.apply_change(new_version, added=[(p["brand"], p["title"]) for p in products])
+    similar_index.apply_change(new_version, added=list(zip(ids, products)))
+
+
+def publish_catalog_change(db: Session, added: list, added_ids: list) -> int:
+    """Bump the catalog version, commit, and apply the added products to the in-memory indexes"""
+    new_version = bump_catalog_version(db)
+    db.commit()
+    apply_added_products(new_version, added_ids, added)
+    return new_version
+
+
+class NdjsonDecoder:
+    """Incrementally inflate (if gzipped) and parse an NDJSON body into product dicts"""
+
+    def __init__(self, gzipped: bool = False, max_bytes: int = MAX_CHUNK_BYTES):
+        # wbits 16 + MAX_WBITS: expect a gzip header and trailer
+        self._inflater = zlib.decompressobj(16 + zlib.MAX_WBITS) if gzipped else None
+        self._remaining = max_bytes
+        self._pending = b""
+        self.line_number = 0
+        self.products = []
+
+    def feed(self, data: bytes):
+        if self._inflater is not None:
+            try:
+                data = self._inflater.decompress(data, self._remaining + 1)
+            except zlib.error as e:
+                raise ChunkRejected(f"Invalid gzip body: {e}")
+        self._remaining -= len(data)
+        if self._remaining < 0:
+            raise ChunkRejected("Chunk too large")
+
+        lines = (self._pending + data).split(b"\n")
+        self._pending = lines.pop()
+        for line in lines:
+            self._parse(line)
+
+    def close(self) -> list:
+        """Finish the body (a final line without a newline is accepted) and return the products"""
+        if self._inflater is not None and not self._inflater.eof:
+            raise ChunkRejected("Truncated gzip body")
+        self._parse(self._pending)
+        self._pending = b""
+        return self.products
+
+    def _parse(self, line: bytes):
+        self.line_number += 1
+        if not line.strip():
+            return
+        try:
+            self.products.append(ProductCreate(**json.loads(line)).dict())
+        except (ValueError, TypeError, ValidationError) as e:
+            raise ChunkRejected(f"Line {self.line_number}: {e}")
+
+
+def ingest_chunk(db: Session, products: list, idempotency_key: str = None) -> dict:
+    """
+    Insert one streamed chunk and publish it. With an idempotency key the key is
+    committed in the same transaction, so a replay reports the original result.
+    """
+    if idempotency_key:
+        # Forget keys past the retry window (this one included) before looking it up
+        cutoff = datetime.utcnow() - timedelta(hours=IDEMPOTENCY_WINDOW_HOURS)
+        db.query(IngestChunk).filter(IngestChunk.created_at < cutoff).delete(synchronize_session=False)
+        seen = db.get(IngestChunk, idempotency_key)
+        if seen is not None:
+            return {"accepted": seen.rows, "duplicate": True, "catalog_version": seen.catalog_version}
+
+    ids = insert_products(db, products)
+    new_version = bump_catalog_version(db)
+    if idempotency_key:
+        db.add(IngestChunk(
+            key=idempotency_key, rows=len(products), catalog_version=new_version, created_at=datetime.utcnow()
+        ))
+    try:
+        db.commit()
+    except IntegrityError:
+        # The same key committed concurrently (a retry racing the original request)
+        db.rollback()
+        seen = db.get(IngestChunk, idempotency_key)
+        return {"accepted": seen.rows, "duplicate": True, "catalog_version": seen.catalog_version}
+
+    apply_added_products(new_version, ids, products)
+    return {"accepted": len(products), "duplicate": False, "catalog_version": new_version}
+
+
+def job_status(job: IngestJob) -> dict:
+    elapsed = None
+    if job.started_at:
+        elapsed = ((job.finished_at or datetime.utcnow()) - job.started_at).total_seconds()
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "total": job.total,
+        "processed": job.processed,
+        "progress": round(job.processed / job.total, 4) if job.total else 1.0,
+        "rows_per_second": round(job.processed / elapsed, 1) if elapsed else None,
+        "error": job.error,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+
+
+class IngestionQueue:
+    """Bounded FIFO of product batches applied by a single background writer"""
+
+    def __init__(self, on_catalog_change=None, max_queued: int = MAX_QUEUED_JOBS):
+        # Called from the writer thread after each job that changed the catalog
+        self.on_catalog_change = on_catalog_change
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._worker = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_worker(self):
+        with self._start_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="ingestion-worker", daemon=True)
+                self._worker.start()
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def submit(self, products: list) -> str:
+        """Record a queued job and hand the batch to the writer; raises QueueFull"""
+        if self._queue.full():
+            raise QueueFull()
+        job_id = uuid.uuid4().hex
+        db = SessionLocal()
+        try:
+            db.add(IngestJob(id=job_id, status="queued", total=len(products), created_at=datetime.utcnow()))
+            db.commit()
+        finally:
+            db.close()
+
+        try:
+            self._queue.put_nowait((job_id, products))
+        except queue.Full:
+            self._finish(job_id, "failed", error="Ingestion queue is full")
+            raise QueueFull()
+        self._ensure_worker()
+        return job_id
+
+    def _run(self):
+        while True:
+            job_id, products = self._queue.get()
+            try:
+                self._apply(job_id, products)
+            except Exception:
+                # One bad job must never stop the writer: later jobs would stay queued
+                logger.exception("Ingestion job %s crashed the writer loop", job_id)
+            finally:
+                self._queue.task_done()
+
+    def _apply(self, job_id: str, products: list):
+        db = SessionLocal()
+        inserted = 0
+        ids = []
+        try:
+            job = db.get(IngestJob, job_id)
+            job.status = "running"
+            job.started_at = datetime.utcnow()
+            db.commit()
+
+            # Commit per chunk so progress is visible and the write lock is released between chunks
+            for start in range(0, len(products), INGEST_CHUNK_SIZE):
+                chunk = products[start:start + INGEST_CHUNK_SIZE]
+                ids.extend(insert_products(db, chunk))
+                job.processed = start + len(chunk)
+                db.commit()
+                inserted = job.processed
+
+            job.status = "succeeded"
+            job.finished_at = datetime.utcnow()
+            publish_catalog_change(db, products, ids)
+        except Exception as e:
+            db.rollback()
+            logger.warning("Ingestion job %s failed after %d rows: %s", job_id, inserted, e)
+            self._finish(job_id, "failed", error=str(e))
+            if inserted:
+                # Rows from earlier chunks are committed; make readers pick them up
+                try:
+                    bump_catalog_version(db)
+                    db.commit()
+                except Exception:
+                    # Likely the same lock that failed the job; the next write's bump covers these rows
+                    db.rollback()
+                    logger.exception("Could not bump the catalog version after job %s failed", job_id)
+        finally:
+            db.close()
+
+        if inserted and self.on_catalog_change is not None:
+            self.on_catalog_change()
+
+    def _finish(self, job_id: str, status: str, error=None):
+        db = SessionLocal()
+        try:
+            job = db.get(IngestJob, job_id)
+            if job is not None:
+                job.status = status
+                job.error = error
+                job.finished_at = datetime.utcnow()
+                db.commit()
+        except Exception:
+            db.rollback()
+            logger.exception("Could not mark ingestion job %s %s", job_id, status)
+        finally:
+            db.close()
+
+
+def get_job(db: Session, job_id: str):
+    job = db.get(IngestJob, job_id)
+    return job_status(job) if job else None
+
+
+def recent_jobs(db: Session, limit: int = 20) -> list:
+    jobs = db.query(IngestJob).order_by(IngestJob.created_at.desc()).limit(limit).all()
+    return [job_status(job) for job in jobs]
@@ -1,360 +1,192 @@
-from fastapi import FastAPI, Query, status
+from fastapi import FastAPI, Query, Request, Header, BackgroundTasks, status
 from models.product import Product
-from schemas.product import ProductCreate
+from schemas.product import ProductCreate, ProductBatchRequest, MultiSearchRequest
+from schemas.saved_search import SavedSearchCreate
+from models.saved_search import SavedSearch
+from models.saved_search_match import SavedSearchMatch
+from models.ingest_chunk import IngestChunk
 from database import Base, engine, SessionLocal
 from typing import List, Optional
-from fastapi.encoders import jsonable_encoder
-from fastapi.responses import JSONResponse
-from sqlalchemy.orm import Session
-import unicodedata
-
-
-def remove_accents(text: str) -> str:
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import func
+from sqlalchemy.orm import Session, undefer_group
+import heapq
+from datetime import datetime, timedelta
+import threading
+from search_logic import updated_search_logic, filters_match, SMART_CATEGORY_TERMS
+from catalog_store import CatalogReplica, catalog_store
+from catalog_snapshot import SNAPSHOT_DIR, SharedSnapshotLoader
+from query_planner import plan_query
+from percolator import percolator
+from product_fields import MAX_BATCH_IDS, parse_fields, load_filter_rows, hydrate_products, fetch_rows_by_id
+from catalog_export import EXPORT_FORMATS, export_chunks, export_upper_bound
+from catalog_version import bump_catalog_version, get_catalog_version
+from ingest import (
+    IngestionQueue, QueueFull, RETRY_AFTER_SECONDS, insert_products, publish_catalog_change, get_job, recent_jobs,
+    ChunkRejected, NdjsonDecoder, ingest_chunk
+)
+from search_ranking import RelevanceScorer
+from fuzzy_index import product_spelling_corrections
+from suggest_index import suggest_index
+from similar_index import similar_index
+from price_tracking import price_timeline, recent_drops
+from near_duplicates import collapse_duplicates, remove_products as remove_cluster_rows
+import metrics
+from metrics import StageTimer, record_rows
+from http_cache import ConditionalGetMiddleware
+from admission import admission_controlled
+from profiler import profiled, require_admin, sample_stacks, collapsed_stacks
+
+
+# Sort keys for /products/search; the trailing id keeps ties in id order
+SORT_KEYS = {
+    "price_asc": lambda x: (x.price or 0, x.id),
+    "price_desc": lambda x: (-(x.price or 0), x.id),
+    "brand": lambda x: (x.brand or "", x.id),
+}
+
+SQL_SORT_ORDERS = {
+    "price_asc": (func.coalesce(Product.price, 0).asc(), Product.id.asc()),
+    "price_desc": (func.coalesce(Product.price, 0).desc(), Product.id.asc()),
+    "brand": (func.coalesce(Product.brand, "").asc(), Product.id.asc()),
+}
+
+CORRECTION_HEADERS = {"q": "X-Corrected-Query", "brand": "X-Corrected-Brand"}
+
+# Most queries one /products/multi_search request may carry
+MAX_MULTI_SEARCH_QUERIES = 50
+# collapse=true: candidates fetched per page, as a multiple of limit, before near-duplicates are dropped
+COLLAPSE_OVERFETCH = 3
+
+
+def with_corrections(response: JSONResponse, corrections: dict) -> JSONResponse:
+    """Report spelling-corrected search parameters as response headers"""
+    for field, corrected in corrections.items():
+        response.headers[CORRECTION_HEADERS[field]] = corrected
+    return response
+
+
+def collapsed_page(db: Session, fetch_page, id_of, limit, matched: int) -> list:
     """
-    Remove accents from text to make searches more user-friendly
-    'Hermès' becomes 'Hermes'
+    A page of `limit` results with one product per near-duplicate cluster (the best-ranked).
+    fetch_page(n) returns the first n results; it is called with growing n until the page fills.
     """
-    if not text:
-        return ""
-    
-    # Normalize unicode characters and remove accents
-    normalized = unicodedata.normalize('NFD', text)
-    without_accents = ''.join(char for char in normalized if unicodedata.category(char) != 'Mn')
-    return without_accents
+    fetch = limit * COLLAPSE_OVERFETCH if limit is not None else None
+    while True:
+        page = fetch_page(fetch)
+        keep = collapse_duplicates(db, [id_of(item) for item in page])
+        if fetch is None or len(keep) >= limit or len(page) >= matched:
+            return [page[position] for position in keep[:limit]]
+        fetch *= 4
 
 
-def smart_category_match(search_term: str, product) -> bool:
+def search_replica(replica, q=None, brand=None, category=None, min_price=None, max_price=None,
+                   sort_by="id", limit=50, fuzzy=True, collapse=False, db=None, timer=None):
     """
-    COMPREHENSIVE smart category matching with full platform support
-    Handles ALL "platform + shoe type" combinations
+    Search on the in-memory replica: (page rows, match count, corrections).
+    collapse=True (with db for the cluster lookup) keeps one product per near-duplicate cluster.
     """
-    if not search_term:
-        return True
-    
-    search_lower = search_term.lower().strip()
-    
-    # Create searchable text from all product fields
-    search_text = f"{product.title or ''} {product.description or ''} {product.category or ''}".lower()
-    
-    # BAG CATEGORY (based on visual reference) - FIXED: Added tote bag entries
-    bag_terms = {
-        'bags': ['bag', 'bags', 'handbag', 'handbags', 'purse', 'purses', 'backpack', 'backpacks', 
-                'clutch', 'clutches', 'crossbody', 'cross body', 'shoulder bag', 'shoulder bags',
-                'luggage', 'travel', 'tote', 'totes', 'tote bag', 'tote bags'],
-        'bag': ['bag', 'bags', 'handbag', 'handbags', 'purse', 'purses'],
-        'handbags': ['handbag', 'handbags', 'bag', 'bags', 'purse', 'purses'],
-        'handbag': ['handbag', 'handbags', 'bag', 'bags'],
-        'backpacks': ['backpack', 'backpacks', 'rucksack', 'daypack'],
-        'backpack': ['backpack', 'backpacks'],
-        'clutches': ['clutch', 'clutches', 'evening bag', 'evening clutch', 'minaudiere'],
-        'clutch': ['clutch', 'clutches', 'evening bag'],
-        'crossbody': ['crossbody', 'cross body', 'messenger bag', 'sling bag'],
-        'luggage': ['luggage', 'travel bag', 'travel', 'suitcase', 'duffle', 'carry on'],
-        'shoulder': ['shoulder bag', 'shoulder bags', 'hobo', 'hobos'],
-        'tote': ['tote', 'totes', 'tote bag', 'large bag'],
-        'totes': ['tote', 'totes', 'tote bag'],
-        'tote bag': ['tote', 'totes', 'tote bag', 'large bag', 'bag'],
-        'tote bags': ['tote', 'totes', 'tote bag', 'bag']
-    }
-    
-    # CLOTHING CATEGORY (based on visual reference)
-    clothing_terms = {
-        'clothing': ['clothing', 'clothes', 'blouse', 'blouses', 'coat', 'coats', 'denim', 'jeans',
-                    'dress', 'dresses', 'jacket', 'jackets', 'knitwear', 'knit', 'pants', 'trousers',
-                    'shorts', 'skirt', 'skirts', 'sweater', 'sweaters', 'top', 'tops', 'shirt', 'shirts'],
-        'clothes': ['clothing', 'clothes', 'apparel'],
-        'blouses': ['blouse', 'blouses', 'shirt', 'shirts', 'top', 'tops'],
-        'blouse': ['blouse', 'blouses', 'shirt'],
-        'coats': ['coat', 'coats', 'jacket', 'jackets', 'outerwear', 'trench', 'parka'],
-        'coat': ['coat', 'coats', 'jacket', 'outerwear'],
-        'denim': ['denim', 'jeans', 'jean jacket', 'denim jacket'],
-        'jeans': ['jeans', 'denim', 'pants', 'trousers'],
-        'dresses': ['dress', 'dresses', 'gown', 'gowns', 'frock'],
-        'dress': ['dress', 'dresses', 'gown'],
-        'jackets': ['jacket', 'jackets', 'blazer', 'blazers', 'cardigan', 'cardigans'],
-        'jacket': ['jacket', 'jackets', 'blazer'],
-        'knitwear': ['knitwear', 'knit', 'sweater', 'sweaters', 'cardigan', 'pullover'],
-        'knit': ['knit', 'knitwear', 'sweater'],
-        'pants': ['pants', 'trousers', 'slacks', 'leggings'],
-        'trousers': ['trousers', 'pants', 'slacks'],
-        'shorts': ['shorts', 'short pants', 'bermuda'],
-        'skirts': ['skirt', 'skirts', 'mini skirt', 'midi skirt', 'maxi skirt'],
-        'skirt': ['skirt', 'skirts'],
-        'sweaters': ['sweater', 'sweaters', 'jumper', 'pullover', 'cardigan'],
-        'sweater': ['sweater', 'sweaters', 'jumper'],
-        'tops': ['top', 'tops', 'blouse', 'blouses', 'shirt', 'shirts', 'tee', 'tank'],
-        'top': ['top', 'tops', 'blouse', 'shirt']
-    }
-    
-    # SHOE CATEGORY with COMPREHENSIVE PLATFORM SUPPORT
-    shoe_terms = {
-        'shoes': ['shoe', 'shoes', 'boot', 'boots', 'espadrille', 'espadrilles', 'flat', 'flats',
-                 'loafer', 'loafers', 'mule', 'mules', 'pump', 'pumps', 'sandal', 'sandals',
-                 'sneaker', 'sneakers', 'wedge', 'wedges', 'heel', 'heels', 'platform', 'platforms'],
-        'shoe': ['shoe', 'shoes'],
-        'boots': ['boot', 'boots', 'ankle boot', 'knee boot', 'thigh boot', 'combat boot', 
-                 'chelsea boot', 'riding boot', 'cowboy boot', 'platform boot', 'platform boots'],
-        'boot': ['boot', 'boots', 'platform boot'],
-        'espadrilles': ['espadrille', 'espadrilles', 'rope sole', 'canvas shoe', 'platform espadrille'],
-        'espadrille': ['espadrille', 'espadrilles', 'platform espadrille'],
-        'flats': ['flat', 'flats', 'ballet flat', 'ballet flats', 'ballerina', 'platform flat'],
-        'flat': ['flat', 'flats', 'ballet flat', 'platform flat'],
-        'loafers': ['loafer', 'loafers', 'moccasin', 'moccasins', 'slip on', 'platform loafer'],
-        'loafer': ['loafer', 'loafers', 'moccasin', 'platform loafer'],
-        'mules': ['mule', 'mules', 'slide', 'slides', 'clog', 'clogs', 'platform mule'],
-        'mule': ['mule', 'mules', 'slide', 'platform mule'],
-        'pumps': ['pump', 'pumps', 'court shoe', 'heel', 'heels', 'high heel', 'platform', 'platform pump'],
-        'pump': ['pump', 'pumps', 'heel', 'platform pump'],
-        'sandals': ['sandal', 'sandals', 'flip flop', 'flip flops', 'thong', 'slide', 'platform sandal'],
-        'sandal': ['sandal', 'sandals', 'platform sandal'],
-        'sneakers': ['sneaker', 'sneakers', 'trainer', 'trainers', 'athletic shoe', 'running shoe', 
-                    'tennis shoe', 'platform sneaker', 'platform trainer', 'platform tennis'],
-        'sneaker': ['sneaker', 'sneakers', 'trainer', 'platform sneaker', 'platform tennis'],
-        'wedges': ['wedge', 'wedges', 'wedge heel', 'platform', 'platform shoe', 'platform wedge'],
-        'wedge': ['wedge', 'wedges', 'platform wedge'],
-        'heels': ['heel', 'heels', 'pump', 'pumps', 'stiletto', 'stilettos', 'high heel', 'platform', 'platform heel'],
-        'heel': ['heel', 'heels', 'pump', 'platform heel'],
-        
-        # COMPREHENSIVE PLATFORM COMBINATIONS
-        'platform': ['platform', 'platforms', 'platform heel', 'platform shoe', 'platform pump', 'platform sandal', 
-                    'platform wedge', 'platform boot', 'platform sneaker', 'platform mule', 'platform flat',
-                    'platform loafer', 'platform espadrille'],
-        'platforms': ['platform', 'platforms', 'platform heel', 'platform shoe'],
-        
-        # Individual platform combinations
-        'platform heel': ['platform heel', 'platform heels', 'platform pump', 'platform', 'heel', 'heels'],
-        'platform heels': ['platform heel', 'platform heels', 'platform pump', 'platform'],
-        'platform boot': ['platform boot', 'platform boots', 'platform', 'boot', 'boots'],
-        'platform boots': ['platform boot', 'platform boots', 'platform'],
-        'platform sandal': ['platform sandal', 'platform sandals', 'platform', 'sandal', 'sandals'],
-        'platform sandals': ['platform sandal', 'platform sandals', 'platform'],
-        'platform sneaker': ['platform sneaker', 'platform sneakers', 'platform trainer', 'platform tennis', 'platform', 'sneaker', 'sneakers'],
-        'platform sneakers': ['platform sneaker', 'platform sneakers', 'platform trainer', 'platform tennis', 'platform'],
-        'platform tennis': ['platform tennis', 'platform sneaker', 'platform trainer', 'platform', 'tennis', 'sneaker'],
-        'platform wedge': ['platform wedge', 'platform wedges', 'platform', 'wedge', 'wedges'],
-        'platform wedges': ['platform wedge', 'platform wedges', 'platform'],
-        'platform pump': ['platform pump', 'platform pumps', 'platform heel', 'platform', 'pump', 'pumps'],
-        'platform pumps': ['platform pump', 'platform pumps', 'platform heel', 'platform'],
-        'platform mule': ['platform mule', 'platform mules', 'platform slide', 'platform', 'mule', 'mules'],
-        'platform mules': ['platform mule', 'platform mules', 'platform slide', 'platform'],
-        'platform flat': ['platform flat', 'platform flats', 'platform', 'flat', 'flats'],
-        'platform flats': ['platform flat', 'platform flats', 'platform'],
-        'platform loafer': ['platform loafer', 'platform loafers', 'platform', 'loafer', 'loafers'],
-        'platform loafers': ['platform loafer', 'platform loafers', 'platform'],
-        'platform espadrille': ['platform espadrille', 'platform espadrilles', 'platform', 'espadrille', 'espadrilles'],
-        'platform espadrilles': ['platform espadrille', 'platform espadrilles', 'platform']
-    }
-    
-    # ACCESSORY CATEGORY (based on visual reference)
-    accessory_terms = {
-        'accessories': ['accessory', 'accessories', 'belt', 'belts', 'glove', 'gloves', 
-                       'hair accessory', 'hair accessories', 'hat', 'hats', 'jewelry', 'jewellery',
-                       'scarf', 'scarves', 'sunglasses', 'glasses', 'watch', 'watches', 'wallet', 'wallets'],
-        'accessory': ['accessory', 'accessories'],
-        'belts': ['belt', 'belts', 'waist belt', 'chain belt', 'leather belt'],
-        'belt': ['belt', 'belts'],
-        'gloves': ['glove', 'gloves', 'mitten', 'mittens'],
-        'glove': ['glove', 'gloves'],
-        'hair': ['hair accessory', 'hair accessories', 'headband', 'headbands', 'hair clip', 'barrette'],
-        'hats': ['hat', 'hats', 'cap', 'caps', 'beanie', 'beanies', 'fedora', 'beret', 'bucket hat'],
-        'hat': ['hat', 'hats', 'cap'],
-        'jewelry': ['jewelry', 'jewellery', 'necklace', 'necklaces', 'bracelet', 'bracelets', 
-                   'ring', 'rings', 'earring', 'earrings', 'pendant', 'pendants', 'chain', 'chains',
-                   'brooch', 'brooches', 'pin', 'pins', 'cufflink', 'cufflinks'],
-        'jewellery': ['jewelry', 'jewellery'],
-        'necklace': ['necklace', 'necklaces', 'pendant', 'pendants', 'chain', 'chains', 'choker'],
-        'necklaces': ['necklace', 'necklaces'],
-        'bracelet': ['bracelet', 'bracelets', 'bangle', 'bangles', 'cuff', 'cuffs'],
-        'bracelets': ['bracelet', 'bracelets'],
-        'ring': ['ring', 'rings', 'band', 'bands'],
-        'rings': ['ring', 'rings'],
-        'earring': ['earring', 'earrings', 'stud', 'studs', 'hoop', 'hoops', 'drop earring'],
-        'earrings': ['earring', 'earrings'],
-        'scarves': ['scarf', 'scarves', 'shawl', 'shawls', 'wrap', 'wraps', 'stole', 'pashmina'],
-        'scarf': ['scarf', 'scarves', 'shawl'],
-        'sunglasses': ['sunglasses', 'glasses', 'eyewear', 'shades', 'sunglass'],
-        'glasses': ['glasses', 'sunglasses', 'eyewear'],
-        'watches': ['watch', 'watches', 'timepiece', 'chronograph', 'wristwatch'],
-        'watch': ['watch', 'watches', 'timepiece'],
-        'wallets': ['wallet', 'wallets', 'purse', 'coin purse', 'card holder', 'money clip'],
-        'wallet': ['wallet', 'wallets']
-    }
-    
-    # DESIGNER BRANDS (from visual reference)
-    designer_terms = {
-        'alaia': ['alaia', 'alaïa'],
-        'balmain': ['balmain'],
-        'bottega': ['bottega veneta', 'bottega'],
-        'burberry': ['burberry'],
-        'chloe': ['chloe', 'chloé'],
-        'dolce': ['dolce gabbana', 'dolce & gabbana', 'dolce'],
-        'fendi': ['fendi'],
-        'gianvito': ['gianvito rossi'],
-        'givenchy': ['givenchy'],
-        'gucci': ['gucci'],
-        'isabel': ['isabel marant'],
-        'lanvin': ['lanvin'],
-        'miu': ['miu miu'],
-        'oscar': ['oscar de la renta'],
-        'prada': ['prada'],
-        'saint': ['saint laurent', 'ysl'],
-        'valentino': ['valentino']
-    }
-    
-    # Combine all categories
-    all_categories = {**bag_terms, **clothing_terms, **shoe_terms, **accessory_terms, **designer_terms}
-    
-    # Check if search term matches any category
-    if search_lower in all_categories:
-        terms_to_find = all_categories[search_lower]
-        for term in terms_to_find:
-            if term in search_text:
-                return True
-        return False
-    
-    # If not a recognized category, do regular text matching
-    if search_lower in search_text:
-        return True
-    
-    return False
-
-
-# UPDATED: List of terms that should use smart category matching - FIXED: Added tote bag entries
-SMART_CATEGORY_TERMS = [
-    # Bags
-    'bags', 'bag', 'handbags', 'handbag', 'backpacks', 'backpack', 'clutches', 'clutch',
-    'crossbody', 'luggage', 'shoulder', 'tote', 'totes', 'tote bag', 'tote bags',
-    # Clothing  
-    'clothing', 'clothes', 'blouses', 'blouse', 'coats', 'coat', 'denim', 'jeans',
-    'dresses', 'dress', 'jackets', 'jacket', 'knitwear', 'knit', 'pants', 'trousers',
-    'shorts', 'skirts', 'skirt', 'sweaters', 'sweater', 'tops', 'top',
-    # Shoes
-    'shoes', 'shoe', 'boots', 'boot', 'espadrilles', 'espadrille', 'flats', 'flat',
-    'loafers', 'loafer', 'mules', 'mule', 'pumps', 'pump', 'sandals', 'sandal',
-    'sneakers', 'sneaker', 'wedges', 'wedge', 'heels', 'heel',
-    # Platform combinations
-    'platform', 'platforms', 'platform heel', 'platform heels', 'platform boot', 'platform boots',
-    'platform sandal', 'platform sandals', 'platform sneaker', 'platform sneakers', 'platform tennis',
-    'platform wedge', 'platform wedges', 'platform pump', 'platform pumps', 'platform mule', 'platform mules',
-    'platform flat', 'platform flats', 'platform loafer', 'platform loafers', 'platform espadrille', 'platform espadrilles',
-    # Accessories
-    'accessories', 'accessory', 'belts', 'belt', 'gloves', 'glove', 'hair', 'hats', 'hat',
-    'jewelry', 'jewellery', 'necklace', 'necklaces', 'bracelet', 'bracelets', 'ring', 'rings',
-    'earring', 'earrings', 'scarves', 'scarf', 'sunglasses', 'glasses', 'watches', 'watch',
-    'wallets', 'wallet',
-    # Designers
-    'alaia', 'balmain', 'bottega', 'burberry', 'chloe', 'dolce', 'fendi', 'gianvito',
-    'givenchy', 'gucci', 'isabel', 'lanvin', 'miu', 'oscar', 'prada', 'saint', 'valentino'
-]
-
-
-def updated_search_logic(q, product):
-    """
-    DEBUG VERSION - Same as original but with debug output
-    """
-    if not q:
-        return True
-        
-    search_terms = q.strip().lower().split()
-    print(f"DEBUG - Search terms: {search_terms}")
-    print(f"DEBUG - Product title: '{product.title}'")
-    print(f"DEBUG - Product description: '{product.description[:100] if product.description else 'None'}...'")
-    
-    if len(search_terms) == 1:
-        search_term = search_terms[0]
-        
-        if search_term in SMART_CATEGORY_TERMS:
-            print(f"DEBUG - Using smart category matching for: {search_term}")
-            result = smart_category_match(search_term, product)
-            print(f"DEBUG - Smart category result: {result}")
-            return result
-        else:
-            print(f"DEBUG - Using regular text search for: {search_term}")
-            # Regular text search for brands, materials, etc.
-            searchable_text = ""
-            if product.title:
-                searchable_text += remove_accents(product.title.lower()) + " "
-            if product.brand:
-                searchable_text += remove_accents(product.brand.lower()) + " "
-            if product.description:
-                searchable_text += remove_accents(product.description.lower()) + " "
-            
-            term_clean = remove_accents(search_term)
-            result = term_clean in searchable_text
-            print(f"DEBUG - Text search result: {result}")
-            return result
-    
+    corrections = replica.spelling_corrections(q, brand) if fuzzy else {}
+    q, brand = corrections.get("q", q), corrections.get("brand", brand)
+    matches = plan_query(
+        replica, q=q, brand=brand, category=category, min_price=min_price, max_price=max_price
+    ).execute()
+    if timer:
+        timer.mark("filter")
+    if collapse:
+        rows = collapsed_page(
+            db, lambda n: replica.top_rows(matches, sort_by=sort_by, limit=n, q=q),
+            replica.ids.__getitem__, limit, matches.bit_count()
+        )
     else:
-        # Multi-word search logic
-        full_search = " ".join(search_terms)
-        print(f"DEBUG - Multi-word search: '{full_search}'")
-        
-        # First: Check if the full phrase is a recognized smart category
-        if full_search in SMART_CATEGORY_TERMS:
-            print(f"DEBUG - Full phrase '{full_search}' found in SMART_CATEGORY_TERMS")
-            result = smart_category_match(full_search, product)
-            print(f"DEBUG - Smart category result for full phrase: {result}")
-            return result
-        else:
-            print(f"DEBUG - Full phrase '{full_search}' NOT in SMART_CATEGORY_TERMS")
-        
-        # Second: Check for brand + category combinations
-        potential_brand = search_terms[0]
-        potential_category = " ".join(search_terms[1:])
-        print(f"DEBUG - Trying brand '{potential_brand}' + category '{potential_category}'")
-        
-        # Check if first word is a brand
-        brand_clean = remove_accents(potential_brand.lower())
-        product_brand = remove_accents(product.brand.lower()) if product.brand else ""
-        product_title = remove_accents(product.title.lower()) if product.title else ""
-        
-        brand_match = (brand_clean in product_brand) or (brand_clean in product_title)
-        print(f"DEBUG - Brand match for '{potential_brand}': {brand_match}")
-        
-        if brand_match:
-            # If brand matches, check category using smart matching
-            result = smart_category_match(potential_category, product)
-            print(f"DEBUG - Category match result: {result}")
-            return result
-        
-        # Fall back to requiring ALL terms
-        print(f"DEBUG - Falling back to 'all terms must be found' logic")
-        searchable_text = ""
-        if product.title:
-            searchable_text += remove_accents(product.title.lower()) + " "
-        if product.brand:
-            searchable_text += remove_accents(product.brand.lower()) + " "
-        if product.description:
-            searchable_text += remove_accents(product.description.lower()) + " "
-        
-        print(f"DEBUG - Searchable text: '{searchable_text[:200] if searchable_text else 'Empty'}...'")
-        
-        # Check if ALL search terms are found
-        for term in search_terms:
-            term_clean = remove_accents(term.lower())
-            found = term_clean in searchable_text
-            print(f"DEBUG - Term '{term_clean}' found in text: {found}")
-            if not found:
-                print(f"DEBUG - REJECTED: Term '{term_clean}' not found")
-                return False
-        
-        print(f"DEBUG - ACCEPTED: All terms found")
-        return True
+        rows = replica.top_rows(matches, sort_by=sort_by, limit=limit, q=q)
+    if timer:
+        timer.mark("sort")
+    return rows, matches.bit_count(), corrections
+
+
+def search_loaded_products(all_products, q=None, brand=None, category=None, min_price=None, max_price=None,
+                           sort_by="id", limit=50, fuzzy=True, collapse=False, db=None, timer=None):
+    """Search already loaded product rows (SQL path): (page, match count, corrections)"""
+    corrections = product_spelling_corrections(q, brand, all_products) if fuzzy else {}
+    q, brand = corrections.get("q", q), corrections.get("brand", brand)
+
+    filtered_products = []
+    for product in all_products:
+        # Check general search query with smart logic
+        if q and not updated_search_logic(q, product):
+            continue
+        # Brand searches both brand and title fields; category is smart matching
+        if not filters_match(product, brand=brand, category=category, min_price=min_price, max_price=max_price):
+            continue
+        filtered_products.append(product)
+    if timer:
+        timer.mark("filter")
+
+    # Apply sorting: select the top `limit` with a heap instead of sorting every match
+    sort_key = SORT_KEYS.get(sort_by)
+    if sort_by == "relevance" and q and q.strip():
+        scorer = RelevanceScorer.for_products(q, all_products)
+        sort_key = lambda x: -scorer.score_product(x)
+    def first(count):
+        if sort_key is not None and count is not None:
+            return heapq.nsmallest(max(count, 0), filtered_products, key=sort_key)
+        if sort_key is not None:
+            filtered_products.sort(key=sort_key)
+        # default is no sorting (order by id)
+        return filtered_products[:count]
+
+    if collapse:
+        products = collapsed_page(db, first, lambda product: product.id, limit, len(filtered_products))
+    else:
+        products = first(limit)
+    if timer:
+        timer.mark("sort")
+    return products, len(filtered_products), corrections
 
 
 app = FastAPI()
+# Catalog reads: ETag keyed on the catalog version, 304 without touching the database
+app.add_middleware(ConditionalGetMiddleware, routes=app.routes)
+# Added last so it is outermost and also times the 304s
+app.add_middleware(metrics.MetricsMiddleware, routes=app.routes)
+metrics.instrument_engine(engine)
 
 # Create tables
 Base.metadata.create_all(bind=engine)
 
+# Multi-worker mode: workers share one memory-mapped catalog snapshot per version
+if SNAPSHOT_DIR:
+    catalog_store.loader = SharedSnapshotLoader(SNAPSHOT_DIR)
+
+
+def refresh_catalog():
+    """Bring the in-memory replica (and its snapshot) up to the current catalog version"""
+    if not catalog_store.enabled:
+        return
+    db = SessionLocal()
+    try:
+        catalog_store.get_replica(db)
+    finally:
+        db.close()
+
+
+@app.on_event("startup")
+def warm_catalog():
+    # Maps the current snapshot when one exists, so the first search doesn't pay for a rebuild
+    threading.Thread(target=refresh_catalog, daemon=True).start()
+
 # Seed Products Endpoint
 @app.post("/seed_products")
-def seed_products(products: List[ProductCreate]):
+def seed_products(products: List[ProductCreate], background_tasks: BackgroundTasks):
     db = SessionLocal()
     try:
-        db_products = [Product(**product.dict()) for product in products]
-        db.add_all(db_products)
-        db.commit()
+        rows = [product.dict() for product in products]
+        ids = insert_products(db, rows)
+        publish_catalog_change(db, rows, ids)
+        # Rebuild the replica/snapshot after the response instead of on the next search
+        background_tasks.add_task(refresh_catalog)
 
         return {"message": "Products seeded successfully!"}
 
@@ -365,6 +197,88 @@ def seed_products(products: List[ProductCreate]):
     finally:
         db.close()
 
+# Large imports: queue the batch and apply it in the background
+ingestion_queue = IngestionQueue(on_catalog_change=refresh_catalog)
+
+@app.post("/ingest/jobs", status_code=status.HTTP_202_ACCEPTED)
+def submit_ingest_job(products: List[ProductCreate]):
+    """
+    Queue products for background ingestion and return a job id immediately.
+    Returns 503 with Retry-After when too many jobs are already waiting.
+    """
+    try:
+        job_id = ingestion_queue.submit([product.dict() for product in products])
+    except QueueFull:
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"error": "Ingestion queue is full, retry later"},
+            headers={"Retry-After": str(RETRY_AFTER_SECONDS)}
+        )
+    except Exception as e:
+        return {"error": str(e)}
+
+    return {
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": f"/ingest/jobs/{job_id}",
+        "queued_jobs": ingestion_queue.pending()
+    }
+
+def store_ingest_chunk(products: list, idempotency_key: Optional[str]) -> dict:
+    db = SessionLocal()
+    try:
+        return ingest_chunk(db, products, idempotency_key)
+    finally:
+        db.close()
+
+@app.post("/ingest/chunks")
+async def upload_ingest_chunk(
+    request: Request,
+    idempotency_key: Optional[str] = Header(None)
+):
+    """
+    Streaming upload: one NDJSON chunk of products per request, optionally
+    Content-Encoding: gzip. The body is inflated and parsed as it arrives.
+    Resending a chunk with the same Idempotency-Key does not insert it twice.
+    """
+    decoder = NdjsonDecoder(gzipped=request.headers.get("content-encoding", "").lower() == "gzip")
+    try:
+        async for data in request.stream():
+            decoder.feed(data)
+        products = decoder.close()
+        # Database work runs off the event loop, like the sync endpoints
+        return await run_in_threadpool(store_ingest_chunk, products, idempotency_key)
+    except ChunkRejected as e:
+        return JSONResponse(status_code=status.HTTP_400_BAD_REQUEST, content={"error": str(e)})
+    except Exception as e:
+        # Transient failure (e.g. database busy): the client retries with the same key
+        return JSONResponse(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, content={"error": str(e)})
+
+@app.get("/ingest/jobs")
+def list_ingest_jobs(limit: int = Query(20, ge=1, le=200)):
+    """Most recent ingestion jobs with progress and throughput"""
+    db: Session = SessionLocal()
+    try:
+        return {"queued_jobs": ingestion_queue.pending(), "jobs": recent_jobs(db, limit)}
+    except Exception as e:
+        return {"error": str(e)}
+    finally:
+        db.close()
+
+@app.get("/ingest/jobs/{job_id}")
+def get_ingest_job(job_id: str):
+    """Progress of one ingestion job: processed/total rows, rows per second, errors"""
+    db: Session = SessionLocal()
+    try:
+        job = get_job(db, job_id)
+        if job:
+            return job
+        return {"error": f"Ingest job {job_id} not found."}
+    except Exception as e:
+        return {"error": str(e)}
+    finally:
+        db.close()
+
 # Simple root endpoint
 @app.get("/")
 def read_root():
@@ -372,6 +286,7 @@ def read_root():
 
 # ENHANCED: GET /products with search parameters
 @app.get("/products")
+@admission_controlled("/products")
 def get_products(
     brand: Optional[str] = Query(None, description="Filter by brand (e.g., 'Chanel', 'Gucci', 'Hermes')"),
     category: Optional[str] = Query(None, description="Smart category filter (e.g., 'hat', 'bag', 'shoe', 'dress', 'handbags', 'shoes')"),
@@ -379,7 +294,8 @@ def get_products(
     max_price: Optional[float] = Query(None, description="Maximum price filter"),
     color: Optional[str] = Query(None, description="Filter by color"),
     platform_name: Optional[str] = Query(None, description="Filter by platform (e.g., 'TheRealReal', 'Vestiaire')"),
-    limit: Optional[int] = Query(100, description="Maximum number of results to return")
+    limit: Optional[int] = Query(100, description="Maximum number of results to return"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return (e.g. 'id,title,price'); default all")
 ):
     """
     Get products with optional search and filter parameters.
@@ -390,50 +306,50 @@ def get_products(
     - Accent-insensitive: 'Hermes' finds 'Hermès' items
     - Case insensitive searches
     """
+    timer = StageTimer("/products")
     db: Session = SessionLocal()
     try:
-        # Get all products and filter in Python for reliability
-        all_products = db.query(Product).all()
+        output_fields = parse_fields(fields)
+        if catalog_store.enabled:
+            # Evaluate all filters as bitmap operations on the in-memory replica
+            replica = catalog_store.get_replica(db)
+            timer.mark("db_fetch")
+            matches = plan_query(
+                replica, brand=brand, category=category, min_price=min_price, max_price=max_price,
+                color=color, platform_name=platform_name
+            ).execute()
+            timer.mark("filter")
+            rows = replica.top_rows(matches, limit=limit)
+            timer.mark("sort")
+            response = JSONResponse(content=replica.to_dicts(rows, output_fields))
+            timer.mark("serialize")
+            record_rows("/products", replica.size, matches.bit_count(), len(rows))
+            return response
+
+        # Get all products and filter in Python for reliability. Only the columns the
+        # filters read are loaded; smart category matching also needs descriptions
+        all_products = load_filter_rows(db, with_description=bool(category))
+        timer.mark("db_fetch")
         filtered_products = []
         
         for product in all_products:
-            # Apply brand filter (searches both brand and title fields)
-            if brand:
-                brand_clean = remove_accents(brand.lower())
-                
-                # Check brand field
-                product_brand = remove_accents(product.brand.lower()) if product.brand else ""
-                brand_in_brand_field = brand_clean in product_brand
-                
-                # Check title field (where actual brand names are)
-                product_title = remove_accents(product.title.lower()) if product.title else ""
-                brand_in_title_field = brand_clean in product_title
-                
-                # If brand not found in either field, skip this product
-                if not brand_in_brand_field and not brand_in_title_field:
-                    continue
-            
-            # Smart category filtering
-            if category:
-                if not smart_category_match(category, product):
-                    continue
-                
-            # Apply other filters
-            if min_price is not None and product.price < min_price:
-                continue
-            if max_price is not None and product.price > max_price:
-                continue
-            if color and color.lower() not in (product.color or "").lower():
-                continue
-            if platform_name and platform_name.lower() not in (product.platform_name or "").lower():
+            # Brand searches both brand and title fields; category is smart matching
+            if not filters_match(
+                product, brand=brand, category=category, min_price=min_price, max_price=max_price,
+                color=color, platform_name=platform_name
+            ):
                 continue
             
             filtered_products.append(product)
+        timer.mark("filter")
         
-        # Apply limit
+        # Apply limit, then load the output columns for just these rows
         products = filtered_products[:limit]
         
-        return JSONResponse(content=jsonable_encoder(products))
+        response = JSONResponse(content=hydrate_products(db, products, output_fields))
+        timer.mark("serialize")
+        record_rows("/products", len(all_products), len(filtered_products), len(products))
+        return response
 
     except Exception as e:
         return {"error": str(e)}
@@ -443,14 +359,21 @@ def get_products(
 
 # ENHANCED: Advanced search endpoint with comprehensive platform support
 @app.get("/products/search")
+@profiled
+@admission_controlled("/products/search")
 def search_products(
+    request: Request,
     q: Optional[str] = Query(None, description="General search query (searches title, brand, description)"),
     brand: Optional[str] = Query(None, description="Filter by brand"),
     category: Optional[str] = Query(None, description="Smart category filter (e.g., 'hat', 'bag', 'shoe', 'dress')"),
     min_price: Optional[float] = Query(None, description="Minimum price"),
     max_price: Optional[float] = Query(None, description="Maximum price"),
-    sort_by: Optional[str] = Query("id", description="Sort by: 'price_asc', 'price_desc', 'brand', 'id'"),
-    limit: Optional[int] = Query(50, description="Maximum results")
+    sort_by: Optional[str] = Query("id", description="Sort by: 'relevance', 'price_asc', 'price_desc', 'brand', 'id'"),
+    limit: Optional[int] = Query(50, description="Maximum results"),
+    fuzzy: bool = Query(True, description="Correct misspelled brand/search terms that match nothing"),
+    collapse: bool = Query(False, description="Show one listing per near-duplicate cluster (same item on several platforms)"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return (e.g. 'id,title,price'); default all"),
+    profile: bool = Query(False, description="Admin only: return a cProfile report with the results")
 ):
     """
     Advanced search with comprehensive smart category matching and platform support.
@@ -463,61 +386,98 @@ def search_products(
     - Accent insensitive: 'hermes' finds 'Hermès'
     - Case insensitive searches
     - Multi-word searches: 'gucci shoes', 'saint laurent bags'
+    - Relevance ranking: sort_by=relevance scores brand > title > description term hits
+    - Typo tolerance: 'channel' searches 'chanel'; the rewrite is returned in X-Corrected-Query
+    - Duplicate collapsing: collapse=true keeps the best-ranked listing of each near-duplicate cluster
     """
+    timer = StageTimer("/products/search")
     db: Session = SessionLocal()
     try:
-        # Get all products first, then filter in Python for reliability
-        all_products = db.query(Product).all()
-        filtered_products = []
+        output_fields = parse_fields(fields)
+        if catalog_store.enabled:
+            # Evaluate all filters as bitmap operations on the in-memory replica
+            replica = catalog_store.get_replica(db)
+            timer.mark("db_fetch")
+            rows, matched, corrections = search_replica(
+                replica, q=q, brand=brand, category=category, min_price=min_price, max_price=max_price,
+                sort_by=sort_by, limit=limit, fuzzy=fuzzy, collapse=collapse, db=db, timer=timer
+            )
+            response = with_corrections(JSONResponse(content=replica.to_dicts(rows, output_fields)), corrections)
+            timer.mark("serialize")
+            record_rows("/products/search", replica.size, matched, len(rows))
+            return response
+
+        # Sorted query with only SQL-expressible filters: push ORDER BY ... LIMIT down to the database
+        if sort_by in SQL_SORT_ORDERS and not (q or brand or category or collapse):
+            query = db.query(Product)
+            if min_price is not None:
+                query = query.filter(Product.price >= min_price)
+            if max_price is not None:
+                query = query.filter(Product.price <= max_price)
+            products = query.order_by(*SQL_SORT_ORDERS[sort_by]).limit(limit).all()
+            timer.mark("db_fetch")
+            response = JSONResponse(content=hydrate_products(db, products, output_fields))
+            timer.mark("serialize")
+            record_rows("/products/search", len(products), len(products), len(products))
+            return response
+
+        # Get all products first, then filter in Python for reliability.
+        # Descriptions are only loaded when q or smart category matching reads them
+        all_products = load_filter_rows(db, with_description=bool(q or category))
+        timer.mark("db_fetch")
+        products, matched, corrections = search_loaded_products(
+            all_products, q=q, brand=brand, category=category, min_price=min_price, max_price=max_price,
+            sort_by=sort_by, limit=limit, fuzzy=fuzzy, collapse=collapse, db=db, timer=timer
+        )
         
-        for product in all_products:
-            # Check general search query with smart logic
-            if q:
-                if not updated_search_logic(q, product):
-                    continue
-            
-            # Apply brand filter (searches both brand and title fields)
-            if brand:
-                brand_clean = remove_accents(brand.lower())
-                
-                # Check brand field
-                product_brand = remove_accents(product.brand.lower()) if product.brand else ""
-                brand_in_brand_field = brand_clean in product_brand
-                
-                # Check title field (where actual brand names are)
-                product_title = remove_accents(product.title.lower()) if product.title else ""
-                brand_in_title_field = brand_clean in product_title
-                
-                # If brand not found in either field, skip this product
-                if not brand_in_brand_field and not brand_in_title_field:
-                    continue
-            
-            # Smart category filtering
-            if category:
-                if not smart_category_match(category, product):
-                    continue
-            
-            # Apply other filters
-            if min_price is not None and product.price < min_price:
-                continue
-            if max_price is not None and product.price > max_price:
-                continue
-            
-            filtered_products.append(product)
-        
-        # Apply sorting
-        if sort_by == "price_asc":
-            filtered_products.sort(key=lambda x: x.price or 0)
-        elif sort_by == "price_desc":
-            filtered_products.sort(key=lambda x: x.price or 0, reverse=True)
-        elif sort_by == "brand":
-            filtered_products.sort(key=lambda x: x.brand or "")
-        # default is no sorting (order by id)
-        
-        # Apply limit
-        products = filtered_products[:limit]
-        
-        return JSONResponse(content=jsonable_encoder(products))
+        response = with_corrections(JSONResponse(content=hydrate_products(db, products, output_fields)), corrections)
+        timer.mark("serialize")
+        record_rows("/products/search", len(all_products), matched, len(products))
+        return response
+
+    except Exception as e:
+        return {"error": str(e)}
+
+    finally:
+        db.close()
+
+# Homepage carousels: many searches in one request, sharing one catalog pass
+@app.post("/products/multi_search")
+@admission_controlled("/products/multi_search")
+def multi_search(request: MultiSearchRequest):
+    """
+    Evaluate a list of /products/search specs together and return one result page per spec, in order.
+
+    Every spec is planned against the same catalog replica, so each product is normalized
+    once and predicates shared between specs (a brand, a smart category, a price band)
+    are computed once. Without the catalog store a replica is built for this request
+    from one pass over the table, instead of one filtering pass per spec.
+    """
+    specs = request.queries
+    if len(specs) > MAX_MULTI_SEARCH_QUERIES:
+        return {"error": f"At most {MAX_MULTI_SEARCH_QUERIES} queries per request."}
+
+    timer = StageTimer("/products/multi_search")
+    db: Session = SessionLocal()
+    try:
+        spec_fields = [parse_fields(spec.fields) for spec in specs]
+        if catalog_store.enabled:
+            replica = catalog_store.get_replica(db)
+        else:
+            replica = CatalogReplica.load(db, get_catalog_version(db))
+        timer.mark("db_fetch")
+
+        results = []
+        for spec, fields in zip(specs, spec_fields):
+            rows, matched, corrections = search_replica(replica, **spec.dict(exclude={"key", "fields"}), db=db)
+            results.append({
+                "key": spec.key, "matched": matched, "corrections": corrections,
+                "products": replica.to_dicts(rows, fields)
+            })
+        timer.mark("filter")
+        record_rows("/products/multi_search", replica.size, sum(result["matched"] for result in results),
+                    sum(len(result["products"]) for result in results))
+        return {"results": results}
 
     except Exception as e:
         return {"error": str(e)}
@@ -525,30 +485,138 @@ def search_products(
     finally:
         db.close()
 
+# Saved-search alerts: new products are matched against saved searches as they are ingested
+@app.post("/saved_searches")
+def create_saved_search(saved_search: SavedSearchCreate):
+    """Save a search (same parameters as /products/search); products ingested from now on are matched"""
+    db = SessionLocal()
+    try:
+        values = saved_search.dict()
+        # Blank text filters would match everything
+        for field in ("q", "brand", "category"):
+            if values[field] is not None and not values[field].strip():
+                values[field] = None
+        saved = SavedSearch(**values, created_at=datetime.utcnow())
+        db.add(saved)
+        db.commit()
+        db.refresh(saved)
+        return saved
+    except Exception as e:
+        db.rollback()
+        return {"error": str(e)}
+    finally:
+        db.close()
+
+@app.get("/saved_searches")
+def list_saved_searches(owner: str = Query(..., description="Customer whose saved searches to list")):
+    db = SessionLocal()
+    try:
+        return db.query(SavedSearch).filter(SavedSearch.owner == owner).order_by(SavedSearch.id).all()
+    except Exception as e:
+        return {"error": str(e)}
+    finally:
+        db.close()
+
+@app.delete("/saved_searches/{saved_search_id}")
+def delete_saved_search(saved_search_id: int):
+    db = SessionLocal()
+    try:
+        saved = db.get(SavedSearch, saved_search_id)
+        if saved is None:
+            return {"error": f"Saved search {saved_search_id} not found."}
+        db.query(SavedSearchMatch).filter(SavedSearchMatch.saved_search_id == saved_search_id).delete()
+        db.delete(saved)
+        db.commit()
+        percolator.remove(saved_search_id)
+        return {"message": "Saved search deleted successfully!"}
+    except Exception as e:
+        db.rollback()
+        return {"error": str(e)}
+    finally:
+        db.close()
+
+@app.get("/saved_searches/{saved_search_id}/matches")
+def get_saved_search_matches(
+    saved_search_id: int,
+    since_id: int = Query(0, ge=0, description="Only matches after this match id (the last one already notified)"),
+    limit: int = Query(100, ge=1, le=1000)
+):
+    """Products that arrived matching a saved search, oldest first; page with since_id"""
+    db = SessionLocal()
+    try:
+        rows = (
+            db.query(SavedSearchMatch.id, SavedSearchMatch.matched_at, SavedSearchMatch.product_id)
+            .filter(SavedSearchMatch.saved_search_id == saved_search_id, SavedSearchMatch.id > since_id)
+            .order_by(SavedSearchMatch.id).limit(limit).all()
+        )
+        products = fetch_rows_by_id(db, [row.product_id for row in rows])
+        return {
+            "saved_search_id": saved_search_id,
+            "matches": [
+                {"match_id": row.id, "matched_at": row.matched_at, "product": products[row.product_id]}
+                for row in rows if row.product_id in products
+            ],
+            "next_since_id": rows[-1].id if rows else since_id
+        }
+    except Exception as e:
+        return {"error": str(e)}
+    finally:
+        db.close()
+
+# Prometheus scrape endpoint
+@app.get("/metrics")
+def get_metrics():
+    """Request latency histograms, endpoint stage timings, row counts and SQL statement stats"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+# Admin: sample live traffic for a few seconds
+@app.get("/admin/profile")
+def profile_live_traffic(
+    seconds: float = Query(5.0, gt=0, le=60, description="How long to sample"),
+    interval_ms: float = Query(5.0, ge=1, le=100, description="Sampling interval"),
+    format: str = Query("collapsed", description="'collapsed' (flamegraph input) or 'json'"),
+    x_admin_token: Optional[str] = Header(None)
+):
+    """
+    Wall-clock sampling profile of every worker thread.
+    'collapsed' output can be fed to flamegraph.pl or speedscope.
+    """
+    require_admin(x_admin_token)
+    result = sample_stacks(seconds, interval_ms / 1000)
+    if format == "json":
+        return result
+    return PlainTextResponse(collapsed_stacks(result["stacks"]))
+
 # SIMPLE DEBUG: Add a test endpoint to check what's happening
 @app.get("/debug/search")
-def debug_search_endpoint(q: str):
-    """Debug endpoint to see what's happening with search"""
+def debug_search_endpoint(
+    q: Optional[str] = None,
+    brand: Optional[str] = None,
+    category: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    color: Optional[str] = None,
+    platform_name: Optional[str] = None
+):
+    """Debug endpoint: the compiled query plan, its cost estimate and how it actually ran"""
     db: Session = SessionLocal()
     try:
-        all_products = db.query(Product).all()
-        debug_info = []
-        
-        for product in all_products[:3]:  # Check first 3 products
-            result = updated_search_logic(q, product)
-            debug_info.append({
-                "product_id": product.id,
-                "title": product.title,
-                "description": product.description[:100] if product.description else "None",
-                "search_result": result
-            })
-        
+        replica = catalog_store.get_replica(db)
+        plan = plan_query(
+            replica, q=q, brand=brand, category=category, min_price=min_price, max_price=max_price,
+            color=color, platform_name=platform_name
+        )
+        matches = plan.execute()
+
         return {
             "search_query": q,
-            "total_products_checked": len(all_products),
-            "debug_results": debug_info,
+            "total_products_checked": replica.size,
+            "matched": matches.bit_count(),
+            "plan": plan.explain(),
             "smart_category_terms_contains_query": q in SMART_CATEGORY_TERMS
         }
+    except Exception as e:
+        return {"error": str(e)}
     finally:
         db.close()
 
@@ -588,12 +656,87 @@ def get_filter_options():
     finally:
         db.close()
 
+# Typeahead completions for the search box
+@app.get("/products/suggest")
+def suggest_products(
+    prefix: str = Query(..., description="What the user has typed so far (e.g., 'cha', 'plat')"),
+    limit: int = Query(10, ge=1, le=50, description="Maximum completions per group")
+):
+    """
+    Top brand, category and title completions for a prefix, weighted by product counts.
+    Accent-insensitive: 'herm' completes to 'Hermès'.
+    """
+    db: Session = SessionLocal()
+    try:
+        suggest_index.ensure_current(db)
+        return {"prefix": prefix, **suggest_index.suggest(prefix, limit)}
+
+    except Exception as e:
+        return {"error": str(e)}
+
+    finally:
+        db.close()
+
+# Full or incremental catalog export for downstream jobs (price monitoring, feeds)
+@app.get("/products/export")
+def export_products(
+    format: str = Query("ndjson", description="'ndjson' or 'csv'"),
+    since: int = Query(0, ge=0, description="Only products with id > since (use X-Export-Next-Since from the last export)"),
+    compress: bool = Query(False, description="gzip the stream on the fly"),
+    chunk_size: int = Query(1000, ge=1, le=10000, description="Rows fetched and written per chunk"),
+    brand: Optional[str] = Query(None, description="Filter by brand"),
+    category: Optional[str] = Query(None, description="Smart category filter"),
+    min_price: Optional[float] = Query(None, description="Minimum price"),
+    max_price: Optional[float] = Query(None, description="Maximum price"),
+    color: Optional[str] = Query(None, description="Filter by color"),
+    platform_name: Optional[str] = Query(None, description="Filter by platform")
+):
+    """
+    Stream the catalog (or a filtered subset) as NDJSON or CSV in id order.
+    Rows are read with a server-side cursor, so memory stays flat for any catalog size.
+    """
+    if format not in EXPORT_FORMATS:
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={"error": f"Unsupported format '{format}', use one of: {', '.join(EXPORT_FORMATS)}"}
+        )
+
+    db: Session = SessionLocal()
+    try:
+        until = export_upper_bound(db)
+    except Exception as e:
+        db.close()
+        return {"error": str(e)}
+
+    def stream():
+        # The session lives as long as the response body; closed when the stream ends or the client leaves
+        try:
+            yield from export_chunks(
+                db, fmt=format, since=since, until=until, compress=compress, chunk_rows=chunk_size,
+                brand=brand, category=category, min_price=min_price, max_price=max_price,
+                color=color, platform_name=platform_name
+            )
+        finally:
+            db.close()
+
+    extension = f"{format}.gz" if compress else format
+    headers = {
+        "Content-Disposition": f'attachment; filename="retrofy-products-{since}-{until}.{extension}"',
+        "X-Export-Next-Since": str(max(since, until))
+    }
+    media_type = "application/gzip" if compress else EXPORT_FORMATS[format]
+    return StreamingResponse(stream(), media_type=media_type, headers=headers)
+
 # DELETE/products endpoint to clear table via API testing
 @app.delete("/products", status_code=status.HTTP_200_OK)
 def delete_all_products():
     db = SessionLocal()
     try:
         num_deleted = db.query(Product).delete()
+        remove_cluster_rows(db)
+        # A re-sync after clearing must not be acknowledged as already received
+        db.query(IngestChunk).delete()
+        bump_catalog_version(db)
         db.commit()
         return {"message": f"Deleted {num_deleted} products."}
     except Exception as e:
@@ -602,12 +745,124 @@ def delete_all_products():
     finally:
         db.close()
 
+# Wishlist/cart pages: resolve many ids in one round trip instead of one GET per item
+@app.post("/products/batch")
+def get_products_by_ids(request: ProductBatchRequest):
+    """
+    Fetch products by id with chunked WHERE id IN (...) queries.
+    Products come back in request order (repeated ids once); ids that don't exist are listed in "missing".
+    """
+    if len(request.ids) > MAX_BATCH_IDS:
+        return {"error": f"At most {MAX_BATCH_IDS} ids per request."}
+
+    db = SessionLocal()
+    try:
+        ids = list(dict.fromkeys(request.ids))
+        found = fetch_rows_by_id(db, ids, parse_fields(request.fields))
+        return {
+            "products": [found[product_id] for product_id in ids if product_id in found],
+            "missing": [product_id for product_id in ids if product_id not in found]
+        }
+    except Exception as e:
+        return {"error": str(e)}
+    finally:
+        db.close()
+
+# Price drops across the catalog, newest first
+@app.get("/products/price-drops")
+def get_price_drops(
+    since_hours: float = Query(24, gt=0, le=24 * 90, description="Only drops recorded in the last N hours"),
+    min_drop_percent: float = Query(0, ge=0, lt=100, description="Smallest drop to include, in percent"),
+    limit: int = Query(50, ge=1, le=500)
+):
+    db = SessionLocal()
+    try:
+        drops = recent_drops(db, datetime.utcnow() - timedelta(hours=since_hours), min_drop_percent, limit)
+        products = fetch_rows_by_id(db, [drop.product_id for drop in drops])
+        return {
+            "drops": [
+                {
+                    "recorded_at": drop.recorded_at,
+                    "price": drop.price,
+                    "previous_price": drop.previous_price,
+                    "drop_percent": round(100 * (1 - drop.price / drop.previous_price), 2),
+                    "product": products[drop.product_id]
+                }
+                for drop in drops if drop.product_id in products
+            ]
+        }
+    except Exception as e:
+        return {"error": str(e)}
+    finally:
+        db.close()
+
+# Price timeline of one listing (every product row with its product_url shares it)
+@app.get("/products/{product_id}/price-history")
+def get_price_history(
+    product_id: int,
+    since: Optional[datetime] = Query(None, description="Only changes at or after this time (UTC)"),
+    until: Optional[datetime] = Query(None, description="Only changes before this time (UTC)")
+):
+    db = SessionLocal()
+    try:
+        product_url = db.query(Product.product_url).filter(Product.id == product_id).scalar()
+        if product_url is None and db.query(Product.id).filter(Product.id == product_id).first() is None:
+            return {"error": f"Product with ID {product_id} not found."}
+        return {
+            "product_id": product_id,
+            "prices": [
+                {"recorded_at": row.recorded_at, "price": row.price, "previous_price": row.previous_price}
+                for row in price_timeline(db, product_url, since, until)
+            ]
+        }
+    except Exception as e:
+        return {"error": str(e)}
+    finally:
+        db.close()
+
+# Product detail pages: "you may also like" from precomputed TF-IDF vectors
+@app.get("/products/{product_id}/similar")
+def get_similar_products(
+    product_id: int,
+    limit: int = Query(10, ge=1, le=100, description="Maximum similar products"),
+    min_price: Optional[float] = Query(None, description="Minimum price"),
+    max_price: Optional[float] = Query(None, description="Maximum price"),
+    price_band: Optional[float] = Query(None, gt=0, description="Keep prices within this fraction of the product's (0.5 = /1.5 .. x1.5)"),
+    exact: bool = Query(False, description="Score every candidate instead of capping the postings scanned"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return (e.g. 'id,title,price')")
+):
+    """
+    Products most similar to product_id by title/description words, brand, category
+    and color, best first, each with its cosine "similarity".
+    """
+    db: Session = SessionLocal()
+    try:
+        similar_index.ensure_current(db)
+        neighbours = similar_index.similar(
+            product_id, limit, min_price=min_price, max_price=max_price, price_band=price_band, exact=exact
+        )
+        if neighbours is None:
+            return {"error": f"Product with ID {product_id} not found."}
+
+        found = fetch_rows_by_id(db, [neighbour_id for neighbour_id, _ in neighbours], parse_fields(fields))
+        products = []
+        for neighbour_id, similarity in neighbours:
+            if neighbour_id in found:
+                products.append({**found[neighbour_id], "similarity": similarity})
+        return {"product_id": product_id, "products": products}
+
+    except Exception as e:
+        return {"error": str(e)}
+
+    finally:
+        db.close()
+
 # GET/products/{product_id} to view one product
 @app.get("/products/{product_id}")
 def get_product_by_id(product_id: int):
     db = SessionLocal()
     try:
-        product = db.query(Product).filter(Product.id == product_id).first()
+        product = db.query(Product).options(undefer_group("detail")).filter(Product.id == product_id).first()
         if product:
             return product
         else:
@@ -626,8 +881,13 @@ def delete_product(product_id: int):
         if product is None:
             return {"detail": "Product not found"}, 404
 
+        removed = (product.brand, product.title)
         db.delete(product)
+        remove_cluster_rows(db, [product_id])
+        new_version = bump_catalog_version(db)
         db.commit()
+        suggest_index.apply_change(new_version, removed=[removed])
+        similar_index.apply_change(new_version, removed_ids=[product_id])
 
         return {"message": "Product deleted successfully!"}
 
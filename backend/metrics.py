@@ -0,0 +1,247 @@
+"""
+Lightweight request and query metrics in Prometheus text format
+
+- MetricsMiddleware times every request per route template
+- StageTimer splits endpoint time into db_fetch / filter / sort / serialize
+- instrument_engine hooks SQLAlchemy cursor events to count and time SQL statements
+- render() produces the /metrics payload
+
+Metrics are per process. Under uvicorn --workers N each scrape of /metrics
+reaches one worker, so every sample carries a worker="<pid>" label; sum over
+it (and expect a new series when a worker restarts).
+"""
+
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from sqlalchemy import event
+
+# Added to every sample: which worker process reported it
+PROCESS_LABELS = {"worker": str(os.getpid())}
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def _labels(self, key: tuple) -> dict:
+        return dict(zip(self.labelnames, key))
+
+    def samples(self):
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, labels, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels({**PROCESS_LABELS, **labels})} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [("_total", self._labels(key), value) for key, value in items]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), function=None):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def samples(self):
+        if self.function is not None:
+            return [("", {}, self.function())]
+        with self._lock:
+            items = list(self._values.items())
+        return [("", self._labels(key), value) for key, value in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        samples = []
+        for key, counts, total in items:
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                samples.append(("_bucket", {**labels, "le": _format_value(bound)}, cumulative))
+            samples.append(("_sum", labels, total))
+            samples.append(("_count", labels, cumulative))
+        return samples
+
+
+REGISTRY = []
+
+
+def render() -> str:
+    """All registered metrics in Prometheus text exposition format"""
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+def _resident_memory_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+REQUEST_LATENCY = Histogram(
+    "retrofy_http_request_duration_seconds", "HTTP request latency by route", ("route", "method", "status")
+)
+STAGE_LATENCY = Histogram(
+    "retrofy_endpoint_stage_duration_seconds", "Time spent per endpoint stage", ("route", "stage")
+)
+ROWS_SCANNED = Counter("retrofy_rows_scanned", "Catalog rows evaluated by filters", ("route",))
+ROWS_MATCHED = Counter("retrofy_rows_matched", "Catalog rows that passed all filters", ("route",))
+ROWS_RETURNED = Counter("retrofy_rows_returned", "Rows returned to the client", ("route",))
+SQL_STATEMENTS = Counter("retrofy_sql_statements", "SQL statements executed", ("statement",))
+SQL_DURATION = Histogram("retrofy_sql_statement_duration_seconds", "SQL statement latency", ("statement",))
+PROCESS_MEMORY = Gauge(
+    "retrofy_process_resident_memory_bytes", "Resident memory of this worker", function=_resident_memory_bytes
+)
+
+
+class StageTimer:
+    """Records the time between successive mark() calls as endpoint stages"""
+
+    def __init__(self, route: str):
+        self.route = route
+        self._last = time.perf_counter()
+
+    def mark(self, stage: str):
+        now = time.perf_counter()
+        STAGE_LATENCY.observe(now - self._last, route=self.route, stage=stage)
+        self._last = now
+
+
+def record_rows(route: str, scanned: int, matched: int, returned: int):
+    ROWS_SCANNED.inc(scanned, route=route)
+    ROWS_MATCHED.inc(matched, route=route)
+    ROWS_RETURNED.inc(returned, route=route)
+
+
+def instrument_engine(engine):
+    """Count and time every SQL statement the engine executes"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["metrics_query_start"].pop()
+        kind = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+        SQL_STATEMENTS.inc(statement=kind)
+        SQL_DURATION.observe(elapsed, statement=kind)
+
+    @event.listens_for(engine, "handle_error")
+    def _handle_error(context):
+        starts = context.connection.info.get("metrics_query_start") if context.connection else None
+        if starts:
+            starts.pop()
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency per route template (not per raw path)"""
+
+    def __init__(self, app, routes):
+        self.app = app
+        self.routes = routes
+        self._templates = None
+
+    def _route_template(self, scope) -> str:
+        if self._templates is None:
+            self._templates = {getattr(route, "endpoint", None): route.path for route in self.routes}
+        return self._templates.get(scope.get("endpoint"), "unmatched")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            REQUEST_LATENCY.observe(
+                time.perf_counter() - start,
+                route=self._route_template(scope), method=scope["method"], status=status[0]
+            )
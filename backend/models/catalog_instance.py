@@ -0,0 +1,9 @@
+from sqlalchemy import Column, Integer, String
+from database import Base
+
+class CatalogInstance(Base):
+    __tablename__ = "catalog_instance"
+
+    id = Column(Integer, primary_key=True)
+    # Random id written once per database; version numbers restart when a database is recreated, this doesn't
+    instance_id = Column(String, nullable=False)
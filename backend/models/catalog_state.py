@@ -0,0 +1,8 @@
+from sqlalchemy import Column, Integer
+from database import Base
+
+class CatalogState(Base):
+    __tablename__ = "catalog_state"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,11 @@
+from sqlalchemy import Column, Integer, String, DateTime
+from database import Base
+
+class IngestChunk(Base):
+    __tablename__ = "ingest_chunks"
+
+    # Client-supplied Idempotency-Key; a retried chunk with the same key is not re-inserted
+    key = Column(String, primary_key=True)
+    rows = Column(Integer, nullable=False)
+    catalog_version = Column(Integer, nullable=False)
+    created_at = Column(DateTime, nullable=False)
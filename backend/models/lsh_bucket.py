@@ -0,0 +1,11 @@
+from sqlalchemy import Column, Integer, BigInteger
+from database import Base
+
+class LshBucket(Base):
+    __tablename__ = "lsh_buckets"
+    # Rows live in (bucket, product_id) order: one B-tree, and a bucket's members are adjacent
+    __table_args__ = {"sqlite_with_rowid": False}
+
+    # Hash of one band of a MinHash signature; products sharing a bucket are duplicate candidates
+    bucket = Column(BigInteger, primary_key=True, autoincrement=False)
+    product_id = Column(Integer, primary_key=True, autoincrement=False)
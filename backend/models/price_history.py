@@ -0,0 +1,18 @@
+from sqlalchemy import Column, Integer, BigInteger, Float, DateTime, Index
+from database import Base
+
+class PriceHistory(Base):
+    __tablename__ = "price_history"
+    __table_args__ = (
+        Index("ix_price_history_listing_time", "listing_key", "recorded_at"),
+    )
+
+    # Append-only: one row per observed price change of a listing (and its first price)
+    id = Column(Integer, primary_key=True)
+    # Hash of the listing's product_url; stable across syncs, unlike product ids
+    listing_key = Column(BigInteger, nullable=False)
+    # The product row that carried this price when it was ingested
+    product_id = Column(Integer, nullable=False)
+    price = Column(Float)
+    previous_price = Column(Float)
+    recorded_at = Column(DateTime, nullable=False, index=True)
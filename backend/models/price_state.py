@@ -0,0 +1,11 @@
+from sqlalchemy import Column, Integer, BigInteger, Float
+from database import Base
+
+class PriceState(Base):
+    __tablename__ = "price_state"
+    __table_args__ = {"sqlite_with_rowid": False}
+
+    # Last price seen per listing; ingestion compares hashes against it to detect changes
+    listing_key = Column(BigInteger, primary_key=True, autoincrement=False)
+    price_hash = Column(Integer, nullable=False)
+    price = Column(Float)
@@ -1,4 +1,5 @@
 from sqlalchemy import Column, Integer, String, Float
+from sqlalchemy.orm import deferred
 from database import Base
 
 class Product(Base):
@@ -9,9 +10,10 @@ class Product(Base):
     brand = Column(String, index=True)
     category = Column(String, index=True)
     color = Column(String, index=True)
-    description = Column(String)
+    # Wide columns, not needed to filter most queries: loaded on access or via
+    # undefer()/undefer_group("detail") (see product_fields.hydrate_products)
+    description = deferred(Column(String), group="detail")
     price = Column(Float)
-    image_url = Column(String)
+    image_url = deferred(Column(String), group="detail")
     platform_name = Column(String)
-    product_url = Column(String)
-
+    product_url = deferred(Column(String), group="detail")
@@ -0,0 +1,11 @@
+from sqlalchemy import Column, Integer, LargeBinary
+from database import Base
+
+class ProductCluster(Base):
+    __tablename__ = "product_clusters"
+
+    # One row per product: the near-duplicate cluster it belongs to (the id of a member product)
+    product_id = Column(Integer, primary_key=True)
+    cluster_id = Column(Integer, nullable=False, index=True)
+    # MinHash signature (uint32 array), compared against later listings
+    signature = Column(LargeBinary, nullable=False)
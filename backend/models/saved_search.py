@@ -0,0 +1,16 @@
+from sqlalchemy import Column, Integer, String, Float, DateTime
+from database import Base
+
+class SavedSearch(Base):
+    __tablename__ = "saved_searches"
+
+    id = Column(Integer, primary_key=True, index=True)
+    # Customer the alerts belong to (account id or email)
+    owner = Column(String, nullable=False, index=True)
+    name = Column(String)
+    q = Column(String)
+    brand = Column(String)
+    category = Column(String)
+    min_price = Column(Float)
+    max_price = Column(Float)
+    created_at = Column(DateTime, nullable=False)
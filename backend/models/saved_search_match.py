@@ -0,0 +1,11 @@
+from sqlalchemy import Column, Integer, DateTime, ForeignKey, UniqueConstraint
+from database import Base
+
+class SavedSearchMatch(Base):
+    __tablename__ = "saved_search_matches"
+    __table_args__ = (UniqueConstraint("saved_search_id", "product_id"),)
+
+    id = Column(Integer, primary_key=True)
+    saved_search_id = Column(Integer, ForeignKey("saved_searches.id", ondelete="CASCADE"), nullable=False, index=True)
+    product_id = Column(Integer, nullable=False)
+    matched_at = Column(DateTime, nullable=False)
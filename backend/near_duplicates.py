@@ -0,0 +1,319 @@
+"""
+Cross-platform near-duplicate detection (MinHash + LSH)
+
+The same bag listed on several platforms, or relisted with a reworded title,
+should be one result, not five. At ingest every product gets a MinHash
+signature over its shingles:
+- normalized title words and word pairs
+- word 3-shingles of the start of the description
+- the brand, and a logarithmic price bucket
+
+The signature is split into LSH_BANDS bands. Each band is hashed into a bucket
+stored in lsh_buckets, so products sharing any band are candidates. Candidates
+are then verified: the estimated Jaccard similarity must be at least
+DUPLICATE_SIMILARITY, brands and colors must agree and prices must be within
+PRICE_TOLERANCE. Finding candidates is an indexed lookup per band, and buckets
+stop taking members at MAX_BUCKET_SIZE, so the work per product is bounded no
+matter how large the catalog grows.
+
+Verified duplicates are linked into one cluster in product_clusters. The
+cluster id is the smallest member product id at link time, and clusters merge
+when a listing bridges two of them. Search can collapse each cluster to its
+best-ranked member.
+
+Products inserted before this existed are assigned by running this module:
+    python near_duplicates.py
+"""
+
+import hashlib
+import math
+from array import array
+from operator import eq
+
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.orm import Session
+
+from fuzzy_index import vocabulary_words
+from models.lsh_bucket import LshBucket
+from models.product import Product
+from models.product_cluster import ProductCluster
+from product_fields import ID_CHUNK_SIZE
+
+NUM_HASHES = 64
+# 16 bands of 4 rows: pairs with Jaccard 0.6 become candidates ~89% of the time, 0.7 ~99%
+LSH_BANDS = 16
+ROWS_PER_BAND = NUM_HASHES // LSH_BANDS
+DUPLICATE_SIMILARITY = 0.6
+# Products stored per bucket. A full bucket (a very common listing) still yields its members as
+# candidates but takes no new ones, which bounds the work per product at LSH_BANDS x this
+MAX_BUCKET_SIZE = 20
+# Duplicates' prices may differ by this fraction of the lower price (fees, currency, markdowns)
+PRICE_TOLERANCE = 0.25
+PRICE_BUCKET_RATIO = 1.25
+DESCRIPTION_WORDS = 30
+BACKFILL_BATCH_SIZE = 2000
+
+_MAX_HASH = (1 << 32) - 1
+
+
+def _shingle_hashes(shingle: str) -> array:
+    """NUM_HASHES independent 32-bit hashes of a shingle, from one extendable-output digest"""
+    # Deterministic across processes: signatures stored by one worker are compared by every other
+    return array("I", hashlib.shake_128(shingle.encode("utf-8")).digest(4 * NUM_HASHES))
+
+
+def shingles(product: dict) -> set:
+    """The shingle set a product's signature is computed over"""
+    title_words = vocabulary_words(product.get("title"))
+    found = {"t:" + word for word in title_words}
+    found.update(f"t:{first} {second}" for first, second in zip(title_words, title_words[1:]))
+    description_words = vocabulary_words(product.get("description"))[:DESCRIPTION_WORDS]
+    found.update("d:" + " ".join(description_words[start:start + 3]) for start in range(len(description_words) - 2))
+    brand = folded(product.get("brand"))
+    if brand:
+        found.add("b:" + brand)
+    price = product.get("price")
+    if price and price > 0:
+        found.add(f"p:{math.floor(math.log(price, PRICE_BUCKET_RATIO))}")
+    return found
+
+
+def minhash(product: dict) -> array:
+    """NUM_HASHES-value MinHash signature of the product's shingles"""
+    hashes = [_shingle_hashes(shingle) for shingle in shingles(product)]
+    if not hashes:
+        return array("I", [_MAX_HASH] * NUM_HASHES)
+    # Element-wise minimum: position i is the min-hash under the i-th hash function
+    return array("I", map(min, zip(*hashes)))
+
+
+def band_buckets(signature: array) -> list:
+    """One signed 64-bit bucket key per band (the band index is part of the key)"""
+    keys = []
+    for band in range(LSH_BANDS):
+        values = signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]
+        digest = hashlib.blake2b(bytes([band]) + values.tobytes(), digest_size=8).digest()
+        keys.append(int.from_bytes(digest, "little", signed=True))
+    return keys
+
+
+def estimated_similarity(first: array, second: array) -> float:
+    return sum(map(eq, first, second)) / NUM_HASHES
+
+
+def folded(value) -> str:
+    return " ".join(vocabulary_words(value))
+
+
+def is_duplicate(first_signature: array, first_facets: tuple, first_price,
+                 second_signature: array, second_facets: tuple, second_price) -> bool:
+    """
+    Verify an LSH candidate pair: (folded brand, folded color) agree where both are known,
+    prices are close, signatures are similar
+    """
+    for first_value, second_value in zip(first_facets, second_facets):
+        if first_value and second_value and first_value != second_value:
+            return False
+    if first_price and second_price:
+        low, high = sorted((first_price, second_price))
+        if high - low > PRICE_TOLERANCE * low:
+            return False
+    return estimated_similarity(first_signature, second_signature) >= DUPLICATE_SIMILARITY
+
+
+class _ClusterUnion:
+    """Union-find over cluster ids; the smallest id of a merged group is its root"""
+
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, node: int) -> int:
+        parent = self.parent.setdefault(node, node)
+        if parent != node:
+            parent = self.parent[node] = self.find(parent)
+        return parent
+
+    def union(self, first: int, second: int) -> int:
+        first, second = self.find(first), self.find(second)
+        if first != second:
+            first, second = min(first, second), max(first, second)
+            self.parent[second] = first
+        return first
+
+
+def _load_candidates(db: Session, buckets: set) -> dict:
+    """{bucket: [product ids]} for stored products in the given buckets"""
+    found = {}
+    buckets = list(buckets)
+    for start in range(0, len(buckets), ID_CHUNK_SIZE):
+        chunk = buckets[start:start + ID_CHUNK_SIZE]
+        for bucket, product_id in db.execute(
+            select(LshBucket.bucket, LshBucket.product_id).where(LshBucket.bucket.in_(chunk))
+        ):
+            found.setdefault(bucket, []).append(product_id)
+    return found
+
+
+def _load_stored(db: Session, product_ids: set) -> dict:
+    """{product id: (cluster id, signature, (folded brand, folded color), price)} for stored candidates"""
+    stored = {}
+    # Few distinct brands and colors: fold each pair once
+    facets = {}
+    product_ids = list(product_ids)
+    for start in range(0, len(product_ids), ID_CHUNK_SIZE):
+        chunk = product_ids[start:start + ID_CHUNK_SIZE]
+        rows = db.execute(
+            select(ProductCluster.product_id, ProductCluster.cluster_id, ProductCluster.signature,
+                   Product.brand, Product.color, Product.price)
+            .join(Product, Product.id == ProductCluster.product_id)
+            .where(ProductCluster.product_id.in_(chunk))
+        )
+        for product_id, cluster_id, signature, brand, color, price in rows:
+            if (brand, color) not in facets:
+                facets[brand, color] = (folded(brand), folded(color))
+            stored[product_id] = (cluster_id, array("I", signature), facets[brand, color], price)
+    return stored
+
+
+def assign_clusters(db: Session, product_ids: list, products: list) -> int:
+    """
+    Link newly inserted products to near-duplicates (stored or earlier in the batch);
+    adds rows to the caller's transaction. Returns how many products joined an existing cluster.
+    """
+    if not product_ids:
+        return 0
+    signatures = [minhash(product) for product in products]
+    product_buckets = [band_buckets(signature) for signature in signatures]
+    candidates = _load_candidates(db, {bucket for buckets in product_buckets for bucket in buckets})
+    stored = _load_stored(db, {product_id for ids in candidates.values() for product_id in ids})
+
+    clusters = _ClusterUnion()
+    batch = {}
+    # bucket -> products of this batch stored in it
+    bucket_members = {}
+    duplicates = 0
+    for product_id, product, signature, buckets in zip(product_ids, products, signatures, product_buckets):
+        cluster = clusters.find(product_id)
+        product_facets, price = (folded(product.get("brand")), folded(product.get("color"))), product.get("price")
+        seen = set()
+        for bucket in buckets:
+            for candidate_id in candidates.get(bucket, ()):
+                if candidate_id in seen:
+                    continue
+                seen.add(candidate_id)
+                known = batch.get(candidate_id) or stored.get(candidate_id)
+                if known is None:
+                    continue
+                candidate_cluster, candidate_signature, candidate_facets, candidate_price = known
+                # Already linked through another member
+                if clusters.find(candidate_cluster) == cluster:
+                    continue
+                if is_duplicate(signature, product_facets, price, candidate_signature, candidate_facets, candidate_price):
+                    cluster = clusters.union(cluster, candidate_cluster)
+        if cluster != product_id:
+            duplicates += 1
+        batch[product_id] = (product_id, signature, product_facets, price)
+        # Later products in the batch see this one as a candidate
+        for bucket in buckets:
+            members = candidates.setdefault(bucket, [])
+            if len(members) < MAX_BUCKET_SIZE:
+                members.append(product_id)
+                bucket_members.setdefault(bucket, set()).add(product_id)
+
+    # Stored clusters bridged by this batch are merged into their smallest id
+    merged = {}
+    for cluster_id in {known[0] for known in stored.values()}:
+        root = clusters.find(cluster_id)
+        if root != cluster_id:
+            merged.setdefault(root, []).append(cluster_id)
+    for root, cluster_ids in merged.items():
+        db.execute(update(ProductCluster).where(ProductCluster.cluster_id.in_(cluster_ids)).values(cluster_id=root))
+
+    # Core inserts: no ORM bookkeeping for rows nothing reads back in this session
+    db.execute(insert(ProductCluster.__table__), [
+        {"product_id": product_id, "cluster_id": clusters.find(product_id), "signature": signature.tobytes()}
+        for product_id, signature in zip(product_ids, signatures)
+    ])
+    bucket_rows = [
+        {"bucket": bucket, "product_id": product_id}
+        for product_id, buckets in zip(product_ids, product_buckets) for bucket in buckets
+        if product_id in bucket_members.get(bucket, ())
+    ]
+    if bucket_rows:
+        db.execute(insert(LshBucket.__table__), bucket_rows)
+    return duplicates
+
+
+def remove_products(db: Session, product_ids: list = None):
+    """Drop cluster and bucket rows of deleted products (all of them when product_ids is None)"""
+    if product_ids is None:
+        db.execute(delete(LshBucket))
+        db.execute(delete(ProductCluster))
+        return
+    # Bucket rows are keyed by bucket: recompute the products' buckets from their signatures
+    signatures = db.execute(
+        select(ProductCluster.product_id, ProductCluster.signature).where(ProductCluster.product_id.in_(product_ids))
+    ).all()
+    for product_id, signature in signatures:
+        db.execute(delete(LshBucket).where(
+            LshBucket.bucket.in_(band_buckets(array("I", signature))), LshBucket.product_id == product_id
+        ))
+    db.execute(delete(ProductCluster).where(ProductCluster.product_id.in_(product_ids)))
+
+
+def cluster_ids_for(db: Session, product_ids: list) -> dict:
+    """{product id: cluster id}; products without a cluster row are left out"""
+    found = {}
+    for start in range(0, len(product_ids), ID_CHUNK_SIZE):
+        chunk = product_ids[start:start + ID_CHUNK_SIZE]
+        found.update(db.execute(
+            select(ProductCluster.product_id, ProductCluster.cluster_id).where(ProductCluster.product_id.in_(chunk))
+        ).all())
+    return found
+
+
+def collapse_duplicates(db: Session, product_ids: list) -> list:
+    """Positions in product_ids to keep: the first (best-ranked) product of each cluster"""
+    clusters = cluster_ids_for(db, product_ids)
+    seen = set()
+    keep = []
+    for position, product_id in enumerate(product_ids):
+        cluster_id = clusters.get(product_id, product_id)
+        if cluster_id not in seen:
+            seen.add(cluster_id)
+            keep.append(position)
+    return keep
+
+
+def backfill_clusters(db: Session) -> int:
+    """Assign clusters to products that have none, in id order; returns the number processed"""
+    processed = 0
+    last_id = 0
+    while True:
+        rows = db.execute(
+            select(Product.id, Product.title, Product.brand, Product.color, Product.description, Product.price)
+            .outerjoin(ProductCluster, ProductCluster.product_id == Product.id)
+            .where(ProductCluster.product_id.is_(None), Product.id > last_id)
+            .order_by(Product.id).limit(BACKFILL_BATCH_SIZE)
+        ).all()
+        if not rows:
+            return processed
+        products = [
+            {"title": title, "brand": brand, "color": color, "description": description, "price": price}
+            for _, title, brand, color, description, price in rows
+        ]
+        assign_clusters(db, [row[0] for row in rows], products)
+        db.commit()
+        processed += len(rows)
+        last_id = rows[-1][0]
+
+
+if __name__ == "__main__":
+    from database import Base, SessionLocal, engine
+
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    try:
+        print(f"Assigned clusters to {backfill_clusters(session)} products")
+    finally:
+        session.close()
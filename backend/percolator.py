@@ -0,0 +1,323 @@
+"""
+Saved-search alerts: reverse (percolator) matching at ingest time
+
+Instead of re-running every saved search against the catalog, each newly
+inserted product is matched against the saved searches that could possibly
+accept it.
+
+A saved search is compiled into
+- a predicate with the exact semantics of /products/search: updated_search_logic
+  for q, smart_category_match for category, filters_match for brand and price
+  (evaluated over a NormalizedProduct, so each product is lowercased and
+  accent-stripped once, not once per candidate search)
+- necessary clauses: lists of alternative substrings, at least one of which must
+  occur in the product text for the predicate to hold (the brand filter, the
+  category's smart terms, the first q term, ...)
+
+The search is indexed under one n-gram (up to 3 chars) of every alternative of its
+most selective clause, chosen with n-gram frequencies sampled from the catalog.
+A product looks up the n-grams of its text, so only searches sharing a rare
+n-gram with it are verified, once per group of searches with identical filters.
+Searches with no text clause (price only) are checked against every product.
+"""
+
+import threading
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session
+
+from models.product import Product
+from models.saved_search import SavedSearch
+from models.saved_search_match import SavedSearchMatch
+from product_fields import ID_CHUNK_SIZE
+from search_logic import ALL_CATEGORY_TERMS, SMART_CATEGORY_TERMS, remove_accents
+
+GRAM_SIZE = 3
+# Recent products used to estimate n-gram frequencies when choosing index keys
+STATS_SAMPLE_SIZE = 5000
+# Match rows inserted per statement
+MATCH_INSERT_BATCH = 10000
+
+
+class NormalizedProduct:
+    """The lowercased/accent-stripped texts the search rules read, computed once per product"""
+
+    __slots__ = ("price", "brand_text", "title_text", "search_text", "smart_text", "probe_texts")
+
+    def __init__(self, product: dict):
+        title, brand, description = product.get("title"), product.get("brand"), product.get("description")
+        self.price = product.get("price")
+        self.brand_text = remove_accents(brand.lower()) if brand else ""
+        self.title_text = remove_accents(title.lower()) if title else ""
+        # updated_search_logic's searchable text
+        search_text = ""
+        if title:
+            search_text += self.title_text + " "
+        if brand:
+            search_text += self.brand_text + " "
+        if description:
+            search_text += remove_accents(description.lower()) + " "
+        self.search_text = search_text
+        # smart_category_match's text (lowercased, accents kept)
+        self.smart_text = f"{title or ''} {description or ''} {product.get('category') or ''}".lower()
+        # Every text a necessary substring can occur in, accent-stripped like the index keys
+        self.probe_texts = (search_text, remove_accents(self.smart_text))
+
+    def grams(self, sizes) -> set:
+        found = set()
+        for text in self.probe_texts:
+            for size in sizes:
+                found.update(text[start:start + size] for start in range(len(text) - size + 1))
+        return found
+
+
+def _smart_predicate(term: str):
+    """smart_category_match(term, product): (memo key, predicate, necessary clause)"""
+    search_lower = term.lower().strip()
+    if not search_lower:
+        return None, None, None
+    key = ("smart", search_lower)
+    if search_lower in ALL_CATEGORY_TERMS:
+        terms = ALL_CATEGORY_TERMS[search_lower]
+        return key, (lambda product: any(t in product.smart_text for t in terms)), [remove_accents(t) for t in terms]
+    return key, (lambda product: search_lower in product.smart_text), [remove_accents(search_lower)]
+
+
+def _query_predicate(q: str):
+    """updated_search_logic(q, product): (memo key, predicate, necessary clause)"""
+    search_terms = q.strip().lower().split()
+    if len(search_terms) == 1:
+        term = search_terms[0]
+        if term in SMART_CATEGORY_TERMS:
+            return _smart_predicate(term)
+        term_clean = remove_accents(term)
+        return ("text", term_clean), (lambda product: term_clean in product.search_text), [term_clean]
+
+    full_search = " ".join(search_terms)
+    if full_search in SMART_CATEGORY_TERMS:
+        return _smart_predicate(full_search)
+
+    brand_clean = remove_accents(search_terms[0])
+    _, category_match, _ = _smart_predicate(" ".join(search_terms[1:]))
+    terms_clean = [remove_accents(term) for term in search_terms]
+
+    def matches(product) -> bool:
+        if brand_clean in product.brand_text or brand_clean in product.title_text:
+            return category_match(product)
+        return all(term in product.search_text for term in terms_clean)
+
+    # Both branches need the first term somewhere in the searchable text
+    return ("q", full_search), matches, [brand_clean]
+
+
+class CompiledSearch:
+    """
+    A saved search as (memo key, predicate) pairs, all of which must hold.
+    Searches that share a filter share its key, so match() evaluates it once per product.
+    """
+
+    def __init__(self, saved_search_id: int, q=None, brand=None, category=None, min_price=None, max_price=None):
+        self.id = saved_search_id
+        self.predicates = []
+        self.clauses = []
+
+        # Cheap price checks first
+        if min_price is not None:
+            self.predicates.append((("min_price", min_price), lambda product: product.price >= min_price))
+        if max_price is not None:
+            self.predicates.append((("max_price", max_price), lambda product: product.price <= max_price))
+        if q and q.strip():
+            key, predicate, clause = _query_predicate(q)
+            self.predicates.append((key, predicate))
+            self.clauses.append(clause)
+        if brand:
+            brand_clean = remove_accents(brand.lower())
+            self.predicates.append((
+                ("brand", brand_clean),
+                lambda product: brand_clean in product.brand_text or brand_clean in product.title_text
+            ))
+            self.clauses.append([brand_clean])
+        if category:
+            key, predicate, clause = _smart_predicate(category)
+            if predicate is not None:
+                self.predicates.append((key, predicate))
+                self.clauses.append(clause)
+
+        # An empty alternative matches anything, so its clause can't narrow candidates
+        self.clauses = [clause for clause in self.clauses if all(clause)]
+        # Searches with the same signature accept exactly the same products
+        self.signature = tuple(key for key, _ in self.predicates)
+
+    def matches(self, product: NormalizedProduct, memo: dict) -> bool:
+        for key, predicate in self.predicates:
+            result = memo.get(key)
+            if result is None:
+                result = memo[key] = predicate(product)
+            if not result:
+                return False
+        return True
+
+
+class Percolator:
+    """
+    In-memory index of compiled saved searches, kept in step with the saved_searches table.
+    Searches with identical filters form one group, indexed and verified once for all members.
+    """
+
+    def __init__(self):
+        # filter signature -> representative CompiledSearch / member saved search ids / index keys
+        self.groups = {}
+        self.members = {}
+        self.group_keys = {}
+        # saved search id -> filter signature
+        self.signatures = {}
+        # n-gram -> signatures of groups indexed under it
+        self.index = {}
+        self.scan_all = set()
+        self.gram_sizes = {GRAM_SIZE}
+        self.gram_counts = Counter()
+        self.loaded_max_id = 0
+        self._stats_loaded = False
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.signatures)
+
+    def _load_stats(self, db: Session):
+        """n-gram document frequencies over the most recent products"""
+        rows = db.execute(
+            select(Product.title, Product.brand, Product.description, Product.category)
+            .order_by(Product.id.desc()).limit(STATS_SAMPLE_SIZE)
+        )
+        for title, brand, description, category in rows:
+            product = NormalizedProduct({"title": title, "brand": brand, "description": description, "category": category})
+            self.gram_counts.update(product.grams((GRAM_SIZE,)))
+        self._stats_loaded = True
+
+    def _choose_keys(self, clauses) -> list:
+        """Index n-grams for the clause with the fewest expected candidates"""
+        best_keys, best_cost = None, None
+        for clause in clauses:
+            keys = []
+            for alternative in clause:
+                size = min(len(alternative), GRAM_SIZE)
+                grams = {alternative[start:start + size] for start in range(len(alternative) - size + 1)}
+                keys.append(min(grams, key=lambda gram: self.gram_counts.get(gram, 0)))
+            cost = sum(self.gram_counts.get(key, 0) for key in set(keys))
+            if best_cost is None or cost < best_cost:
+                best_keys, best_cost = sorted(set(keys)), cost
+        return best_keys or []
+
+    def add(self, search: CompiledSearch):
+        with self._lock:
+            self._remove(search.id)
+            signature = search.signature
+            self.signatures[search.id] = signature
+            members = self.members.get(signature)
+            if members is not None:
+                members.add(search.id)
+                return
+
+            keys = self._choose_keys(search.clauses)
+            self.groups[signature] = search
+            self.members[signature] = {search.id}
+            self.group_keys[signature] = keys
+            if not keys:
+                self.scan_all.add(signature)
+            for key in keys:
+                self.index.setdefault(key, set()).add(signature)
+                self.gram_sizes.add(len(key))
+
+    def _remove(self, saved_search_id: int):
+        signature = self.signatures.pop(saved_search_id, None)
+        if signature is None:
+            return
+        members = self.members[signature]
+        members.discard(saved_search_id)
+        if members:
+            return
+        del self.groups[signature], self.members[signature]
+        self.scan_all.discard(signature)
+        for key in self.group_keys.pop(signature):
+            signatures = self.index[key]
+            signatures.discard(signature)
+            if not signatures:
+                del self.index[key]
+
+    def remove(self, saved_search_id: int):
+        with self._lock:
+            self._remove(saved_search_id)
+
+    def sync(self, db: Session):
+        """Pick up saved searches created (by any worker) since the last sync"""
+        if not self._stats_loaded:
+            self._load_stats(db)
+        new_searches = db.query(SavedSearch).filter(SavedSearch.id > self.loaded_max_id).order_by(SavedSearch.id).all()
+        for saved in new_searches:
+            self.add(compile_saved_search(saved))
+            self.loaded_max_id = saved.id
+
+    def match(self, product: dict) -> list:
+        """Ids of saved searches the product satisfies"""
+        normalized = NormalizedProduct(product)
+        matched = []
+        # Predicate results shared between candidate groups, for this product only
+        memo = {}
+        with self._lock:
+            candidates = set(self.scan_all)
+            index = self.index
+            for gram in normalized.grams(self.gram_sizes):
+                signatures = index.get(gram)
+                if signatures:
+                    candidates.update(signatures)
+            for signature in candidates:
+                if self.groups[signature].matches(normalized, memo):
+                    matched.extend(self.members[signature])
+        return matched
+
+
+def compile_saved_search(saved: SavedSearch) -> CompiledSearch:
+    return CompiledSearch(
+        saved.id, q=saved.q, brand=saved.brand, category=saved.category,
+        min_price=saved.min_price, max_price=saved.max_price
+    )
+
+
+def _insert_matches(db: Session, pairs: list) -> int:
+    # Searches deleted in another worker may still be in this worker's index
+    matched_ids = list({saved_search_id for saved_search_id, _ in pairs})
+    live = set()
+    for start in range(0, len(matched_ids), ID_CHUNK_SIZE):
+        chunk = matched_ids[start:start + ID_CHUNK_SIZE]
+        live.update(db.scalars(select(SavedSearch.id).where(SavedSearch.id.in_(chunk))))
+    now = datetime.utcnow()
+    rows = [
+        {"saved_search_id": saved_search_id, "product_id": product_id, "matched_at": now}
+        for saved_search_id, product_id in pairs if saved_search_id in live
+    ]
+    if rows:
+        db.execute(insert(SavedSearchMatch), rows)
+    return len(rows)
+
+
+def record_matches(db: Session, product_ids: list, products: list) -> int:
+    """Match newly inserted products against saved searches; adds match rows to the caller's transaction"""
+    percolator.sync(db)
+    if not len(percolator):
+        return 0
+    recorded = 0
+    pending = []
+    for product_id, product in zip(product_ids, products):
+        pending.extend((saved_search_id, product_id) for saved_search_id in percolator.match(product))
+        # Broad searches can match most products; keep memory bounded
+        if len(pending) >= MATCH_INSERT_BATCH:
+            recorded += _insert_matches(db, pending)
+            pending = []
+    if pending:
+        recorded += _insert_matches(db, pending)
+    return recorded
+
+
+percolator = Percolator()
@@ -0,0 +1,125 @@
+"""
+Price history
+
+Syncs re-ingest the whole catalog, so storing every price they see would grow
+price_history by the catalog size on each run. Instead, each listing has one
+price_state row with a hash of its last price. Ingestion hashes the incoming
+price, compares the hashes, and appends a price_history row only when they
+differ (or the listing is new). Unchanged listings cost a primary-key read and
+no write, so a sync writes rows in proportion to the prices that changed.
+
+Listings are identified by a hash of product_url (listing_key): each sync
+inserts fresh product rows, so product ids don't follow a listing from one sync
+to the next. Products without a product_url have no history.
+
+History rows carry previous_price, so the recent-drops feed is a range scan on
+recorded_at and a timeline is a range scan on (listing_key, recorded_at).
+"""
+
+import hashlib
+import zlib
+from datetime import datetime
+
+from sqlalchemy import insert, select, update
+from sqlalchemy.orm import Session
+
+from models.price_history import PriceHistory
+from models.price_state import PriceState
+from product_fields import ID_CHUNK_SIZE
+
+
+def listing_key(product_url) -> int:
+    """Signed 64-bit hash of a listing's URL (None without one)"""
+    if not product_url:
+        return None
+    digest = hashlib.blake2b(product_url.strip().encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+def price_hash(price) -> int:
+    """Hash of the price as stored to the cent, so float noise isn't a change"""
+    text = "none" if price is None else f"{float(price):.2f}"
+    return zlib.crc32(text.encode("ascii"))
+
+
+def _load_states(db: Session, keys: list) -> dict:
+    """{listing key: (price hash, price)} for listings seen before"""
+    states = {}
+    for start in range(0, len(keys), ID_CHUNK_SIZE):
+        chunk = keys[start:start + ID_CHUNK_SIZE]
+        for key, hashed, price in db.execute(
+            select(PriceState.listing_key, PriceState.price_hash, PriceState.price)
+            .where(PriceState.listing_key.in_(chunk))
+        ):
+            states[key] = (hashed, price)
+    return states
+
+
+def record_price_changes(db: Session, product_ids: list, products: list) -> int:
+    """
+    Append history rows for listings whose price changed (or that are new);
+    adds rows to the caller's transaction. Returns how many rows were recorded.
+    """
+    keyed = [
+        (listing_key(product.get("product_url")), product_id, product.get("price"))
+        for product_id, product in zip(product_ids, products)
+    ]
+    keyed = [entry for entry in keyed if entry[0] is not None]
+    if not keyed:
+        return 0
+    stored = _load_states(db, list({key for key, _, _ in keyed}))
+
+    now = datetime.utcnow()
+    history = []
+    # Latest state per changed listing; a listing repeated in the batch is compared against its earlier copy
+    changed = {}
+    for key, product_id, price in keyed:
+        hashed = price_hash(price)
+        state = changed.get(key) or stored.get(key)
+        if state is not None and state[0] == hashed:
+            continue
+        history.append({
+            "listing_key": key, "product_id": product_id, "price": price,
+            "previous_price": state[1] if state is not None else None, "recorded_at": now
+        })
+        changed[key] = (hashed, price)
+
+    if not history:
+        return 0
+    db.execute(insert(PriceHistory.__table__), history)
+    new_rows = [
+        {"listing_key": key, "price_hash": hashed, "price": price}
+        for key, (hashed, price) in changed.items() if key not in stored
+    ]
+    updated_rows = [
+        {"listing_key": key, "price_hash": hashed, "price": price}
+        for key, (hashed, price) in changed.items() if key in stored
+    ]
+    if new_rows:
+        db.execute(insert(PriceState.__table__), new_rows)
+    if updated_rows:
+        # Bulk UPDATE by primary key
+        db.execute(update(PriceState), updated_rows)
+    return len(history)
+
+
+def price_timeline(db: Session, product_url: str, since: datetime = None, until: datetime = None) -> list:
+    """Price history rows of one listing, oldest first, optionally within [since, until)"""
+    key = listing_key(product_url)
+    if key is None:
+        return []
+    query = select(PriceHistory).where(PriceHistory.listing_key == key)
+    if since is not None:
+        query = query.where(PriceHistory.recorded_at >= since)
+    if until is not None:
+        query = query.where(PriceHistory.recorded_at < until)
+    return db.scalars(query.order_by(PriceHistory.recorded_at, PriceHistory.id)).all()
+
+
+def recent_drops(db: Session, since: datetime, min_drop_percent: float = 0.0, limit: int = 50) -> list:
+    """Price decreases recorded since `since`, newest first"""
+    query = select(PriceHistory).where(
+        PriceHistory.recorded_at >= since,
+        PriceHistory.price < PriceHistory.previous_price * (1 - min_drop_percent / 100)
+    )
+    return db.scalars(query.order_by(PriceHistory.recorded_at.desc(), PriceHistory.id.desc()).limit(limit)).all()
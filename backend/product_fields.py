@@ -0,0 +1,58 @@
+"""
+Column projection for product responses
+
+List paths over SQL filter plain column rows holding only what their predicates
+read (load_filter_rows; no ORM objects, and the wide description only when a
+predicate needs it), then hydrate_products() fetches the output columns for just
+the final page by id. The wide columns are also deferred on the Product model.
+A `fields` parameter narrows the output further.
+"""
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from catalog_store import PRODUCT_FIELDS
+from models.product import Product
+
+# Bound parameters per IN (...) query; stays under SQLite's variable limit
+ID_CHUNK_SIZE = 500
+# Largest id list /products/batch accepts
+MAX_BATCH_IDS = 5000
+# Columns the Python filters and sort keys read, besides description
+FILTER_FIELDS = ["id", "title", "brand", "category", "color", "price", "platform_name"]
+
+
+def parse_fields(fields: str = None) -> list:
+    """'id,title,price' -> output field list (id always included); None/empty means all fields"""
+    if not fields:
+        return PRODUCT_FIELDS
+    requested = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = requested.difference(PRODUCT_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}. Available: {', '.join(PRODUCT_FIELDS)}")
+    requested.add("id")
+    return [name for name in PRODUCT_FIELDS if name in requested]
+
+
+def load_filter_rows(db: Session, with_description: bool = False) -> list:
+    """All products as lightweight rows with attribute access (row.brand, row.price, ...)"""
+    fields = FILTER_FIELDS + ["description"] if with_description else FILTER_FIELDS
+    return db.query(*(getattr(Product, name) for name in fields)).all()
+
+
+def fetch_rows_by_id(db: Session, ids: list, fields: list = PRODUCT_FIELDS) -> dict:
+    """{id: {field: value}} for the given ids, selecting only `fields`, in chunked IN queries"""
+    columns = [getattr(Product, name) for name in fields]
+    found = {}
+    for start in range(0, len(ids), ID_CHUNK_SIZE):
+        chunk = ids[start:start + ID_CHUNK_SIZE]
+        for row in db.execute(select(*columns).where(Product.id.in_(chunk))):
+            values = dict(zip(fields, row))
+            found[values["id"]] = values
+    return found
+
+
+def hydrate_products(db: Session, products: list, fields: list = PRODUCT_FIELDS) -> list:
+    """Output dicts for the final (partially loaded) products, in the same order"""
+    found = fetch_rows_by_id(db, [product.id for product in products], fields)
+    return [found[product.id] for product in products if product.id in found]
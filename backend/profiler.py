@@ -0,0 +1,168 @@
+"""
+Admin-only profiling for live hot-path analysis
+
+- sample_stacks(): wall-clock sampler over sys._current_frames() for N seconds,
+  returning collapsed stacks (flamegraph.pl / speedscope input)
+- profiled(): decorator adding ?profile=true per-request cProfile reports to an endpoint
+
+Both attribute time to the functions we usually care about (HOTSPOTS).
+Access requires the X-Admin-Token header to match RETROFY_ADMIN_TOKEN.
+"""
+
+import cProfile
+import functools
+import hmac
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+
+ADMIN_TOKEN = os.getenv("RETROFY_ADMIN_TOKEN")
+ADMIN_TOKEN_HEADER = "X-Admin-Token"
+
+MAX_STACK_DEPTH = 64
+TOP_FUNCTIONS = 25
+
+# Report label -> (source file suffix, function names)
+HOTSPOTS = {
+    "smart_category_match": ("search_logic.py", {"smart_category_match"}),
+    "updated_search_logic": ("search_logic.py", {"updated_search_logic"}),
+    "remove_accents": ("search_logic.py", {"remove_accents"}),
+    "orm_hydration": (os.path.join("sqlalchemy", "orm", "loading.py"), {"instances", "_instance"}),
+    "jsonable_encoder": (os.path.join("fastapi", "encoders.py"), {"jsonable_encoder"}),
+    # Filtering runs through the query planner; its predicates build bitmaps on the replica
+    "catalog_store_filter": ("query_planner.py", {"execute"}),
+    "predicate_bitmaps": (
+        "catalog_store.py", {"brand_or_title_rows", "any_field_rows", "smart_category_rows", "facet_rows", "rows_between"}
+    ),
+    "catalog_store_sort": ("catalog_store.py", {"top_rows"}),
+    "catalog_store_serialize": ("catalog_store.py", {"to_dicts"}),
+}
+
+_sampling_lock = threading.Lock()
+
+
+def require_admin(token):
+    """403 unless profiling is configured and the token matches"""
+    if not ADMIN_TOKEN or not token or not hmac.compare_digest(token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+
+def _hotspot(filename: str, function: str):
+    for label, (suffix, functions) in HOTSPOTS.items():
+        if function in functions and filename.endswith(suffix):
+            return label
+    return None
+
+
+def _frame_label(code) -> str:
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+def sample_stacks(seconds: float, interval: float = 0.005) -> dict:
+    """
+    Sample every other thread's stack until `seconds` have elapsed.
+    Returns collapsed stack counts plus the share of samples each hotspot appeared in.
+    """
+    if not _sampling_lock.acquire(blocking=False):
+        raise HTTPException(status_code=409, detail="A profiling session is already running")
+    try:
+        own_thread = threading.get_ident()
+        stacks = Counter()
+        hotspot_samples = Counter()
+        samples = 0
+        deadline = time.monotonic() + seconds
+
+        while time.monotonic() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_thread:
+                    continue
+                labels = []
+                seen = set()
+                while frame is not None and len(labels) < MAX_STACK_DEPTH:
+                    code = frame.f_code
+                    labels.append(_frame_label(code))
+                    hotspot = _hotspot(code.co_filename, code.co_name)
+                    if hotspot:
+                        seen.add(hotspot)
+                    frame = frame.f_back
+                stacks[";".join(reversed(labels))] += 1
+                hotspot_samples.update(seen)
+                samples += 1
+            time.sleep(interval)
+    finally:
+        _sampling_lock.release()
+
+    return {
+        "samples": samples,
+        "interval_seconds": interval,
+        "hotspots": {label: hotspot_samples[label] / samples if samples else 0.0 for label in HOTSPOTS},
+        "stacks": stacks,
+    }
+
+
+def collapsed_stacks(stacks: Counter) -> str:
+    """One 'frame;frame;frame count' line per distinct stack"""
+    return "\n".join(f"{stack} {count}" for stack, count in stacks.most_common()) + "\n"
+
+
+def profile_report(profile: cProfile.Profile) -> dict:
+    """Hotspot totals and the top functions by cumulative time"""
+    stats = pstats.Stats(profile)
+    hotspots = dict.fromkeys(HOTSPOTS, 0.0)
+    functions = []
+    for (filename, line, function), (_, calls, own_time, cumulative, _) in stats.stats.items():
+        hotspot = _hotspot(filename, function)
+        if hotspot:
+            hotspots[hotspot] += cumulative
+        functions.append({
+            "function": f"{os.path.basename(filename)}:{line}:{function}",
+            "calls": calls,
+            "own_seconds": round(own_time, 6),
+            "cumulative_seconds": round(cumulative, 6),
+        })
+    functions.sort(key=lambda entry: entry["cumulative_seconds"], reverse=True)
+    return {
+        "total_seconds": round(stats.total_tt, 6),
+        "hotspots": {label: round(seconds, 6) for label, seconds in hotspots.items()},
+        "top_functions": functions[:TOP_FUNCTIONS],
+    }
+
+
+def profiled(endpoint):
+    """
+    Let an endpoint be profiled per request with ?profile=true.
+    The endpoint must accept `request: Request` and `profile: bool` parameters.
+    The response becomes {"results": <original body>, "profile": <report>}.
+    """
+
+    @functools.wraps(endpoint)
+    def wrapper(*args, **kwargs):
+        if not kwargs.get("profile"):
+            return endpoint(*args, **kwargs)
+        require_admin(kwargs["request"].headers.get(ADMIN_TOKEN_HEADER))
+
+        profile = cProfile.Profile()
+        response = profile.runcall(endpoint, *args, **kwargs)
+
+        if isinstance(response, JSONResponse):
+            results = json.loads(response.body)
+            headers = {
+                name: value for name, value in response.headers.items()
+                if name.lower() not in ("content-length", "content-type")
+            }
+        else:
+            results, headers = response, {}
+        return JSONResponse(
+            content={"results": results, "profile": profile_report(profile)},
+            status_code=getattr(response, "status_code", 200),
+            headers=headers,
+        )
+
+    return wrapper
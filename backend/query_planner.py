@@ -0,0 +1,436 @@
+"""
+Query planning for the in-memory catalog replica
+
+compile_query() parses q / brand / category / price / facet parameters once per
+request into typed predicates (the same branches updated_search_logic takes per
+product). plan() estimates how many rows each predicate keeps and what it costs,
+then orders them so the most selective access path builds the candidate bitmap.
+Every later predicate is either intersected as a bitmap (cached or index-backed)
+or checked row by row on the candidates, whichever the cost model says is cheaper.
+"""
+
+from catalog_store import bitmap_from_rows, is_token_needle, iter_rows
+from search_logic import remove_accents, ALL_CATEGORY_TERMS, SMART_CATEGORY_TERMS
+
+SMART_TERM_SET = frozenset(SMART_CATEGORY_TERMS)
+
+# Cost units are roughly one Python-level substring check on one row's field
+ROW_CHECK_COST = 1.0
+# C-level scan of one packed text field, per row, plus the Python work per hit
+SCAN_COST_PER_ROW = 0.07
+SCAN_COST_PER_HIT = 1.0
+# Setting one row flag from a token posting list
+POSTING_COST = 0.07
+# Intersecting two row bitmaps, per row
+BITMAP_COST_PER_ROW = 0.002
+
+# Selectivity of uncached text predicates is sampled from evenly spaced row chunks
+SAMPLE_CHUNK_ROWS = 256
+SAMPLE_CHUNKS = 8
+
+
+class Estimate:
+    """Expected output rows of a predicate and the cost of building its full bitmap"""
+
+    def __init__(self, rows: float, scan_cost: float, exact: bool = False):
+        self.rows = rows
+        self.scan_cost = scan_cost
+        self.exact = exact
+
+
+def _sampled_rows(replica, packed, needle: str) -> float:
+    hits, sampled = packed.sample_rows_containing(needle, SAMPLE_CHUNK_ROWS, SAMPLE_CHUNKS)
+    return hits * replica.size / sampled if sampled else 0.0
+
+
+def _scan_cost(rows: int, hits: float) -> float:
+    return SCAN_COST_PER_ROW * rows + SCAN_COST_PER_HIT * hits
+
+
+def _token_rows_and_cost(replica, tokens, needle: str) -> tuple:
+    """Posting-count estimate and cost of answering needle from a token index"""
+    matched = tokens.matching_tokens(needle)
+    postings = tokens.posting_count(needle)
+    cost = _scan_cost(len(tokens.vocabulary), len(matched)) + POSTING_COST * postings
+    return min(postings, replica.size), cost
+
+
+def _brand_text(replica, row: int) -> str:
+    return replica.brand.folded[replica.brand.codes[row]]
+
+
+class Predicate:
+    """One compiled filter; bitmap() and row_matches() must agree on every row"""
+
+    access_path = "scan"
+    # Text fields a row check reads, for costing candidate checks
+    fields_checked = 1
+
+    def describe(self) -> dict:
+        raise NotImplementedError
+
+    def cached(self, replica) -> bool:
+        """True when bitmap() is a cache hit or an index lookup"""
+        return False
+
+    def estimate(self, replica) -> Estimate:
+        raise NotImplementedError
+
+    def bitmap(self, replica) -> int:
+        raise NotImplementedError
+
+    def row_matches(self, replica, row: int) -> bool:
+        raise NotImplementedError
+
+
+class BrandPredicate(Predicate):
+    """Accent-folded needle in the brand or the title"""
+
+    access_path = "brand_index"
+    fields_checked = 2
+
+    def __init__(self, needle: str):
+        self.needle = needle
+
+    def describe(self) -> dict:
+        return {"type": "brand_or_title", "needle": self.needle}
+
+    def cached(self, replica) -> bool:
+        return replica.cached_bitmap(("brand_or_title", self.needle)) is not None
+
+    def estimate(self, replica) -> Estimate:
+        bitmap = replica.cached_bitmap(("brand_or_title", self.needle))
+        if bitmap is not None:
+            return Estimate(bitmap.bit_count(), 0.0, exact=True)
+        if replica.title_tokens is not None and is_token_needle(self.needle):
+            rows, cost = _token_rows_and_cost(replica, replica.title_tokens, self.needle)
+            return Estimate(rows, cost)
+        rows = replica.brand.count_containing(self.needle, folded=True)
+        rows += _sampled_rows(replica, replica.title_text, self.needle)
+        rows = min(rows, replica.size)
+        return Estimate(rows, _scan_cost(replica.size, rows) + len(replica.brand.values))
+
+    def bitmap(self, replica) -> int:
+        return replica.brand_or_title_rows(self.needle)
+
+    def row_matches(self, replica, row: int) -> bool:
+        return self.needle in _brand_text(replica, row) or self.needle in replica.title_text.row_text(row)
+
+
+class TermPredicate(Predicate):
+    """Accent-folded needle in the title, brand or description"""
+
+    access_path = "token_index"
+    fields_checked = 3
+
+    def __init__(self, needle: str):
+        self.needle = needle
+
+    def describe(self) -> dict:
+        return {"type": "any_field", "needle": self.needle}
+
+    def cached(self, replica) -> bool:
+        return replica.cached_bitmap(("any_field", self.needle)) is not None
+
+    def estimate(self, replica) -> Estimate:
+        bitmap = replica.cached_bitmap(("any_field", self.needle))
+        if bitmap is not None:
+            return Estimate(bitmap.bit_count(), 0.0, exact=True)
+        if replica.description_tokens is not None and is_token_needle(self.needle):
+            title_rows, title_cost = _token_rows_and_cost(replica, replica.title_tokens, self.needle)
+            rows, cost = _token_rows_and_cost(replica, replica.description_tokens, self.needle)
+            return Estimate(min(title_rows + rows, replica.size), title_cost + cost)
+        title_rows = replica.brand.count_containing(self.needle, folded=True)
+        title_rows += _sampled_rows(replica, replica.title_text, self.needle)
+        rows = _sampled_rows(replica, replica.description_text, self.needle)
+        return Estimate(
+            min(title_rows + rows, replica.size),
+            _scan_cost(replica.size, title_rows) + _scan_cost(replica.size, rows),
+        )
+
+    def bitmap(self, replica) -> int:
+        return replica.any_field_rows(self.needle)
+
+    def row_matches(self, replica, row: int) -> bool:
+        needle = self.needle
+        return (
+            needle in _brand_text(replica, row)
+            or needle in replica.title_text.row_text(row)
+            or needle in replica.description_text.row_text(row)
+        )
+
+
+class SmartCategoryPredicate(Predicate):
+    """smart_category_match: any synonym of the category in title/description/category"""
+
+    access_path = "category_index"
+
+    def __init__(self, phrase: str):
+        self.phrase = phrase.lower().strip()
+        self.terms = ALL_CATEGORY_TERMS.get(self.phrase, [self.phrase])
+
+    def describe(self) -> dict:
+        return {"type": "smart_category", "phrase": self.phrase, "terms": list(self.terms)}
+
+    def cached(self, replica) -> bool:
+        return replica.cached_bitmap(("smart_category", self.phrase)) is not None
+
+    def estimate(self, replica) -> Estimate:
+        bitmap = replica.cached_bitmap(("smart_category", self.phrase))
+        if bitmap is not None:
+            return Estimate(bitmap.bit_count(), 0.0, exact=True)
+        rows = scan_cost = 0.0
+        for term in self.terms:
+            term_bitmap = replica.cached_bitmap(("smart_text", term))
+            if term_bitmap is not None:
+                rows += term_bitmap.bit_count()
+            else:
+                term_rows = _sampled_rows(replica, replica.smart_text, term)
+                rows += term_rows
+                scan_cost += _scan_cost(replica.size, term_rows)
+        return Estimate(min(rows, replica.size), scan_cost)
+
+    def bitmap(self, replica) -> int:
+        return replica.smart_category_rows(self.phrase)
+
+    def row_matches(self, replica, row: int) -> bool:
+        text = replica.smart_text.row_text(row)
+        return any(term in text for term in self.terms)
+
+
+class BrandCategoryQueryPredicate(Predicate):
+    """
+    Multi-word q: brand + category when the first word is found in the brand/title,
+    otherwise every word must be found somewhere
+    """
+
+    access_path = "token_index"
+    fields_checked = 3
+
+    def __init__(self, brand: BrandPredicate, category: SmartCategoryPredicate, terms: list):
+        self.brand = brand
+        self.category = category
+        self.terms = terms
+
+    def describe(self) -> dict:
+        return {
+            "type": "brand_category_or_all_terms",
+            "brand": self.brand.describe(),
+            "category": self.category.describe(),
+            "all_terms": [term.needle for term in self.terms],
+        }
+
+    def _parts(self):
+        return [self.brand, self.category] + self.terms
+
+    def cached(self, replica) -> bool:
+        return all(part.cached(replica) for part in self._parts())
+
+    def estimate(self, replica) -> Estimate:
+        size = replica.size or 1
+        brand = self.brand.estimate(replica)
+        category = self.category.estimate(replica)
+        terms = [term.estimate(replica) for term in self.terms]
+        rows = brand.rows * category.rows / size + min(term.rows for term in terms)
+        scan_cost = brand.scan_cost + category.scan_cost + sum(term.scan_cost for term in terms)
+        return Estimate(min(rows, replica.size), scan_cost)
+
+    def bitmap(self, replica) -> int:
+        brand_rows = self.brand.bitmap(replica)
+        brand_category_rows = brand_rows & self.category.bitmap(replica)
+        all_terms_rows = replica.all_rows
+        for term in self.terms:
+            all_terms_rows &= term.bitmap(replica)
+            if not all_terms_rows:
+                break
+        return brand_category_rows | (all_terms_rows & ~brand_rows)
+
+    def row_matches(self, replica, row: int) -> bool:
+        if self.brand.row_matches(replica, row):
+            return self.category.row_matches(replica, row)
+        return all(term.row_matches(replica, row) for term in self.terms)
+
+
+class PriceRangePredicate(Predicate):
+    access_path = "price_range"
+    fields_checked = 0
+
+    def __init__(self, min_price=None, max_price=None):
+        self.min_price = min_price
+        self.max_price = max_price
+
+    def describe(self) -> dict:
+        return {"type": "price_range", "min_price": self.min_price, "max_price": self.max_price}
+
+    def cached(self, replica) -> bool:
+        return True
+
+    def estimate(self, replica) -> Estimate:
+        rows = replica.price_index.count_between(self.min_price, self.max_price)
+        return Estimate(rows, BITMAP_COST_PER_ROW * replica.size, exact=True)
+
+    def bitmap(self, replica) -> int:
+        return replica.price_index.rows_between(self.min_price, self.max_price)
+
+    def row_matches(self, replica, row: int) -> bool:
+        price = replica.prices[row]
+        return (self.min_price is None or price >= self.min_price) and (
+            self.max_price is None or price <= self.max_price
+        )
+
+
+class FacetPredicate(Predicate):
+    """Lowercased needle in a dictionary-encoded column (color, platform)"""
+
+    fields_checked = 0
+
+    def __init__(self, name: str, needle: str):
+        self.name = name
+        self.needle = needle
+        self.access_path = f"{name}_index"
+
+    def _column(self, replica):
+        return replica.color if self.name == "color" else replica.platform
+
+    def describe(self) -> dict:
+        return {"type": self.name, "needle": self.needle}
+
+    def cached(self, replica) -> bool:
+        return True
+
+    def estimate(self, replica) -> Estimate:
+        column = self._column(replica)
+        scan_cost = len(column.values) + BITMAP_COST_PER_ROW * replica.size
+        return Estimate(column.count_containing(self.needle), scan_cost, exact=True)
+
+    def bitmap(self, replica) -> int:
+        return replica.facet_rows(self.name, self.needle)
+
+    def row_matches(self, replica, row: int) -> bool:
+        column = self._column(replica)
+        return self.needle in column.lowered[column.codes[row]]
+
+
+def compile_text_query(q: str):
+    """The predicate updated_search_logic applies for q, decided once instead of per product"""
+    search_terms = q.strip().lower().split()
+    if not search_terms:
+        return None
+
+    if len(search_terms) == 1:
+        search_term = search_terms[0]
+        if search_term in SMART_TERM_SET:
+            return SmartCategoryPredicate(search_term)
+        return TermPredicate(remove_accents(search_term))
+
+    full_search = " ".join(search_terms)
+    if full_search in SMART_TERM_SET:
+        return SmartCategoryPredicate(full_search)
+
+    return BrandCategoryQueryPredicate(
+        BrandPredicate(remove_accents(search_terms[0])),
+        SmartCategoryPredicate(" ".join(search_terms[1:])),
+        [TermPredicate(remove_accents(term)) for term in search_terms],
+    )
+
+
+def compile_query(q=None, brand=None, category=None, min_price=None, max_price=None,
+                  color=None, platform_name=None) -> list:
+    """Predicates for a request, with the same semantics as the SQL-backed endpoints"""
+    predicates = []
+    if q:
+        text = compile_text_query(q)
+        if text is not None:
+            predicates.append(text)
+    if brand:
+        predicates.append(BrandPredicate(remove_accents(brand.lower())))
+    if category:
+        predicates.append(SmartCategoryPredicate(category))
+    if min_price is not None or max_price is not None:
+        predicates.append(PriceRangePredicate(min_price, max_price))
+    if color:
+        predicates.append(FacetPredicate("color", color.lower()))
+    if platform_name:
+        predicates.append(FacetPredicate("platform", platform_name.lower()))
+    return predicates
+
+
+class QueryPlan:
+    """Predicates in evaluation order with their estimates; execute() returns the match bitmap"""
+
+    def __init__(self, replica, predicates: list):
+        self.replica = replica
+        steps = [(predicate, predicate.estimate(replica)) for predicate in predicates]
+        # Whether each bitmap was already available when the plan was made
+        self.cached = {id(predicate): predicate.cached(replica) for predicate in predicates}
+        # Most selective first; among equals, the cheaper bitmap
+        steps.sort(key=lambda step: (step[1].rows, step[1].scan_cost))
+        self.steps = steps
+        self.trace = []
+
+        size = replica.size
+        candidates, cost = float(size), 0.0
+        for position, (predicate, estimate) in enumerate(steps):
+            if position == 0 or self.cached[id(predicate)]:
+                cost += estimate.scan_cost
+            else:
+                cost += min(estimate.scan_cost, self._check_cost(predicate, candidates))
+            cost += BITMAP_COST_PER_ROW * size
+            candidates *= estimate.rows / size if size else 0.0
+        self.estimated_rows = round(candidates if steps else size)
+        self.estimated_cost = round(cost, 2)
+
+    @staticmethod
+    def _check_cost(predicate, candidates: float) -> float:
+        return candidates * ROW_CHECK_COST * max(predicate.fields_checked, 1)
+
+    def execute(self) -> int:
+        replica = self.replica
+        bitmap = replica.all_rows
+        self.trace = []
+        for position, (predicate, estimate) in enumerate(self.steps):
+            if not bitmap:
+                break
+            candidates = bitmap.bit_count()
+            if (position > 0 and not predicate.cached(replica)
+                    and self._check_cost(predicate, candidates) < estimate.scan_cost):
+                strategy = "candidate_check"
+                bitmap = bitmap_from_rows(
+                    (row for row in iter_rows(bitmap) if predicate.row_matches(replica, row)), replica.size
+                )
+            else:
+                strategy = "bitmap"
+                bitmap &= predicate.bitmap(replica)
+            self.trace.append({
+                "access_path": predicate.access_path,
+                "strategy": strategy,
+                "candidates": candidates,
+                "rows_out": bitmap.bit_count(),
+            })
+        return bitmap
+
+    def explain(self) -> dict:
+        return {
+            "catalog_rows": self.replica.size,
+            "catalog_version": self.replica.version,
+            "driver": self.steps[0][0].access_path if self.steps else "full_scan",
+            "estimated_rows": self.estimated_rows,
+            "estimated_cost": self.estimated_cost,
+            "steps": [
+                {
+                    "access_path": predicate.access_path,
+                    "predicate": predicate.describe(),
+                    "estimated_rows": round(estimate.rows),
+                    "exact_estimate": estimate.exact,
+                    "bitmap_cost": round(estimate.scan_cost, 2),
+                    "cached": self.cached[id(predicate)],
+                }
+                for predicate, estimate in self.steps
+            ],
+            "execution": self.trace,
+        }
+
+
+def plan_query(replica, **filters) -> QueryPlan:
+    """Compile request filters and plan them against the replica"""
+    return QueryPlan(replica, compile_query(**filters))
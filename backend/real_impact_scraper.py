@@ -5,16 +5,36 @@ DEBUG VERSION - Includes debugging to see what API is actually returning
 """
 
 import requests
+from requests.adapters import HTTPAdapter
+import gzip
+import hashlib
 import json
 import time
 import random
+import uuid
 from typing import List, Dict
+import math
 import re
 from base64 import b64encode
 
+from catalog_sampling import stratified_sample
+
+# Strata for stratified sampling: the categories categorize_item() assigns
+DIVERSITY_CATEGORIES = ['handbags', 'shoes', 'jewelry', 'accessories', 'clothing', 'other']
+# Stratified sampling: no brand may take more than this share of the target
+MAX_BRAND_SHARE = 0.2
+STRATIFIED_PAGE_SIZE = 100
+
 class RealImpactScraper:
     def __init__(self, api_base_url="http://127.0.0.1:8002"):
         self.api_base_url = api_base_url
+        self.upload_chunk_size = 2000
+        self.max_chunk_attempts = 5
+
+        # Keep-alive connection pool for uploads to the Retrofy API (no Impact.com auth headers)
+        self.api_session = requests.Session()
+        self.api_session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+        self.api_session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
         
         # Your real Impact.com credentials
         self.account_sid = "IRFNBGTHkmio2071858ZgWZVTuFxnuqxN1"
@@ -211,9 +231,10 @@ class RealImpactScraper:
             print(f"❌ Error: {str(e)}")
             return None
     
-    def get_product_catalog_with_max_diversity(self, campaign_id=None, target_products=1000):
+    def get_product_catalog_with_max_diversity(self, campaign_id=None, target_products=1000, strategy="random"):
         """
         Get maximum diversity of products using pagination and smart sampling
+        strategy="stratified" fills per-category quotas (see get_stratified_sample) instead of random pages
         """
         print(f"📦 Fetching maximum diversity of products from Impact.com...")
         print(f"🎯 Target: {target_products} diverse products")
@@ -261,6 +282,9 @@ class RealImpactScraper:
             test_data = test_response.json()
             total_available = test_data.get('@total', 0)
             print(f"📊 Total products available in catalog: {total_available}")
+
+            if strategy == "stratified":
+                return self.get_stratified_sample(products_url, total_available, target_products)
             
             # Calculate optimal pagination strategy
             page_size = min(100, target_products // 10)  # Reasonable page size
@@ -340,9 +364,50 @@ class RealImpactScraper:
             print(f"❌ Error fetching products: {str(e)}")
             return []
     
-    def parse_impact_product(self, item) -> Dict:
+    def classify_item(self, item) -> tuple:
+        """(category stratum, brand) of a raw Impact.com item, as parse_impact_product would see them"""
+        title = str(item.get('Name', '') or '')
+        description = str(item.get('Description', '') or '')
+        brand = self.extract_brand_from_title_or_validate(title, item.get('Manufacturer', '') or item.get('Text1', ''))
+        return self.categorize_item(title + ' ' + description), self.clean_text(brand).lower()
+
+    def get_stratified_sample(self, products_url, total_available, target_products=1000):
+        """
+        Fetch pages chosen to fill equal per-category quotas (and cap any one brand),
+        stopping as soon as every category is covered. Prints the API calls saved
+        compared with random page sampling.
+        """
+        quota = math.ceil(target_products / len(DIVERSITY_CATEGORIES))
+        total_pages = max(1, math.ceil(total_available / STRATIFIED_PAGE_SIZE))
+        print(f"🧭 Stratified sampling: {quota} products per category, {total_pages} pages available")
+
+        def fetch_page(page):
+            response = self.session.get(
+                products_url, params={'PageSize': STRATIFIED_PAGE_SIZE, 'Page': page}, timeout=30
+            )
+            if response.status_code != 200:
+                print(f"    ❌ Error on page {page}: {response.status_code}")
+                return []
+            time.sleep(0.5)  # be nice to the API
+            return response.json().get('Items', [])
+
+        items, report = stratified_sample(
+            fetch_page, total_pages, {category: quota for category in DIVERSITY_CATEGORIES}, self.classify_item,
+            STRATIFIED_PAGE_SIZE, max_per_brand=max(1, math.ceil(target_products * MAX_BRAND_SHARE))
+        )
+        print(f"✅ Collected {report['accepted']} products from {report['brands']} brands "
+              f"in {report['api_calls']} API calls")
+        print(f"📈 Per category: {report['categories']}")
+        if report['unfilled']:
+            print(f"⚠️  Not enough items in the catalog for: {report['unfilled']}")
+        print(f"💰 Random page sampling would need ~{report['random_strategy_calls_estimate']} calls "
+              f"for the same coverage: {report['api_calls_saved']} calls saved")
+        return items[:target_products]
+
+    def parse_impact_product(self, item, platform_name="TheRealReal") -> Dict:
         """
         Convert Impact.com product data to Retrofy format
+        (platform_name: the retailer whose catalog the item came from)
         """
         try:
             # Extract fields from the actual Impact.com structure
@@ -405,7 +470,7 @@ class RealImpactScraper:
                 "description": self.clean_text(enhanced_desc),
                 "price": price,
                 "image_url": image_url,
-                "platform_name": "TheRealReal",
+                "platform_name": platform_name,
                 "product_url": product_url,
                 # Additional metadata
                 "condition": condition,
@@ -528,25 +593,71 @@ class RealImpactScraper:
         text = re.sub(r'[^\w\s\-\(\)\.\,\&]', '', text)
         return text.strip()
     
+    def iter_upload_chunks(self, products: List[Dict], run_id: str):
+        """Yield (idempotency key, gzipped NDJSON body, raw size, product count) per chunk"""
+        for start in range(0, len(products), self.upload_chunk_size):
+            chunk = products[start:start + self.upload_chunk_size]
+            body = b"\n".join(json.dumps(product, separators=(",", ":")).encode() for product in chunk)
+            # Content hash salted with the upload run: retries within the run are no-ops on the
+            # server, while a later deliberate re-sync of identical products is inserted again
+            key = hashlib.sha256(run_id.encode() + b":" + body).hexdigest()
+            yield key, gzip.compress(body, compresslevel=6), len(body), len(chunk)
+
+    def post_upload_chunk(self, key: str, payload: bytes) -> Dict:
+        """POST one chunk, retrying network errors, 5xx and 503 backpressure with backoff"""
+        url = f"{self.api_base_url}/ingest/chunks"
+        headers = {
+            'Content-Type': 'application/x-ndjson',
+            'Content-Encoding': 'gzip',
+            'Idempotency-Key': key
+        }
+        for attempt in range(1, self.max_chunk_attempts + 1):
+            try:
+                response = self.api_session.post(url, data=payload, headers=headers, timeout=60)
+                if response.status_code < 500:
+                    response.raise_for_status()  # 4xx: the chunk itself is bad, don't retry
+                    return response.json()
+                delay = float(response.headers.get("Retry-After", 2 ** attempt))
+                reason = f"HTTP {response.status_code}"
+            except (requests.ConnectionError, requests.Timeout) as e:
+                delay = 2 ** attempt
+                reason = type(e).__name__
+            if attempt == self.max_chunk_attempts:
+                raise RuntimeError(f"chunk {key[:12]} failed after {attempt} attempts ({reason})")
+            delay += random.uniform(0, 1)
+            print(f"⏳ Chunk {key[:12]} {reason}, retrying in {delay:.1f}s...")
+            time.sleep(delay)
+
     def send_to_api(self, products: List[Dict]) -> bool:
-        """Send products to Retrofy API or save to file as backup"""
+        """Stream products to Retrofy API in gzipped NDJSON chunks, or save the rest to file as backup"""
         if not products:
             print("No products to send")
             return False
-        
-        # Try API first
+
+        sent = 0
+        raw_bytes = 0
+        wire_bytes = 0
+        # Try API first: one chunk in memory at a time, each retried on its own
         try:
-            url = f"{self.api_base_url}/seed_products"
-            print(f"Sending {len(products)} products to Retrofy API...")
-            response = requests.post(url, json=products)
-            response.raise_for_status()
-            print("✅ Products successfully added to Retrofy database!")
+            print(f"Sending {len(products)} products to Retrofy API in chunks of {self.upload_chunk_size}...")
+            run_id = uuid.uuid4().hex
+            for key, payload, raw_size, count in self.iter_upload_chunks(products, run_id):
+                result = self.post_upload_chunk(key, payload)
+                sent += count
+                raw_bytes += raw_size
+                wire_bytes += len(payload)
+                note = " (already received)" if result.get("duplicate") else ""
+                print(f"   📦 {sent}/{len(products)} products sent{note}")
+            print(f"✅ Products successfully added to Retrofy database! "
+                  f"({wire_bytes / 1024:.0f} KB sent for {raw_bytes / 1024:.0f} KB of JSON)")
             return True
-            
+
         except Exception as e:
             print(f"❌ Error sending products to API: {str(e)}")
             print("💾 Saving products to file instead...")
-            
+            # Chunks already acknowledged are in the database; only keep the rest
+            products = products[sent:]
+
             # Save to JSON file as backup
             try:
                 filename = f"therealreal_products_{int(time.time())}.json"
@@ -558,10 +669,11 @@ class RealImpactScraper:
             except Exception as file_error:
                 print(f"❌ Error saving to file: {str(file_error)}")
                 return False
-    
-    def run_real_scraping_session(self, limit=1000):
+
+    def run_real_scraping_session(self, limit=1000, strategy="random"):
         """
         Run real scraping session with MAXIMUM DIVERSITY
+        (strategy="stratified" fills per-category quotas with fewer API calls)
         """
         print("🚀 Starting REAL Impact.com API scraping session...")
         print("💎 Getting maximum diversity of authentic luxury data from TheRealReal!")
@@ -577,7 +689,7 @@ class RealImpactScraper:
         campaign_id = self.get_therealreal_campaign_id()
         
         # Get products using the ENHANCED method with maximum diversity
-        raw_products = self.get_product_catalog_with_max_diversity(campaign_id, limit)
+        raw_products = self.get_product_catalog_with_max_diversity(campaign_id, limit, strategy)
         
         if not raw_products:
             print("❌ No products found")
@@ -1,3 +1,5 @@
+from typing import List, Optional
+
 from pydantic import BaseModel
 
 class ProductCreate(BaseModel):
@@ -10,3 +12,25 @@ class ProductCreate(BaseModel):
     image_url: str
     platform_name: str
     product_url: str
+
+class ProductBatchRequest(BaseModel):
+    ids: List[int]
+    # Comma-separated output fields, as in the list endpoints' `fields` parameter
+    fields: Optional[str] = None
+
+class SearchSpec(BaseModel):
+    """One query of a multi-search: the /products/search parameters"""
+    key: Optional[str] = None  # caller's label (e.g. carousel id), echoed back
+    q: Optional[str] = None
+    brand: Optional[str] = None
+    category: Optional[str] = None
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    sort_by: str = "id"
+    limit: int = 50
+    fuzzy: bool = True
+    collapse: bool = False
+    fields: Optional[str] = None
+
+class MultiSearchRequest(BaseModel):
+    queries: List[SearchSpec]
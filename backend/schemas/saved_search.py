@@ -0,0 +1,13 @@
+from typing import Optional
+
+from pydantic import BaseModel
+
+class SavedSearchCreate(BaseModel):
+    owner: str
+    name: Optional[str] = None
+    # Same meaning as the /products/search parameters
+    q: Optional[str] = None
+    brand: Optional[str] = None
+    category: Optional[str] = None
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
@@ -0,0 +1,356 @@
+"""
+Search vocabulary and per-product matching rules shared by the API and the
+in-memory catalog store.
+"""
+
+import unicodedata
+
+
+def remove_accents(text: str) -> str:
+    """
+    Remove accents from text to make searches more user-friendly
+    'Hermès' becomes 'Hermes'
+    """
+    if not text:
+        return ""
+
+    # Plain ASCII has nothing to strip
+    if text.isascii():
+        return text
+
+    # Normalize unicode characters and remove accents
+    normalized = unicodedata.normalize('NFD', text)
+    without_accents = ''.join(char for char in normalized if unicodedata.category(char) != 'Mn')
+    return without_accents
+
+
+# BAG CATEGORY (based on visual reference) - FIXED: Added tote bag entries
+BAG_TERMS = {
+    'bags': ['bag', 'bags', 'handbag', 'handbags', 'purse', 'purses', 'backpack', 'backpacks', 
+            'clutch', 'clutches', 'crossbody', 'cross body', 'shoulder bag', 'shoulder bags',
+            'luggage', 'travel', 'tote', 'totes', 'tote bag', 'tote bags'],
+    'bag': ['bag', 'bags', 'handbag', 'handbags', 'purse', 'purses'],
+    'handbags': ['handbag', 'handbags', 'bag', 'bags', 'purse', 'purses'],
+    'handbag': ['handbag', 'handbags', 'bag', 'bags'],
+    'backpacks': ['backpack', 'backpacks', 'rucksack', 'daypack'],
+    'backpack': ['backpack', 'backpacks'],
+    'clutches': ['clutch', 'clutches', 'evening bag', 'evening clutch', 'minaudiere'],
+    'clutch': ['clutch', 'clutches', 'evening bag'],
+    'crossbody': ['crossbody', 'cross body', 'messenger bag', 'sling bag'],
+    'luggage': ['luggage', 'travel bag', 'travel', 'suitcase', 'duffle', 'carry on'],
+    'shoulder': ['shoulder bag', 'shoulder bags', 'hobo', 'hobos'],
+    'tote': ['tote', 'totes', 'tote bag', 'large bag'],
+    'totes': ['tote', 'totes', 'tote bag'],
+    'tote bag': ['tote', 'totes', 'tote bag', 'large bag', 'bag'],
+    'tote bags': ['tote', 'totes', 'tote bag', 'bag']
+}
+
+# CLOTHING CATEGORY (based on visual reference)
+CLOTHING_TERMS = {
+    'clothing': ['clothing', 'clothes', 'blouse', 'blouses', 'coat', 'coats', 'denim', 'jeans',
+                'dress', 'dresses', 'jacket', 'jackets', 'knitwear', 'knit', 'pants', 'trousers',
+                'shorts', 'skirt', 'skirts', 'sweater', 'sweaters', 'top', 'tops', 'shirt', 'shirts'],
+    'clothes': ['clothing', 'clothes', 'apparel'],
+    'blouses': ['blouse', 'blouses', 'shirt', 'shirts', 'top', 'tops'],
+    'blouse': ['blouse', 'blouses', 'shirt'],
+    'coats': ['coat', 'coats', 'jacket', 'jackets', 'outerwear', 'trench', 'parka'],
+    'coat': ['coat', 'coats', 'jacket', 'outerwear'],
+    'denim': ['denim', 'jeans', 'jean jacket', 'denim jacket'],
+    'jeans': ['jeans', 'denim', 'pants', 'trousers'],
+    'dresses': ['dress', 'dresses', 'gown', 'gowns', 'frock'],
+    'dress': ['dress', 'dresses', 'gown'],
+    'jackets': ['jacket', 'jackets', 'blazer', 'blazers', 'cardigan', 'cardigans'],
+    'jacket': ['jacket', 'jackets', 'blazer'],
+    'knitwear': ['knitwear', 'knit', 'sweater', 'sweaters', 'cardigan', 'pullover'],
+    'knit': ['knit', 'knitwear', 'sweater'],
+    'pants': ['pants', 'trousers', 'slacks', 'leggings'],
+    'trousers': ['trousers', 'pants', 'slacks'],
+    'shorts': ['shorts', 'short pants', 'bermuda'],
+    'skirts': ['skirt', 'skirts', 'mini skirt', 'midi skirt', 'maxi skirt'],
+    'skirt': ['skirt', 'skirts'],
+    'sweaters': ['sweater', 'sweaters', 'jumper', 'pullover', 'cardigan'],
+    'sweater': ['sweater', 'sweaters', 'jumper'],
+    'tops': ['top', 'tops', 'blouse', 'blouses', 'shirt', 'shirts', 'tee', 'tank'],
+    'top': ['top', 'tops', 'blouse', 'shirt']
+}
+
+# SHOE CATEGORY with COMPREHENSIVE PLATFORM SUPPORT
+SHOE_TERMS = {
+    'shoes': ['shoe', 'shoes', 'boot', 'boots', 'espadrille', 'espadrilles', 'flat', 'flats',
+             'loafer', 'loafers', 'mule', 'mules', 'pump', 'pumps', 'sandal', 'sandals',
+             'sneaker', 'sneakers', 'wedge', 'wedges', 'heel', 'heels', 'platform', 'platforms'],
+    'shoe': ['shoe', 'shoes'],
+    'boots': ['boot', 'boots', 'ankle boot', 'knee boot', 'thigh boot', 'combat boot', 
+             'chelsea boot', 'riding boot', 'cowboy boot', 'platform boot', 'platform boots'],
+    'boot': ['boot', 'boots', 'platform boot'],
+    'espadrilles': ['espadrille', 'espadrilles', 'rope sole', 'canvas shoe', 'platform espadrille'],
+    'espadrille': ['espadrille', 'espadrilles', 'platform espadrille'],
+    'flats': ['flat', 'flats', 'ballet flat', 'ballet flats', 'ballerina', 'platform flat'],
+    'flat': ['flat', 'flats', 'ballet flat', 'platform flat'],
+    'loafers': ['loafer', 'loafers', 'moccasin', 'moccasins', 'slip on', 'platform loafer'],
+    'loafer': ['loafer', 'loafers', 'moccasin', 'platform loafer'],
+    'mules': ['mule', 'mules', 'slide', 'slides', 'clog', 'clogs', 'platform mule'],
+    'mule': ['mule', 'mules', 'slide', 'platform mule'],
+    'pumps': ['pump', 'pumps', 'court shoe', 'heel', 'heels', 'high heel', 'platform', 'platform pump'],
+    'pump': ['pump', 'pumps', 'heel', 'platform pump'],
+    'sandals': ['sandal', 'sandals', 'flip flop', 'flip flops', 'thong', 'slide', 'platform sandal'],
+    'sandal': ['sandal', 'sandals', 'platform sandal'],
+    'sneakers': ['sneaker', 'sneakers', 'trainer', 'trainers', 'athletic shoe', 'running shoe', 
+                'tennis shoe', 'platform sneaker', 'platform trainer', 'platform tennis'],
+    'sneaker': ['sneaker', 'sneakers', 'trainer', 'platform sneaker', 'platform tennis'],
+    'wedges': ['wedge', 'wedges', 'wedge heel', 'platform', 'platform shoe', 'platform wedge'],
+    'wedge': ['wedge', 'wedges', 'platform wedge'],
+    'heels': ['heel', 'heels', 'pump', 'pumps', 'stiletto', 'stilettos', 'high heel', 'platform', 'platform heel'],
+    'heel': ['heel', 'heels', 'pump', 'platform heel'],
+    
+    # COMPREHENSIVE PLATFORM COMBINATIONS
+    'platform': ['platform', 'platforms', 'platform heel', 'platform shoe', 'platform pump', 'platform sandal', 
+                'platform wedge', 'platform boot', 'platform sneaker', 'platform mule', 'platform flat',
+                'platform loafer', 'platform espadrille'],
+    'platforms': ['platform', 'platforms', 'platform heel', 'platform shoe'],
+    
+    # Individual platform combinations
+    'platform heel': ['platform heel', 'platform heels', 'platform pump', 'platform', 'heel', 'heels'],
+    'platform heels': ['platform heel', 'platform heels', 'platform pump', 'platform'],
+    'platform boot': ['platform boot', 'platform boots', 'platform', 'boot', 'boots'],
+    'platform boots': ['platform boot', 'platform boots', 'platform'],
+    'platform sandal': ['platform sandal', 'platform sandals', 'platform', 'sandal', 'sandals'],
+    'platform sandals': ['platform sandal', 'platform sandals', 'platform'],
+    'platform sneaker': ['platform sneaker', 'platform sneakers', 'platform trainer', 'platform tennis', 'platform', 'sneaker', 'sneakers'],
+    'platform sneakers': ['platform sneaker', 'platform sneakers', 'platform trainer', 'platform tennis', 'platform'],
+    'platform tennis': ['platform tennis', 'platform sneaker', 'platform trainer', 'platform', 'tennis', 'sneaker'],
+    'platform wedge': ['platform wedge', 'platform wedges', 'platform', 'wedge', 'wedges'],
+    'platform wedges': ['platform wedge', 'platform wedges', 'platform'],
+    'platform pump': ['platform pump', 'platform pumps', 'platform heel', 'platform', 'pump', 'pumps'],
+    'platform pumps': ['platform pump', 'platform pumps', 'platform heel', 'platform'],
+    'platform mule': ['platform mule', 'platform mules', 'platform slide', 'platform', 'mule', 'mules'],
+    'platform mules': ['platform mule', 'platform mules', 'platform slide', 'platform'],
+    'platform flat': ['platform flat', 'platform flats', 'platform', 'flat', 'flats'],
+    'platform flats': ['platform flat', 'platform flats', 'platform'],
+    'platform loafer': ['platform loafer', 'platform loafers', 'platform', 'loafer', 'loafers'],
+    'platform loafers': ['platform loafer', 'platform loafers', 'platform'],
+    'platform espadrille': ['platform espadrille', 'platform espadrilles', 'platform', 'espadrille', 'espadrilles'],
+    'platform espadrilles': ['platform espadrille', 'platform espadrilles', 'platform']
+}
+
+# ACCESSORY CATEGORY (based on visual reference)
+ACCESSORY_TERMS = {
+    'accessories': ['accessory', 'accessories', 'belt', 'belts', 'glove', 'gloves', 
+                   'hair accessory', 'hair accessories', 'hat', 'hats', 'jewelry', 'jewellery',
+                   'scarf', 'scarves', 'sunglasses', 'glasses', 'watch', 'watches', 'wallet', 'wallets'],
+    'accessory': ['accessory', 'accessories'],
+    'belts': ['belt', 'belts', 'waist belt', 'chain belt', 'leather belt'],
+    'belt': ['belt', 'belts'],
+    'gloves': ['glove', 'gloves', 'mitten', 'mittens'],
+    'glove': ['glove', 'gloves'],
+    'hair': ['hair accessory', 'hair accessories', 'headband', 'headbands', 'hair clip', 'barrette'],
+    'hats': ['hat', 'hats', 'cap', 'caps', 'beanie', 'beanies', 'fedora', 'beret', 'bucket hat'],
+    'hat': ['hat', 'hats', 'cap'],
+    'jewelry': ['jewelry', 'jewellery', 'necklace', 'necklaces', 'bracelet', 'bracelets', 
+               'ring', 'rings', 'earring', 'earrings', 'pendant', 'pendants', 'chain', 'chains',
+               'brooch', 'brooches', 'pin', 'pins', 'cufflink', 'cufflinks'],
+    'jewellery': ['jewelry', 'jewellery'],
+    'necklace': ['necklace', 'necklaces', 'pendant', 'pendants', 'chain', 'chains', 'choker'],
+    'necklaces': ['necklace', 'necklaces'],
+    'bracelet': ['bracelet', 'bracelets', 'bangle', 'bangles', 'cuff', 'cuffs'],
+    'bracelets': ['bracelet', 'bracelets'],
+    'ring': ['ring', 'rings', 'band', 'bands'],
+    'rings': ['ring', 'rings'],
+    'earring': ['earring', 'earrings', 'stud', 'studs', 'hoop', 'hoops', 'drop earring'],
+    'earrings': ['earring', 'earrings'],
+    'scarves': ['scarf', 'scarves', 'shawl', 'shawls', 'wrap', 'wraps', 'stole', 'pashmina'],
+    'scarf': ['scarf', 'scarves', 'shawl'],
+    'sunglasses': ['sunglasses', 'glasses', 'eyewear', 'shades', 'sunglass'],
+    'glasses': ['glasses', 'sunglasses', 'eyewear'],
+    'watches': ['watch', 'watches', 'timepiece', 'chronograph', 'wristwatch'],
+    'watch': ['watch', 'watches', 'timepiece'],
+    'wallets': ['wallet', 'wallets', 'purse', 'coin purse', 'card holder', 'money clip'],
+    'wallet': ['wallet', 'wallets']
+}
+
+# DESIGNER BRANDS (from visual reference)
+DESIGNER_TERMS = {
+    'alaia': ['alaia', 'alaïa'],
+    'balmain': ['balmain'],
+    'bottega': ['bottega veneta', 'bottega'],
+    'burberry': ['burberry'],
+    'chloe': ['chloe', 'chloé'],
+    'dolce': ['dolce gabbana', 'dolce & gabbana', 'dolce'],
+    'fendi': ['fendi'],
+    'gianvito': ['gianvito rossi'],
+    'givenchy': ['givenchy'],
+    'gucci': ['gucci'],
+    'isabel': ['isabel marant'],
+    'lanvin': ['lanvin'],
+    'miu': ['miu miu'],
+    'oscar': ['oscar de la renta'],
+    'prada': ['prada'],
+    'saint': ['saint laurent', 'ysl'],
+    'valentino': ['valentino']
+}
+
+# Combine all categories
+ALL_CATEGORY_TERMS = {**BAG_TERMS, **CLOTHING_TERMS, **SHOE_TERMS, **ACCESSORY_TERMS, **DESIGNER_TERMS}
+
+
+def smart_category_match(search_term: str, product) -> bool:
+    """
+    COMPREHENSIVE smart category matching with full platform support
+    Handles ALL "platform + shoe type" combinations
+    """
+    if not search_term:
+        return True
+    
+    search_lower = search_term.lower().strip()
+    
+    # Create searchable text from all product fields
+    search_text = f"{product.title or ''} {product.description or ''} {product.category or ''}".lower()
+    
+    # Check if search term matches any category
+    if search_lower in ALL_CATEGORY_TERMS:
+        terms_to_find = ALL_CATEGORY_TERMS[search_lower]
+        for term in terms_to_find:
+            if term in search_text:
+                return True
+        return False
+    
+    # If not a recognized category, do regular text matching
+    if search_lower in search_text:
+        return True
+    
+    return False
+
+
+def filters_match(product, brand=None, category=None, min_price=None, max_price=None,
+                  color=None, platform_name=None) -> bool:
+    """
+    The /products filter rules for one product (ORM object or row):
+    brand checks both brand and title, accent-insensitive; category is smart.
+    """
+    if brand:
+        brand_clean = remove_accents(brand.lower())
+        product_brand = remove_accents(product.brand.lower()) if product.brand else ""
+        product_title = remove_accents(product.title.lower()) if product.title else ""
+        if brand_clean not in product_brand and brand_clean not in product_title:
+            return False
+
+    if category and not smart_category_match(category, product):
+        return False
+
+    if min_price is not None and product.price < min_price:
+        return False
+    if max_price is not None and product.price > max_price:
+        return False
+    if color and color.lower() not in (product.color or "").lower():
+        return False
+    if platform_name and platform_name.lower() not in (product.platform_name or "").lower():
+        return False
+    return True
+
+
+# UPDATED: List of terms that should use smart category matching - FIXED: Added tote bag entries
+SMART_CATEGORY_TERMS = [
+    # Bags
+    'bags', 'bag', 'handbags', 'handbag', 'backpacks', 'backpack', 'clutches', 'clutch',
+    'crossbody', 'luggage', 'shoulder', 'tote', 'totes', 'tote bag', 'tote bags',
+    # Clothing  
+    'clothing', 'clothes', 'blouses', 'blouse', 'coats', 'coat', 'denim', 'jeans',
+    'dresses', 'dress', 'jackets', 'jacket', 'knitwear', 'knit', 'pants', 'trousers',
+    'shorts', 'skirts', 'skirt', 'sweaters', 'sweater', 'tops', 'top',
+    # Shoes
+    'shoes', 'shoe', 'boots', 'boot', 'espadrilles', 'espadrille', 'flats', 'flat',
+    'loafers', 'loafer', 'mules', 'mule', 'pumps', 'pump', 'sandals', 'sandal',
+    'sneakers', 'sneaker', 'wedges', 'wedge', 'heels', 'heel',
+    # Platform combinations
+    'platform', 'platforms', 'platform heel', 'platform heels', 'platform boot', 'platform boots',
+    'platform sandal', 'platform sandals', 'platform sneaker', 'platform sneakers', 'platform tennis',
+    'platform wedge', 'platform wedges', 'platform pump', 'platform pumps', 'platform mule', 'platform mules',
+    'platform flat', 'platform flats', 'platform loafer', 'platform loafers', 'platform espadrille', 'platform espadrilles',
+    # Accessories
+    'accessories', 'accessory', 'belts', 'belt', 'gloves', 'glove', 'hair', 'hats', 'hat',
+    'jewelry', 'jewellery', 'necklace', 'necklaces', 'bracelet', 'bracelets', 'ring', 'rings',
+    'earring', 'earrings', 'scarves', 'scarf', 'sunglasses', 'glasses', 'watches', 'watch',
+    'wallets', 'wallet',
+    # Designers
+    'alaia', 'balmain', 'bottega', 'burberry', 'chloe', 'dolce', 'fendi', 'gianvito',
+    'givenchy', 'gucci', 'isabel', 'lanvin', 'miu', 'oscar', 'prada', 'saint', 'valentino'
+]
+
+
+def updated_search_logic(q, product):
+    """
+    Does one product match the search query q? Reference semantics for the
+    query planner and the percolator:
+    - one word: smart category match if it is a category term, else an
+      accent-folded substring of title, brand or description
+    - several words: the whole phrase as a smart category; else brand (first
+      word, in brand or title) + smart category (the rest); else every word
+      found in title, brand or description
+    """
+    if not q:
+        return True
+        
+    search_terms = q.strip().lower().split()
+    
+    if len(search_terms) == 1:
+        search_term = search_terms[0]
+        
+        if search_term in SMART_CATEGORY_TERMS:
+            result = smart_category_match(search_term, product)
+            return result
+        else:
+            # Regular text search for brands, materials, etc.
+            searchable_text = ""
+            if product.title:
+                searchable_text += remove_accents(product.title.lower()) + " "
+            if product.brand:
+                searchable_text += remove_accents(product.brand.lower()) + " "
+            if product.description:
+                searchable_text += remove_accents(product.description.lower()) + " "
+            
+            term_clean = remove_accents(search_term)
+            result = term_clean in searchable_text
+            return result
+    
+    else:
+        # Multi-word search logic
+        full_search = " ".join(search_terms)
+        
+        # First: Check if the full phrase is a recognized smart category
+        if full_search in SMART_CATEGORY_TERMS:
+            result = smart_category_match(full_search, product)
+            return result
+        
+        # Second: Check for brand + category combinations
+        potential_brand = search_terms[0]
+        potential_category = " ".join(search_terms[1:])
+        
+        # Check if first word is a brand
+        brand_clean = remove_accents(potential_brand.lower())
+        product_brand = remove_accents(product.brand.lower()) if product.brand else ""
+        product_title = remove_accents(product.title.lower()) if product.title else ""
+        
+        brand_match = (brand_clean in product_brand) or (brand_clean in product_title)
+        
+        if brand_match:
+            # If brand matches, check category using smart matching
+            result = smart_category_match(potential_category, product)
+            return result
+        
+        # Fall back to requiring ALL terms
+        searchable_text = ""
+        if product.title:
+            searchable_text += remove_accents(product.title.lower()) + " "
+        if product.brand:
+            searchable_text += remove_accents(product.brand.lower()) + " "
+        if product.description:
+            searchable_text += remove_accents(product.description.lower()) + " "
+        
+        # Check if ALL search terms are found
+        for term in search_terms:
+            term_clean = remove_accents(term.lower())
+            found = term_clean in searchable_text
+            if not found:
+                return False
+        
+        return True
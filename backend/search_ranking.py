@@ -0,0 +1,101 @@
+"""
+Relevance scoring for /products/search?sort_by=relevance
+
+Each hit is scored with a BM25-style sum over the query terms, weighted per field
+(brand > title > description), plus a boost when the product text contains the
+smart category a query term refers to (or one of its synonyms).
+"""
+
+import math
+
+from search_logic import remove_accents, ALL_CATEGORY_TERMS
+
+FIELD_WEIGHTS = {"brand": 3.0, "title": 2.0, "description": 1.0}
+CATEGORY_EXACT_BOOST = 3.0
+CATEGORY_SYNONYM_BOOST = 2.0
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def token_count(text: str) -> int:
+    """Cheap whitespace token count used for BM25 length normalization"""
+    return text.count(" ") + 1 if text else 0
+
+
+def folded_fields(product) -> dict:
+    """Lowercased, accent-folded searchable fields of an ORM product"""
+    return {
+        "brand": remove_accents((product.brand or "").lower()),
+        "title": remove_accents((product.title or "").lower()),
+        "description": remove_accents((product.description or "").lower()),
+    }
+
+
+def category_terms_in_query(search_terms: list) -> list:
+    """Smart category keys the query refers to: the full phrase, the trailing phrase or single words"""
+    candidates = [" ".join(search_terms), " ".join(search_terms[1:])] + search_terms
+    found = []
+    for candidate in candidates:
+        if candidate in ALL_CATEGORY_TERMS and candidate not in found:
+            found.append(candidate)
+    return found
+
+
+class RelevanceScorer:
+    """Scores products for one query given precomputed corpus statistics"""
+
+    def __init__(self, q: str, doc_count: int, avg_lengths: dict, document_frequency):
+        search_terms = q.strip().lower().split()
+        self.terms = [remove_accents(term) for term in search_terms]
+        self.avg_lengths = {field: max(length, 1.0) for field, length in avg_lengths.items()}
+        self.idf = {
+            term: math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+            for term in set(self.terms)
+            for df in [document_frequency(term)]
+        }
+        self.categories = [
+            (category, ALL_CATEGORY_TERMS[category]) for category in category_terms_in_query(search_terms)
+        ]
+
+    @classmethod
+    def for_products(cls, q: str, products: list) -> "RelevanceScorer":
+        """Build corpus statistics on the fly from ORM products (SQL-backed path)"""
+        fields = [folded_fields(product) for product in products]
+        doc_count = len(fields)
+        avg_lengths = {
+            field: sum(token_count(f[field]) for f in fields) / doc_count if doc_count else 0.0
+            for field in FIELD_WEIGHTS
+        }
+
+        def document_frequency(term):
+            return sum(1 for f in fields if any(term in f[field] for field in FIELD_WEIGHTS))
+
+        return cls(q, doc_count, avg_lengths, document_frequency)
+
+    def score(self, fields: dict, smart_text: str) -> float:
+        """
+        fields: folded brand/title/description of one product
+        smart_text: the lowercased text smart_category_match searches
+        """
+        score = 0.0
+        for field, weight in FIELD_WEIGHTS.items():
+            text = fields[field]
+            if not text:
+                continue
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * token_count(text) / self.avg_lengths[field])
+            for term in self.terms:
+                tf = text.count(term)
+                if tf:
+                    score += weight * self.idf[term] * tf * (BM25_K1 + 1) / (tf + norm)
+
+        for category, synonyms in self.categories:
+            if category in smart_text:
+                score += CATEGORY_EXACT_BOOST
+            elif any(synonym in smart_text for synonym in synonyms):
+                score += CATEGORY_SYNONYM_BOOST
+        return score
+
+    def score_product(self, product) -> float:
+        smart_text = f"{product.title or ''} {product.description or ''} {product.category or ''}".lower()
+        return self.score(folded_fields(product), smart_text)
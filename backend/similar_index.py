@@ -0,0 +1,241 @@
+"""
+Similar items for product detail pages
+
+Each product is a hashed TF-IDF vector over its title and description words,
+brand, category and color. Features are hashed into HASH_DIMENSIONS buckets
+(crc32, stable across processes), so there is no vocabulary to maintain.
+Vectors are L2-normalized and stored as float32 typed arrays: one row-major
+sparse matrix (for the query product's vector) and its transpose, an inverted
+index from feature to (rows, weights) postings.
+
+similar() accumulates dot products over the postings of the query vector's
+features and takes the top k with a heap, so only products sharing a feature
+are ever scored. Features are visited from the highest weight down; on large
+catalogs the scan skips postings beyond MAX_SCORED_POSTINGS, which are the long,
+low-weight postings of common words; the leading candidates then get their full
+dot product from the row-major matrix before the final top k.
+
+Like the suggest index, the vectors are computed from the products table once
+and then kept current with deltas applied at ingest time. IDF weights are fixed
+at the full build; after the catalog grows by IDF_REFRESH_GROWTH, or if a write
+was missed, the next request rebuilds.
+"""
+
+import heapq
+import math
+import os
+import threading
+import zlib
+from array import array
+from collections import Counter
+from operator import itemgetter
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from catalog_version import get_catalog_version
+from fuzzy_index import vocabulary_words
+from models.product import Product
+
+HASH_DIMENSIONS = 1 << 20
+LOAD_BATCH_SIZE = 10000
+# Per-field multipliers on term frequency
+FIELD_WEIGHTS = {"title": 2.0, "brand": 3.0, "category": 1.5, "color": 1.0, "description": 0.5}
+# Long descriptions would drown out the title
+MAX_DESCRIPTION_WORDS = 100
+# Approximate search: postings scored per query before the scan stops
+MAX_SCORED_POSTINGS = int(os.getenv("RETROFY_SIMILAR_MAX_POSTINGS", "50000"))
+# Approximate search: leaders (limit x this) whose partial scores are completed before ranking
+RERANK_FACTOR = 20
+# Rebuild (refreshing IDF) once the catalog has grown by this fraction since the last build
+IDF_REFRESH_GROWTH = 0.25
+
+
+def _bucket(feature: str) -> int:
+    return zlib.crc32(feature.encode("utf-8")) & (HASH_DIMENSIONS - 1)
+
+
+def product_features(title=None, brand=None, category=None, color=None, description=None) -> dict:
+    """Hashed feature -> weighted term frequency for one product"""
+    features = Counter()
+    for word in vocabulary_words(title):
+        features[_bucket("w:" + word)] += FIELD_WEIGHTS["title"]
+    for word in vocabulary_words(description)[:MAX_DESCRIPTION_WORDS]:
+        features[_bucket("w:" + word)] += FIELD_WEIGHTS["description"]
+    # Facets are matched as whole values, in their own feature namespaces
+    for name, value in (("brand", brand), ("category", category), ("color", color)):
+        words = vocabulary_words(value)
+        if words:
+            features[_bucket(f"{name}:{' '.join(words)}")] += FIELD_WEIGHTS[name]
+    return features
+
+
+class SimilarIndex:
+    """Hashed TF-IDF vectors of the catalog with an inverted index for nearest-neighbour queries"""
+
+    def __init__(self):
+        self.version = None
+        self._reset()
+        self._lock = threading.RLock()
+
+    def _reset(self):
+        self.ids = array("q")
+        self.prices = array("d")
+        self.row_of = {}
+        self.removed = set()
+        # Sparse row-major matrix: row i's features are features[offsets[i]:offsets[i + 1]]
+        self.offsets = array("q", [0])
+        self.features = array("i")
+        self.weights = array("f")
+        # feature -> (rows array, weights array)
+        self.postings = {}
+        self.idf = {}
+        self.default_idf = 1.0
+        self.built_rows = 0
+
+    # --- maintenance ---------------------------------------------------------
+
+    def _append(self, product_id: int, price, features: dict, idf: dict, default_idf: float):
+        row = len(self.ids)
+        weighted = [(feature, tf * idf.get(feature, default_idf)) for feature, tf in features.items()]
+        norm = math.sqrt(sum(weight * weight for _, weight in weighted)) or 1.0
+        for feature, weight in weighted:
+            weight /= norm
+            self.features.append(feature)
+            self.weights.append(weight)
+            posting = self.postings.get(feature)
+            if posting is None:
+                posting = self.postings[feature] = (array("i"), array("f"))
+            posting[0].append(row)
+            posting[1].append(weight)
+        self.offsets.append(len(self.features))
+        self.ids.append(product_id)
+        self.prices.append(price if price is not None else math.nan)
+        self.row_of[product_id] = row
+
+    def rebuild(self, db: Session, version: int):
+        """Full build from the products table, recomputing IDF"""
+        with self._lock:
+            self._reset()
+            statement = select(
+                Product.id, Product.price, Product.title, Product.brand,
+                Product.category, Product.color, Product.description
+            ).execution_options(yield_per=LOAD_BATCH_SIZE)
+            loaded = []
+            document_frequency = Counter()
+            for product_id, price, title, brand, category, color, description in db.execute(statement):
+                features = product_features(title, brand, category, color, description)
+                document_frequency.update(features.keys())
+                loaded.append((product_id, price, features))
+
+            size = len(loaded)
+            self.idf = {feature: math.log((size + 1) / (count + 1)) + 1.0 for feature, count in document_frequency.items()}
+            # Features first seen after the build are as rare as possible
+            self.default_idf = math.log(size + 1) + 1.0
+            for product_id, price, features in loaded:
+                self._append(product_id, price, features, self.idf, self.default_idf)
+            self.built_rows = size
+            self.version = version
+
+    def ensure_current(self, db: Session):
+        version = get_catalog_version(db)
+        if self.version != version:
+            with self._lock:
+                if self.version != version:
+                    self.rebuild(db, version)
+
+    def apply_change(self, new_version: int, added=(), removed_ids=()):
+        """
+        Apply one committed catalog write as a delta. added is (id, product dict) pairs.
+        If the index missed an earlier write it is left stale for a full rebuild.
+        """
+        with self._lock:
+            if self.version is None or self.version != new_version - 1:
+                return
+            for product_id, product in added:
+                features = product_features(
+                    product.get("title"), product.get("brand"), product.get("category"),
+                    product.get("color"), product.get("description")
+                )
+                self._append(product_id, product.get("price"), features, self.idf, self.default_idf)
+            for product_id in removed_ids:
+                row = self.row_of.pop(product_id, None)
+                if row is not None:
+                    self.removed.add(row)
+            self.version = new_version
+            if len(self.ids) > self.built_rows * (1 + IDF_REFRESH_GROWTH) + LOAD_BATCH_SIZE:
+                # IDF has drifted: rebuild on the next request
+                self.version = None
+
+    # --- lookup ----------------------------------------------------------------
+
+    def similar(self, product_id: int, limit: int = 10, min_price=None, max_price=None,
+                price_band=None, exact: bool = False):
+        """
+        [(product id, cosine similarity)] of the most similar products, best first,
+        or None when product_id is not in the catalog. price_band=0.5 keeps products
+        priced within 50% of this one (in ratio terms: price / 1.5 .. price * 1.5).
+        """
+        with self._lock:
+            row = self.row_of.get(product_id)
+            if row is None:
+                return None
+
+            prices = self.prices
+            price = prices[row]
+            if price_band is not None and not math.isnan(price):
+                low, high = price / (1 + price_band), price * (1 + price_band)
+                min_price = low if min_price is None else max(min_price, low)
+                max_price = high if max_price is None else min(max_price, high)
+
+            start, end = self.offsets[row], self.offsets[row + 1]
+            query = sorted(zip(self.features[start:end], self.weights[start:end]), key=itemgetter(1), reverse=True)
+            scores = {}
+            get = scores.get
+            scanned = 0
+            scanned_features = []
+            for feature, query_weight in query:
+                rows, weights = self.postings[feature]
+                if not exact and scanned and scanned + len(rows) > MAX_SCORED_POSTINGS:
+                    continue
+                scanned += len(rows)
+                scanned_features.append(feature)
+                for candidate, weight in zip(rows, weights):
+                    scores[candidate] = get(candidate, 0.0) + query_weight * weight
+
+            scores.pop(row, None)
+            removed = self.removed
+            filtered = min_price is not None or max_price is not None
+
+            def eligible(candidate):
+                if candidate in removed:
+                    return False
+                if filtered:
+                    candidate_price = prices[candidate]
+                    # NaN (no price) fails both comparisons, like the SQL filters
+                    if min_price is not None and not candidate_price >= min_price:
+                        return False
+                    if max_price is not None and not candidate_price <= max_price:
+                        return False
+                return True
+
+            candidates = (item for item in scores.items() if eligible(item[0]))
+            if exact or len(scanned_features) == len(query):
+                best = heapq.nlargest(limit, candidates, key=itemgetter(1))
+            else:
+                # Skipped postings left these scores partial: rescore the leaders with full dot products
+                leaders = heapq.nlargest(limit * RERANK_FACTOR, candidates, key=itemgetter(1))
+                query_weights = dict(query)
+                best = heapq.nlargest(
+                    limit, ((candidate, self._dot(candidate, query_weights)) for candidate, _ in leaders),
+                    key=itemgetter(1)
+                )
+            return [(self.ids[candidate], round(score, 4)) for candidate, score in best]
+
+    def _dot(self, row: int, query_weights: dict) -> float:
+        start, end = self.offsets[row], self.offsets[row + 1]
+        get = query_weights.get
+        return sum(get(feature, 0.0) * weight for feature, weight in zip(self.features[start:end], self.weights[start:end]))
+
+
+similar_index = SimilarIndex()
@@ -0,0 +1,184 @@
+"""
+Parallel multi-source catalog sync
+
+SyncOrchestrator runs every (source, catalog) pair in its own thread. Each
+source's requests go through that source's RateLimiter, so a slow or strict API
+only throttles its own catalogs, and the whole sync takes as long as the slowest
+source rather than the sum of all sources.
+
+Parsed products go through one bounded queue to a single writer thread. The
+writer batches them into batch_size chunks and hands each chunk to write(). By
+default write() posts the chunk to /ingest/chunks with a content-derived
+Idempotency-Key scoped to the sync run, so a chunk retried within the run is
+not inserted twice. When the writer falls behind, fetchers block on the full queue
+instead of buffering the whole catalog in memory.
+
+    python source_sync.py --sources impact --max-items 5000
+"""
+
+import argparse
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+from real_impact_scraper import RealImpactScraper
+from sources import SOURCES, SourceAdapter
+
+DEFAULT_PAGE_SIZE = 100
+DEFAULT_BATCH_SIZE = 2000
+# Parsed products buffered between the fetchers and the writer
+QUEUE_SIZE = 10000
+MAX_FETCH_WORKERS = 16
+
+_DONE = object()
+
+
+def api_writer(api_base_url: str = "http://127.0.0.1:8002") -> Callable[[List[Dict]], None]:
+    """write() that streams each batch to /ingest/chunks as gzipped NDJSON (one upload run per writer)"""
+    uploader = RealImpactScraper(api_base_url)
+    uploader.upload_chunk_size = DEFAULT_BATCH_SIZE
+    run_id = uuid.uuid4().hex
+
+    def write(products: List[Dict]):
+        for key, payload, _, _ in uploader.iter_upload_chunks(products, run_id):
+            uploader.post_upload_chunk(key, payload)
+
+    return write
+
+
+class SyncOrchestrator:
+    """Fetch many sources and catalogs in parallel into one shared batched writer"""
+
+    def __init__(self, sources: List[SourceAdapter], write: Callable[[List[Dict]], None],
+                 page_size: int = DEFAULT_PAGE_SIZE, batch_size: int = DEFAULT_BATCH_SIZE,
+                 max_items_per_catalog: int = None, max_workers: int = MAX_FETCH_WORKERS):
+        self.sources = sources
+        self.write = write
+        self.page_size = page_size
+        self.batch_size = batch_size
+        self.max_items_per_catalog = max_items_per_catalog
+        self.max_workers = max_workers
+        self._queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self._stats_lock = threading.Lock()
+        self.stats = {}
+
+    def _count(self, source: SourceAdapter, **deltas):
+        with self._stats_lock:
+            stats = self.stats.setdefault(source.name, {
+                "catalogs": 0, "pages": 0, "items": 0, "parsed": 0, "skipped": 0, "errors": [], "seconds": 0.0
+            })
+            for key, value in deltas.items():
+                if key == "error":
+                    stats["errors"].append(value)
+                elif key == "seconds":
+                    stats["seconds"] = max(stats["seconds"], value)
+                else:
+                    stats[key] += value
+
+    def _fetch_catalog(self, source: SourceAdapter, catalog: Dict, started: float):
+        fetched = 0
+        try:
+            for items in source.iter_pages(catalog, self.page_size):
+                self._count(source, pages=1, items=len(items))
+                for item in items:
+                    product = source.parse_item(item, catalog)
+                    if product and product.get("title"):
+                        self._queue.put(product)
+                        self._count(source, parsed=1)
+                    else:
+                        self._count(source, skipped=1)
+                fetched += len(items)
+                if self.max_items_per_catalog and fetched >= self.max_items_per_catalog:
+                    break
+        except Exception as e:
+            # One failing catalog doesn't stop the others
+            self._count(source, error=f"{catalog.get('name') or catalog.get('id')}: {e}")
+        finally:
+            self._count(source, seconds=time.monotonic() - started)
+
+    def _discover(self, source: SourceAdapter) -> List[Dict]:
+        try:
+            catalogs = source.discover_catalogs()
+        except Exception as e:
+            self._count(source, error=f"discovery: {e}")
+            return []
+        self._count(source, catalogs=len(catalogs))
+        return catalogs
+
+    def _write_batches(self, written: Dict):
+        batch = []
+        seen_urls = set()
+        while True:
+            product = self._queue.get()
+            if product is _DONE:
+                break
+            # The same listing can appear in overlapping catalogs of one run
+            url = product.get("product_url")
+            if url:
+                if url in seen_urls:
+                    continue
+                seen_urls.add(url)
+            batch.append(product)
+            if len(batch) >= self.batch_size:
+                self._flush(batch, written)
+                batch = []
+        if batch:
+            self._flush(batch, written)
+
+    def _flush(self, batch: List[Dict], written: Dict):
+        try:
+            self.write(batch)
+            written["products"] += len(batch)
+        except Exception as e:
+            written["failed"] += len(batch)
+            written["errors"].append(str(e))
+
+    def run(self) -> Dict:
+        """Sync every source; returns per-source stats and what the writer stored"""
+        started = time.monotonic()
+        written = {"products": 0, "failed": 0, "errors": []}
+        writer = threading.Thread(target=self._write_batches, args=(written,), daemon=True)
+        writer.start()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            discovered = list(zip(self.sources, pool.map(self._discover, self.sources)))
+            fetches = [
+                pool.submit(self._fetch_catalog, source, catalog, started)
+                for source, catalogs in discovered for catalog in catalogs
+            ]
+            for fetch in fetches:
+                fetch.result()
+
+        self._queue.put(_DONE)
+        writer.join()
+        return {"sources": self.stats, "written": written, "seconds": round(time.monotonic() - started, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync product catalogs from every configured source")
+    parser.add_argument("--sources", nargs="+", default=list(SOURCES), choices=list(SOURCES), help="Sources to sync")
+    parser.add_argument("--api", default="http://127.0.0.1:8002", help="Retrofy API base URL")
+    parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE, help="Items requested per page")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Products per upload chunk")
+    parser.add_argument("--max-items", type=int, help="Stop each catalog after this many items")
+    args = parser.parse_args()
+
+    orchestrator = SyncOrchestrator(
+        [SOURCES[name]() for name in args.sources], api_writer(args.api),
+        page_size=args.page_size, batch_size=args.batch_size, max_items_per_catalog=args.max_items
+    )
+    result = orchestrator.run()
+    for name, stats in result["sources"].items():
+        print(f"{name}: {stats['catalogs']} catalogs, {stats['parsed']} products in {stats['seconds']:.1f}s"
+              + (f", {len(stats['errors'])} errors" if stats["errors"] else ""))
+        for error in stats["errors"]:
+            print(f"   ⚠️ {error}")
+    print(f"✅ {result['written']['products']} products written in {result['seconds']}s"
+          + (f" ({result['written']['failed']} failed)" if result["written"]["failed"] else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Catalog source adapters
+
+A source is one upstream API that lists resale products (Impact.com today;
+Vestiaire or another affiliate network next). Every source implements the
+same three steps, so source_sync can run any mix of them:
+- discover_catalogs(): the catalogs this source should sync
+- iter_pages(catalog, page_size): raw item pages, fetched through the
+  source's own RateLimiter
+- parse_item(item, catalog): one raw item as a ProductCreate-shaped dict, or None
+
+A new source subclasses SourceAdapter and is registered in SOURCES.
+"""
+
+import random
+import threading
+import time
+from typing import Dict, Iterator, List
+
+import requests
+
+from real_impact_scraper import RealImpactScraper
+
+DEFAULT_REQUESTS_PER_SECOND = 2.0
+MAX_FETCH_ATTEMPTS = 4
+FETCH_TIMEOUT_SECONDS = 30
+
+
+class SourceError(Exception):
+    """A source request failed for good (after retries, or with a 4xx)"""
+
+
+class RateLimiter:
+    """Token bucket shared by every thread fetching from one source"""
+
+    def __init__(self, requests_per_second: float, burst: int = 1):
+        self.interval = 1.0 / requests_per_second
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) / self.interval)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) * self.interval
+            time.sleep(wait)
+
+
+class SourceAdapter:
+    """One upstream product API; subclasses implement discover_catalogs, iter_pages and parse_item"""
+
+    name = "source"
+
+    def __init__(self, requests_per_second: float = DEFAULT_REQUESTS_PER_SECOND, session=None):
+        self.rate_limiter = RateLimiter(requests_per_second)
+        self.session = session or requests.Session()
+
+    def discover_catalogs(self) -> List[Dict]:
+        """Catalogs to sync, as dicts with at least "id", "name" and "platform_name" """
+        raise NotImplementedError
+
+    def iter_pages(self, catalog: Dict, page_size: int) -> Iterator[List[Dict]]:
+        """Yield lists of raw items, one per page, until the catalog is exhausted"""
+        raise NotImplementedError
+
+    def parse_item(self, item: Dict, catalog: Dict):
+        """A ProductCreate-shaped dict, or None to skip the item"""
+        raise NotImplementedError
+
+    def get_json(self, url: str, params: Dict = None) -> Dict:
+        """Rate-limited GET, retrying network errors, 429 and 5xx with backoff (Retry-After honored)"""
+        for attempt in range(1, MAX_FETCH_ATTEMPTS + 1):
+            self.rate_limiter.acquire()
+            try:
+                response = self.session.get(url, params=params, timeout=FETCH_TIMEOUT_SECONDS)
+                if response.status_code != 429 and response.status_code < 500:
+                    if response.status_code >= 400:
+                        raise SourceError(f"{self.name}: HTTP {response.status_code} for {url}")
+                    return response.json()
+                delay = float(response.headers.get("Retry-After", 2 ** attempt))
+                reason = f"HTTP {response.status_code}"
+            except (requests.ConnectionError, requests.Timeout) as e:
+                delay = 2 ** attempt
+                reason = type(e).__name__
+            if attempt == MAX_FETCH_ATTEMPTS:
+                raise SourceError(f"{self.name}: {url} failed after {attempt} attempts ({reason})")
+            time.sleep(delay + random.uniform(0, 1))
+
+
+class ImpactSource(SourceAdapter):
+    """
+    Impact.com product catalogs. catalog_platforms maps a case-insensitive substring
+    of the catalog name to the platform_name its products are stored under.
+    """
+
+    name = "impact"
+
+    def __init__(self, catalog_platforms: Dict[str, str] = None,
+                 requests_per_second: float = DEFAULT_REQUESTS_PER_SECOND, scraper: RealImpactScraper = None):
+        # The scraper holds the authenticated session and the Impact item parsing rules
+        self.scraper = scraper or RealImpactScraper()
+        super().__init__(requests_per_second, session=self.scraper.session)
+        self.catalog_platforms = catalog_platforms or {"realreal": "TheRealReal"}
+        self.base_url = f"{self.scraper.impact_api_base}/Mediapartners/{self.scraper.account_sid}"
+
+    def discover_catalogs(self) -> List[Dict]:
+        catalogs = []
+        for catalog in self.get_json(f"{self.base_url}/Catalogs").get("Catalogs", []):
+            name = str(catalog.get("Name", ""))
+            searchable = str(catalog).lower()
+            for match, platform_name in self.catalog_platforms.items():
+                if match.lower() in searchable:
+                    catalogs.append({"id": catalog.get("Id"), "name": name, "platform_name": platform_name})
+                    break
+        return catalogs
+
+    def iter_pages(self, catalog: Dict, page_size: int) -> Iterator[List[Dict]]:
+        url = f"{self.base_url}/Catalogs/{catalog['id']}/Items"
+        page = 1
+        while True:
+            data = self.get_json(url, params={"PageSize": page_size, "Page": page})
+            items = data.get("Items", [])
+            if not items:
+                return
+            yield items
+            total = int(data.get("@total", 0) or 0)
+            if total and page * page_size >= total:
+                return
+            page += 1
+
+    def parse_item(self, item: Dict, catalog: Dict):
+        return self.scraper.parse_impact_product(item, platform_name=catalog["platform_name"])
+
+
+# Sources source_sync can build by name
+SOURCES = {
+    ImpactSource.name: ImpactSource,
+}
@@ -0,0 +1,233 @@
+"""
+Typeahead index for /products/suggest
+
+Brands, smart category terms and frequent title n-grams are kept in sorted
+arrays of accent-folded keys, so a prefix maps to one contiguous slice found by
+bisect. Counts are kept per key, which lets catalog writes be applied as deltas
+instead of re-reading the whole products table: only the keys a write touched
+are updated in place, new keys are merged into the sorted arrays, and keys that
+drop out are tombstoned until enough accumulate to compact.
+"""
+
+import heapq
+import threading
+from bisect import bisect_left, insort
+from collections import Counter
+
+from sqlalchemy.orm import Session
+
+from catalog_version import get_catalog_version
+from fuzzy_index import WORD_PATTERN
+from models.product import Product
+from search_logic import remove_accents, SMART_CATEGORY_TERMS
+
+LOAD_BATCH_SIZE = 10000
+# Title n-grams need at least this many products to be suggested
+MIN_TITLE_NGRAM_COUNT = 2
+MAX_TITLE_NGRAM_WORDS = 2
+# Results for prefixes this short are cached until the next catalog change
+CACHED_PREFIX_LENGTH = 2
+# New keys per delta inserted one by one; more are sorted and merged in one pass
+MAX_INSORT_KEYS = 32
+# Compact the arrays once this fraction of their entries are tombstones
+TOMBSTONE_COMPACT_FRACTION = 0.25
+
+
+def fold(text: str) -> str:
+    return " ".join(remove_accents((text or "").lower()).split())
+
+
+def title_ngrams(title: str) -> set:
+    """Distinct 1- and 2-word n-grams of a folded title"""
+    words = WORD_PATTERN.findall(fold(title))
+    ngrams = set()
+    for size in range(1, MAX_TITLE_NGRAM_WORDS + 1):
+        for start in range(len(words) - size + 1):
+            ngrams.add(" ".join(words[start:start + size]))
+    return ngrams
+
+
+class _SortedEntries:
+    """
+    (key, display text, weight) entries sorted by key for prefix range scans.
+    A removed entry stays in place with weight None (a tombstone) until compact().
+    """
+
+    def __init__(self, entries):
+        entries = sorted(entries)
+        self.keys = [entry[0] for entry in entries]
+        self.entries = entries
+        self.tombstones = 0
+
+    def _find(self, key: str):
+        position = bisect_left(self.keys, key)
+        if position < len(self.keys) and self.keys[position] == key:
+            return position
+        return None
+
+    def update(self, changes: dict):
+        """Apply {key: (text, weight)} changes; weight None removes the key"""
+        added = []
+        for key, (text, weight) in changes.items():
+            position = self._find(key)
+            if position is None:
+                if weight is not None:
+                    added.append((key, text, weight))
+                continue
+            if self.entries[position][2] is None:
+                self.tombstones -= 1
+            if weight is None:
+                self.tombstones += 1
+            self.entries[position] = (key, text, weight)
+
+        if len(added) <= MAX_INSORT_KEYS:
+            for entry in added:
+                position = bisect_left(self.keys, entry[0])
+                self.keys.insert(position, entry[0])
+                self.entries.insert(position, entry)
+        else:
+            self.entries = list(heapq.merge(self.entries, sorted(added)))
+            self.keys = [entry[0] for entry in self.entries]
+
+        if self.tombstones > len(self.entries) * TOMBSTONE_COMPACT_FRACTION:
+            self.compact()
+
+    def compact(self):
+        self.entries = [entry for entry in self.entries if entry[2] is not None]
+        self.keys = [entry[0] for entry in self.entries]
+        self.tombstones = 0
+
+    def top(self, prefix: str, limit: int) -> list:
+        low = bisect_left(self.keys, prefix)
+        high = bisect_left(self.keys, prefix + "\uffff", low)
+        live = (entry for entry in self.entries[low:high] if entry[2] is not None)
+        best = heapq.nlargest(limit, live, key=lambda entry: entry[2])
+        return [{"text": text, "count": weight} for _, text, weight in best]
+
+
+class SuggestIndex:
+    """Prefix completions over brands, categories and title n-grams, weighted by product counts"""
+
+    def __init__(self):
+        self.version = None
+        self.brand_counts = Counter()
+        self.brand_display = {}
+        self.ngram_counts = Counter()
+        self._brands = self._categories = self._titles = _SortedEntries([])
+        self._cache = {}
+        self._lock = threading.RLock()
+
+    # --- maintenance ---------------------------------------------------------
+
+    def _count(self, brand, title, delta: int, touched_brands=None, touched_ngrams=None):
+        if brand:
+            key = fold(brand)
+            self.brand_counts[key] += delta
+            self.brand_display.setdefault(key, brand)
+            if touched_brands is not None:
+                touched_brands.add(key)
+        ngrams = title_ngrams(title)
+        for ngram in ngrams:
+            self.ngram_counts[ngram] += delta
+        if touched_ngrams is not None:
+            touched_ngrams.update(ngrams)
+
+    def _title_entry(self, ngram: str) -> tuple:
+        """Titles entry for an n-gram: (text, weight), weight None when it isn't suggested"""
+        count = self.ngram_counts.get(ngram, 0)
+        if count < MIN_TITLE_NGRAM_COUNT or self.brand_counts.get(ngram, 0) > 0:
+            return ngram, None
+        return ngram, count
+
+    def _update_arrays(self, touched_brands: set, touched_ngrams: set):
+        """Bring the sorted arrays up to date for the keys a delta touched"""
+        brand_changes = {}
+        for key in touched_brands:
+            count = self.brand_counts.get(key, 0)
+            if count <= 0:
+                self.brand_counts.pop(key, None)
+                display = self.brand_display.pop(key, key)
+                brand_changes[key] = (display, None)
+            elif key:
+                brand_changes[key] = (self.brand_display.get(key, key), count)
+        for ngram in touched_ngrams:
+            if self.ngram_counts.get(ngram, 0) <= 0:
+                self.ngram_counts.pop(ngram, None)
+
+        self._brands.update(brand_changes)
+        self._categories.update({
+            term: (term, self.ngram_counts.get(term, 0)) for term in touched_ngrams if term in SMART_CATEGORY_TERMS
+        })
+        # A brand appearing or disappearing hides or reveals the same n-gram among titles
+        self._titles.update({ngram: self._title_entry(ngram) for ngram in touched_ngrams | set(brand_changes)})
+        self._cache = {}
+
+    def _rebuild_arrays(self):
+        self.brand_counts = +self.brand_counts
+        self.ngram_counts = +self.ngram_counts
+        brands = {key: count for key, count in self.brand_counts.items() if key}
+
+        self._brands = _SortedEntries(
+            (key, self.brand_display.get(key, key), count) for key, count in brands.items()
+        )
+        self._categories = _SortedEntries(
+            (term, term, self.ngram_counts.get(term, 0)) for term in set(SMART_CATEGORY_TERMS)
+        )
+        self._titles = _SortedEntries(
+            (ngram, ngram, count) for ngram, count in self.ngram_counts.items()
+            if count >= MIN_TITLE_NGRAM_COUNT and ngram not in brands
+        )
+        self._cache = {}
+
+    def rebuild(self, db: Session, version: int):
+        """Full rebuild from the brand and title columns"""
+        with self._lock:
+            self.brand_counts, self.brand_display, self.ngram_counts = Counter(), {}, Counter()
+            query = db.query(Product.brand, Product.title).yield_per(LOAD_BATCH_SIZE)
+            for brand, title in query:
+                self._count(brand, title, 1)
+            self._rebuild_arrays()
+            self.version = version
+
+    def ensure_current(self, db: Session):
+        version = get_catalog_version(db)
+        if self.version != version:
+            with self._lock:
+                if self.version != version:
+                    self.rebuild(db, version)
+
+    def apply_change(self, new_version: int, added=(), removed=()):
+        """
+        Apply one committed catalog write as a delta. added/removed are (brand, title)
+        pairs. If the index missed an earlier write it is left stale for a full rebuild.
+        """
+        with self._lock:
+            if self.version is None or self.version != new_version - 1:
+                return
+            touched_brands, touched_ngrams = set(), set()
+            for brand, title in added:
+                self._count(brand, title, 1, touched_brands, touched_ngrams)
+            for brand, title in removed:
+                self._count(brand, title, -1, touched_brands, touched_ngrams)
+            self._update_arrays(touched_brands, touched_ngrams)
+            self.version = new_version
+
+    # --- lookup ----------------------------------------------------------------
+
+    def suggest(self, prefix: str, limit: int = 10) -> dict:
+        key = fold(prefix)
+        cache_key = (key, limit)
+        if len(key) <= CACHED_PREFIX_LENGTH and cache_key in self._cache:
+            return self._cache[cache_key]
+
+        result = {
+            "brands": self._brands.top(key, limit),
+            "categories": self._categories.top(key, limit),
+            "titles": self._titles.top(key, limit),
+        }
+        if len(key) <= CACHED_PREFIX_LENGTH:
+            self._cache[cache_key] = result
+        return result
+
+
+suggest_index = SuggestIndex()
@@ -0,0 +1,87 @@
+import os
+
+import pytest
+
+import catalog_snapshot
+from catalog_snapshot import FORMAT_VERSION, MAGIC, SharedSnapshotLoader, SnapshotError, load_snapshot, write_snapshot
+from catalog_store import CatalogReplica
+from catalog_version import get_catalog_instance
+from database import Base, SessionLocal, engine
+from ingest import insert_products
+from main import search_replica
+
+PRODUCTS = [
+    {"title": "Hermès Birkin Bag", "brand": "Hermès", "category": "handbags", "color": "Gold",
+     "description": "Togo leather", "price": 9500.0, "image_url": "https://img/1.jpg",
+     "platform_name": "TheRealReal", "product_url": "https://shop/1"},
+    {"title": "Chanel Platform Boot", "brand": "Chanel", "category": "shoes", "color": "Black",
+     "description": None, "price": 890.0, "image_url": None,
+     "platform_name": "Vestiaire", "product_url": "https://shop/2"},
+    {"title": "Gucci Silk Scarf", "brand": "Gucci", "category": "accessories", "color": "Red",
+     "description": "Horsebit print, ünworn", "price": None, "image_url": "https://img/3.jpg",
+     "platform_name": "Fashionphile", "product_url": None},
+    {"title": "Saint Laurent Leather Tote", "brand": "Saint Laurent", "category": "handbags", "color": "Beige",
+     "description": "Shopping tote", "price": 1200.0, "image_url": "https://img/4.jpg",
+     "platform_name": "TheRealReal", "product_url": "https://shop/4"},
+]
+
+SEARCHES = [
+    {}, {"q": "bag"}, {"q": "hermes"}, {"q": "platform boot"}, {"brand": "saint"},
+    {"category": "bags", "max_price": 5000}, {"sort_by": "price_desc"}, {"sort_by": "brand"},
+]
+
+
+@pytest.fixture(scope="module")
+def catalog():
+    # The scratch database (conftest.py) is shared by test modules: start from empty tables
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    insert_products(db, PRODUCTS)
+    db.commit()
+    yield db, CatalogReplica.load(db, 1), get_catalog_instance(db)
+    db.close()
+
+
+def test_round_trip_matches_the_built_replica(catalog, tmp_path):
+    _, replica, instance_id = catalog
+    path = str(tmp_path / "catalog.snap")
+    write_snapshot(replica, path, instance_id)
+    mapped = load_snapshot(path, instance_id)
+
+    assert mapped.version == replica.version
+    assert list(mapped.ids) == list(replica.ids)
+    rows = list(range(len(replica.ids)))
+    assert mapped.to_dicts(rows) == replica.to_dicts(rows)
+    for filters in SEARCHES:
+        expected, expected_count, _ = search_replica(replica, limit=None, fuzzy=False, **filters)
+        found, count, _ = search_replica(mapped, limit=None, fuzzy=False, **filters)
+        assert (found, count) == (expected, expected_count), filters
+
+
+def test_snapshot_of_another_database_is_rejected(catalog, tmp_path):
+    _, replica, instance_id = catalog
+    path = str(tmp_path / "catalog.snap")
+    write_snapshot(replica, path, instance_id)
+    with pytest.raises(SnapshotError):
+        load_snapshot(path, "0123456789abcdef")
+
+
+def test_other_format_version_is_rejected(catalog, tmp_path):
+    _, replica, instance_id = catalog
+    path = str(tmp_path / "catalog.snap")
+    write_snapshot(replica, path, instance_id)
+    with open(path, "r+b") as f:
+        f.write(catalog_snapshot._PREAMBLE.pack(MAGIC, FORMAT_VERSION + 1))
+    with pytest.raises(SnapshotError):
+        load_snapshot(path, instance_id)
+
+
+def test_loader_names_files_by_instance(catalog, tmp_path):
+    db, replica, instance_id = catalog
+    loader = SharedSnapshotLoader(str(tmp_path))
+    mapped = loader(db, 1)
+    assert os.listdir(tmp_path).count(f"catalog-{instance_id}-v1.snap") == 1
+    assert list(mapped.ids) == list(replica.ids)
+    assert loader.versions(instance_id) == [1]
+    assert loader.versions("0123456789abcdef") == []
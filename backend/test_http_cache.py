@@ -0,0 +1,68 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import http_cache
+from http_cache import ConditionalGetMiddleware
+
+
+class FixedVersion:
+    def peek(self):
+        return 7
+
+    def get(self):
+        return 7
+
+
+def make_client(monkeypatch):
+    monkeypatch.setattr(http_cache, "catalog_version_cache", FixedVersion())
+    app = FastAPI()
+
+    @app.get("/products/{product_id}")
+    def get_product(product_id: int):
+        if product_id == 1:
+            return {"id": 1, "title": "Bag"}
+        return {"error": f"Product with ID {product_id} not found."}
+
+    app.add_middleware(ConditionalGetMiddleware, routes=app.routes,
+                       policies={"/products/{product_id}": "public, max-age=300"})
+    return TestClient(app)
+
+
+def test_success_gets_validators(monkeypatch):
+    response = make_client(monkeypatch).get("/products/1")
+    assert response.status_code == 200
+    assert response.headers["etag"].startswith('"v7-')
+    assert response.headers["cache-control"] == "public, max-age=300"
+
+
+def test_error_body_is_not_cached(monkeypatch):
+    response = make_client(monkeypatch).get("/products/2")
+    assert response.status_code == 200
+    assert response.json() == {"error": "Product with ID 2 not found."}
+    assert "etag" not in response.headers
+    assert response.headers["cache-control"] == "no-store"
+
+
+def test_conditional_get_answers_304(monkeypatch):
+    client = make_client(monkeypatch)
+    etag = client.get("/products/1").headers["etag"]
+    response = client.get("/products/1", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+
+def test_time_relative_route_is_not_validated(monkeypatch):
+    monkeypatch.setattr(http_cache, "catalog_version_cache", FixedVersion())
+    app = FastAPI()
+
+    @app.get("/products/price-drops")
+    def get_price_drops():
+        return {"drops": []}
+
+    # Default policies: the drops window moves with the clock, not the catalog version
+    app.add_middleware(ConditionalGetMiddleware, routes=app.routes)
+    client = TestClient(app)
+    response = client.get("/products/price-drops")
+    assert "etag" not in response.headers
+    assert "cache-control" not in response.headers
+    etag = http_cache.catalog_etag(7, "/products/price-drops", b"")
+    assert client.get("/products/price-drops", headers={"If-None-Match": etag}).status_code == 200
@@ -0,0 +1,117 @@
+import pytest
+
+from catalog_store import CatalogReplica
+from database import Base, SessionLocal, engine
+from ingest import insert_products
+from main import SORT_KEYS, search_replica
+from near_duplicates import cluster_ids_for
+from product_fields import load_filter_rows
+from search_logic import filters_match, updated_search_logic
+
+BRANDS = ["Hermès", "Chanel", "Gucci", "Saint Laurent", "Bottega Veneta", "Prada"]
+ITEMS = [
+    ("Birkin Bag", "handbags"), ("Leather Tote", "handbags"), ("Platform Boot", "shoes"),
+    ("Ankle Boots", "shoes"), ("Platform Loafer", "shoes"), ("Silk Scarf", "accessories"),
+    ("Wool Coat", "clothing"), ("Mini Dress", "clothing"), ("Crossbody Clutch", "handbags"),
+    ("Espadrille Wedges", "shoes"),
+]
+COLORS = ["Black", "Beige", "Red", "Gold"]
+PLATFORMS = ["TheRealReal", "Vestiaire", "Fashionphile"]
+
+QUERIES = [
+    {},
+    {"q": "bag"},
+    {"q": "hermes"},
+    {"q": "platform boot"},
+    {"q": "gucci shoes"},
+    {"q": "leather tote"},
+    {"q": "silk gold"},
+    {"q": "nothingmatches"},
+    {"brand": "chanel"},
+    {"brand": "saint"},
+    {"category": "bags"},
+    {"category": "shoes", "max_price": 900},
+    {"q": "boots", "brand": "prada", "min_price": 300},
+    {"q": "dress", "category": "clothing", "min_price": 100, "max_price": 2000},
+    {"min_price": 500, "max_price": 1500},
+]
+
+
+def fixed_catalog() -> list:
+    """A deterministic small catalog; every fifth product is relisted on another platform"""
+    products = []
+    for index in range(60):
+        brand = BRANDS[index % len(BRANDS)]
+        title, category = ITEMS[index % len(ITEMS)]
+        color = COLORS[index % len(COLORS)]
+        price = float(150 + (index * 137) % 2400)
+        products.append({
+            "title": f"{brand} {title}", "brand": brand, "category": category, "color": color,
+            # Some descriptions name another house, so brand and full-text matching differ
+            "description": f"{color} {title.lower()} in excellent condition"
+                           + (f", styled like {BRANDS[(index + 1) % len(BRANDS)]}" if index % 4 == 0 else ""),
+            "price": price, "image_url": f"https://img/{index}.jpg",
+            "platform_name": PLATFORMS[index % len(PLATFORMS)], "product_url": f"https://shop/{index}",
+        })
+        if index % 5 == 0:
+            products.append({**products[-1], "platform_name": "Vestiaire", "product_url": f"https://relist/{index}"})
+    return products
+
+
+@pytest.fixture(scope="module")
+def catalog():
+    # The scratch database (conftest.py) is shared by test modules: start from empty tables
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    insert_products(db, fixed_catalog())
+    db.commit()
+    replica = CatalogReplica.load(db, 1)
+    rows = load_filter_rows(db, with_description=True)
+    yield db, replica, rows
+    db.close()
+
+
+def reference(rows, q=None, brand=None, category=None, min_price=None, max_price=None, sort_by="id"):
+    """Matching ids in sort_by order, by the per-product rules the planner compiles"""
+    matched = [
+        row for row in rows
+        if (not q or updated_search_logic(q, row))
+        and filters_match(row, brand=brand, category=category, min_price=min_price, max_price=max_price)
+    ]
+    key = SORT_KEYS.get(sort_by, lambda row: row.id)
+    return [row.id for row in sorted(matched, key=key)]
+
+
+@pytest.mark.parametrize("filters", QUERIES)
+@pytest.mark.parametrize("sort_by", ["id", "price_asc", "price_desc", "brand"])
+def test_plan_matches_reference(catalog, filters, sort_by):
+    db, replica, rows = catalog
+    expected = reference(rows, sort_by=sort_by, **filters)
+    found, matched, _ = search_replica(replica, sort_by=sort_by, limit=None, fuzzy=False, **filters)
+    assert matched == len(expected)
+    assert [replica.ids[row] for row in found] == expected
+
+
+@pytest.mark.parametrize("filters", QUERIES)
+def test_collapse_keeps_best_of_each_cluster(catalog, filters):
+    db, replica, rows = catalog
+    expected_order = reference(rows, sort_by="price_asc", **filters)
+    clusters = cluster_ids_for(db, expected_order)
+    seen, expected = set(), []
+    for product_id in expected_order:
+        cluster = clusters.get(product_id, product_id)
+        if cluster not in seen:
+            seen.add(cluster)
+            expected.append(product_id)
+
+    found, _, _ = search_replica(
+        replica, sort_by="price_asc", limit=10, fuzzy=False, collapse=True, db=db, **filters
+    )
+    assert [replica.ids[row] for row in found] == expected[:10]
+
+
+def test_relisted_products_are_collapsed(catalog):
+    db, replica, _ = catalog
+    found, matched, _ = search_replica(replica, limit=None, fuzzy=False, collapse=True, db=db)
+    assert len(found) < matched